@@ -0,0 +1,313 @@
+import asyncio
+import os
+import struct
+import uuid
+from dataclasses import dataclass
+from typing import AsyncIterator, List, Optional, Tuple
+
+from app.base.shell_pool import ShellResult
+
+ADB_HOST = "127.0.0.1"
+ADB_PORT = 5037
+
+# Максимальный размер пакета DATA в sync-протоколе
+SYNC_DATA_MAX = 64 * 1024
+
+# Ответ STA2 после тега и кода ошибки: dev, ino, mode, nlink, uid, gid, size, atime, mtime, ctime
+STAT_V2_FORMAT = "<QQIIIIQqqq"
+
+
+class AdbError(Exception):
+    """Ошибка протокола или отказ (FAIL) локального adb-сервера"""
+
+
+@dataclass
+class SyncStat:
+    mode: int
+    size: int
+    mtime: int
+
+    @property
+    def exists(self) -> bool:
+        return self.mode != 0
+
+
+@dataclass
+class SyncEntry:
+    name: str
+    mode: int
+    size: int
+    mtime: int
+
+
+class AdbConnection:
+    """Одно TCP-соединение с adb-сервером (smart socket)"""
+
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.reader = reader
+        self.writer = writer
+
+    async def send(self, request: str):
+        payload = request.encode("utf-8")
+        self.writer.write(f"{len(payload):04x}".encode("ascii") + payload)
+        await self.writer.drain()
+        await self.check_okay()
+
+    async def check_okay(self):
+        status = await self.reader.readexactly(4)
+        if status == b"OKAY":
+            return
+        if status == b"FAIL":
+            raise AdbError(await self.read_string())
+        raise AdbError(f"Неожиданный ответ adb-сервера: {status!r}")
+
+    async def read_string(self) -> str:
+        length = int(await self.reader.readexactly(4), 16)
+        return (await self.reader.readexactly(length)).decode("utf-8", errors="replace")
+
+    async def read_all(self) -> bytes:
+        return await self.reader.read()
+
+    async def iter_chunks(self, chunk_size: int = SYNC_DATA_MAX) -> AsyncIterator[bytes]:
+        while True:
+            chunk = await self.reader.read(chunk_size)
+            if not chunk:
+                return
+            yield chunk
+
+    # --- sync: протокол ---
+
+    async def sync_request(self, command: bytes, path: str):
+        data = path.encode("utf-8")
+        self.writer.write(command + struct.pack("<I", len(data)) + data)
+        await self.writer.drain()
+
+    async def sync_header(self) -> Tuple[bytes, bytes]:
+        header = await self.reader.readexactly(8)
+        return header[:4], header[4:]
+
+    async def sync_fail(self, raw_length: bytes):
+        (length,) = struct.unpack("<I", raw_length)
+        message = await self.reader.readexactly(length)
+        raise AdbError(message.decode("utf-8", errors="replace"))
+
+    async def close(self):
+        self.writer.close()
+        try:
+            await self.writer.wait_closed()
+        except (ConnectionError, OSError):
+            pass
+
+
+class AdbClient:
+    """
+    Асинхронный клиент adb smart-socket протокола.
+
+    Работает напрямую с локальным adb-сервером (по умолчанию 127.0.0.1:5037)
+    без запуска бинарника adb: host:devices, host:track-devices, shell:,
+    exec: и sync: (STA2/LIST/RECV).
+    """
+
+    def __init__(self, host: str = ADB_HOST, port: int = ADB_PORT):
+        self.host = host
+        self.port = port
+
+    async def connect(self) -> AdbConnection:
+        reader, writer = await asyncio.open_connection(self.host, self.port)
+        return AdbConnection(reader, writer)
+
+    async def _transport(self, serial: Optional[str]) -> AdbConnection:
+        """Открывает соединение и переключает его на устройство"""
+        conn = await self.connect()
+        try:
+            await conn.send(f"host:transport:{serial}" if serial else "host:transport-any")
+        except BaseException:
+            await conn.close()
+            raise
+        return conn
+
+    # --- host-сервисы ---
+
+    @staticmethod
+    def parse_devices(data: str) -> List[Tuple[str, str]]:
+        devices = []
+        for line in data.splitlines():
+            if "\t" in line:
+                serial, state = line.split("\t", 1)
+                devices.append((serial.strip(), state.strip()))
+        return devices
+
+    async def devices(self) -> List[Tuple[str, str]]:
+        """Список (serial, state) подключенных устройств"""
+        conn = await self.connect()
+        try:
+            await conn.send("host:devices")
+            return self.parse_devices(await conn.read_string())
+        finally:
+            await conn.close()
+
+    async def track_devices(self) -> AsyncIterator[List[Tuple[str, str]]]:
+        """Бесконечный поток снимков списка устройств при каждом изменении"""
+        conn = await self.connect()
+        try:
+            await conn.send("host:track-devices")
+            while True:
+                yield self.parse_devices(await conn.read_string())
+        except asyncio.IncompleteReadError:
+            return
+        finally:
+            await conn.close()
+
+    # --- shell: / exec: ---
+
+    async def shell_stream(self, serial: Optional[str], command: str) -> AsyncIterator[bytes]:
+        conn = await self._transport(serial)
+        try:
+            await conn.send(f"shell:{command}")
+            async for chunk in conn.iter_chunks():
+                yield chunk
+        finally:
+            await conn.close()
+
+    async def shell(self, serial: Optional[str], command: str) -> str:
+        """Выполняет команду через shell: и возвращает вывод целиком"""
+        conn = await self._transport(serial)
+        try:
+            await conn.send(f"shell:{command}")
+            return (await conn.read_all()).decode("utf-8", errors="replace")
+        finally:
+            await conn.close()
+
+    async def shell_result(self, serial: Optional[str], command: str) -> ShellResult:
+        """
+        shell: v1 не передаёт код возврата и смешивает stderr с stdout,
+        поэтому stderr отбрасывается, а код возврата печатается после маркера
+        в конце вывода, так же как в ADBShellSession.
+        """
+        marker = f"__ADB_END_{uuid.uuid4().hex}__"
+        output = await self.shell(serial, f"( {command} ) </dev/null 2>/dev/null; printf '\\n%s %d\\n' {marker} $?")
+        stdout, _, tail = output.rpartition(marker)
+        if not _:
+            raise AdbError("Вывод shell-команды оборвался до маркера завершения")
+        if stdout.endswith("\n"):
+            stdout = stdout[:-1]
+        return ShellResult(stdout=stdout, returncode=int(tail.strip() or 0))
+
+    async def exec_stream(self, serial: Optional[str], command: str) -> AsyncIterator[bytes]:
+        """exec: отдаёт сырой бинарный stdout без pty и без преобразования \\n"""
+        conn = await self._transport(serial)
+        try:
+            await conn.send(f"exec:{command}")
+            async for chunk in conn.iter_chunks():
+                yield chunk
+        finally:
+            await conn.close()
+
+    async def exec_out(self, serial: Optional[str], command: str) -> bytes:
+        conn = await self._transport(serial)
+        try:
+            await conn.send(f"exec:{command}")
+            return await conn.read_all()
+        finally:
+            await conn.close()
+
+    # --- sync: ---
+
+    async def _sync(self, serial: Optional[str]) -> AdbConnection:
+        conn = await self._transport(serial)
+        try:
+            await conn.send("sync:")
+        except BaseException:
+            await conn.close()
+            raise
+        return conn
+
+    async def _sync_quit(self, conn: AdbConnection):
+        try:
+            conn.writer.write(b"QUIT" + struct.pack("<I", 0))
+            await conn.writer.drain()
+        except (ConnectionError, OSError):
+            pass
+        await conn.close()
+
+    async def stat(self, serial: Optional[str], path: str) -> SyncStat:
+        """
+        STA2: режим, размер и mtime файла (mode == 0, если файла нет).
+        STAT первой версии передаёт размер в 32 битах, и у файлов больше
+        4 ГБ он обрезается, поэтому используется только STA2 (Android 8+).
+        Устройство без его поддержки отвечает FAIL - это AdbError.
+        """
+        conn = await self._sync(serial)
+        try:
+            await conn.sync_request(b"STA2", path)
+            tag, raw_error = await conn.sync_header()
+            if tag == b"FAIL":
+                await conn.sync_fail(raw_error)
+            if tag != b"STA2":
+                raise AdbError(f"Неожиданный ответ на STA2: {tag!r}")
+            (error,) = struct.unpack("<I", raw_error)
+            _dev, _ino, mode, _nlink, _uid, _gid, size, _atime, mtime, _ctime = struct.unpack(
+                STAT_V2_FORMAT, await conn.reader.readexactly(struct.calcsize(STAT_V2_FORMAT))
+            )
+            if error:
+                return SyncStat(mode=0, size=0, mtime=0)
+            return SyncStat(mode=mode, size=size, mtime=mtime)
+        finally:
+            await self._sync_quit(conn)
+
+    async def list_dir(self, serial: Optional[str], path: str) -> List[SyncEntry]:
+        """LIST: содержимое директории одним запросом"""
+        conn = await self._sync(serial)
+        entries = []
+        try:
+            await conn.sync_request(b"LIST", path)
+            while True:
+                tag, raw_mode = await conn.sync_header()
+                if tag == b"FAIL":
+                    await conn.sync_fail(raw_mode)
+                if tag not in (b"DENT", b"DONE"):
+                    raise AdbError(f"Неожиданный ответ на LIST: {tag!r}")
+                rest = await conn.reader.readexactly(12)
+                if tag == b"DONE":
+                    break
+                mode, size, mtime, name_length = struct.unpack("<IIII", raw_mode + rest)
+                name = (await conn.reader.readexactly(name_length)).decode("utf-8", errors="replace")
+                if name not in (".", ".."):
+                    entries.append(SyncEntry(name=name, mode=mode, size=size, mtime=mtime))
+            return entries
+        finally:
+            await self._sync_quit(conn)
+
+    async def recv_stream(self, serial: Optional[str], path: str) -> AsyncIterator[bytes]:
+        """RECV: содержимое файла потоком блоков по 64 КБ"""
+        conn = await self._sync(serial)
+        try:
+            await conn.sync_request(b"RECV", path)
+            while True:
+                tag, raw_length = await conn.sync_header()
+                if tag == b"DATA":
+                    (length,) = struct.unpack("<I", raw_length)
+                    yield await conn.reader.readexactly(length)
+                elif tag == b"DONE":
+                    return
+                elif tag == b"FAIL":
+                    await conn.sync_fail(raw_length)
+                else:
+                    raise AdbError(f"Неожиданный ответ на RECV: {tag!r}")
+        finally:
+            await self._sync_quit(conn)
+
+    async def pull(self, serial: Optional[str], path: str, local_path: str) -> str:
+        """Скачивает файл через sync RECV без запуска `adb pull`"""
+        try:
+            with open(local_path, "wb") as f:
+                async for chunk in self.recv_stream(serial, path):
+                    f.write(chunk)
+        except BaseException:
+            if os.path.exists(local_path):
+                os.remove(local_path)
+            raise
+        return local_path
+
+
+adb_client = AdbClient()
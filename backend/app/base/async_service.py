@@ -0,0 +1,395 @@
+import asyncio
+import os
+import shlex
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+
+from fastapi import HTTPException
+
+from app.base.adb_client import AdbError, adb_client
+from app.base.prop_cache import prop_cache, parse_getprop
+from app.base.pull_cache import pull_cache
+from app.base.content_query import parse_content_output
+from app.base.media_store import MEDIA_THUMBNAILS, media_id_command, thumbnail_query_command
+from app.base.pdf_images import image_pool, is_image
+from app.base.thumbnails import render_thumbnail, thumbnail_cache
+from app.base.service import ADBService
+from app.base.shell_pool import ShellResult, shell_pool, split_batch_output
+
+# Сколько команд одновременно может выполняться на одном устройстве
+MAX_CONCURRENT_PER_DEVICE = 4
+
+# Сколько устройств опрашивается одновременно в запросах по всем устройствам
+MAX_CONCURRENT_DEVICES = 8
+
+# Отдельный пул для блокирующей работы (генерация PDF и т.п.), чтобы она
+# не занимала потоки Starlette, которые обслуживают обычные sync-эндпоинты
+blocking_executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix="blocking")
+
+
+async def run_blocking(func, *args, **kwargs):
+    """Выполняет блокирующую функцию в отдельном пуле потоков"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(blocking_executor, partial(func, *args, **kwargs))
+
+
+class AsyncADBService:
+    """
+    Асинхронные версии методов ADBService.
+
+    Команды идут через AdbClient (smart-socket к adb-серверу), а если сервер
+    недоступен - через asyncio.create_subprocess_exec("adb", ...). Разбор
+    вывода общий с ADBService. На каждое устройство одновременно выполняется
+    не более MAX_CONCURRENT_PER_DEVICE команд; блокирующие методы
+    ADBService (индекс, локальные копии SMS и звонков, сбор данных отчётов)
+    занимают тот же слот через run_on_device.
+    """
+
+    _semaphores: Dict[str, asyncio.Semaphore] = {}
+
+    @classmethod
+    def _semaphore(cls, serial: Optional[str]) -> asyncio.Semaphore:
+        key = serial or ""
+        if key not in cls._semaphores:
+            cls._semaphores[key] = asyncio.Semaphore(MAX_CONCURRENT_PER_DEVICE)
+        return cls._semaphores[key]
+
+    @classmethod
+    async def run_on_device(cls, serial: Optional[str], func, *args, **kwargs):
+        """Блокирующая функция в пуле потоков, пока занят слот устройства"""
+        async with cls._semaphore(serial):
+            return await run_blocking(func, *args, **kwargs)
+
+    @staticmethod
+    async def _adb_exec(*args: str) -> ShellResult:
+        process = await asyncio.create_subprocess_exec(
+            "adb", *args, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.DEVNULL
+        )
+        stdout, _ = await process.communicate()
+        return ShellResult(stdout=stdout.decode("utf-8", errors="replace"), returncode=process.returncode)
+
+    @classmethod
+    async def _shell(cls, command: str, serial: Optional[str] = None) -> ShellResult:
+        async with cls._semaphore(serial):
+            try:
+                return await adb_client.shell_result(serial, command)
+            except OSError:
+                # adb-сервер не запущен: CLI поднимет его сам
+                return await cls._adb_exec(*(["-s", serial] if serial else []), "shell", command)
+
+    @staticmethod
+    async def _split_lines(chunks: AsyncIterator[bytes]) -> AsyncIterator[str]:
+        buffer = b""
+        async for chunk in chunks:
+            buffer += chunk
+            *lines, buffer = buffer.split(b"\n")
+            for line in lines:
+                yield line.decode("utf-8", errors="replace").rstrip("\r")
+        if buffer:
+            yield buffer.decode("utf-8", errors="replace").rstrip("\r")
+
+    @staticmethod
+    async def _process_chunks(*args: str) -> AsyncIterator[bytes]:
+        process = await asyncio.create_subprocess_exec(
+            "adb", *args, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.DEVNULL
+        )
+        try:
+            while True:
+                chunk = await process.stdout.read(64 * 1024)
+                if not chunk:
+                    break
+                yield chunk
+        finally:
+            if process.returncode is None:
+                process.kill()
+            await process.wait()
+
+    @staticmethod
+    async def _read_locked(semaphore: asyncio.Semaphore, chunks: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+        """
+        Блоки `chunks`; слот устройства занят только на время чтения блока.
+        Между блоками поток ждёт потребителя (например, клиента NDJSON), и
+        если тот отключился, генератор закроется только при сборке мусора -
+        слот при этом уже свободен.
+        """
+        try:
+            while True:
+                async with semaphore:
+                    try:
+                        chunk = await chunks.__anext__()
+                    except StopAsyncIteration:
+                        return
+                yield chunk
+        finally:
+            await chunks.aclose()
+
+    @classmethod
+    async def _shell_lines(cls, command: str, serial: Optional[str] = None) -> AsyncIterator[str]:
+        """Построчный вывод команды по мере поступления с устройства"""
+        command = f"( {command} ) </dev/null 2>/dev/null"
+        semaphore = cls._semaphore(serial)
+        started = False
+        try:
+            async for line in cls._split_lines(cls._read_locked(semaphore, adb_client.shell_stream(serial, command))):
+                started = True
+                yield line
+            return
+        except OSError:
+            if started:
+                raise
+        # adb-сервер не запущен: CLI поднимет его сам
+        args = (["-s", serial] if serial else []) + ["shell", command]
+        async for line in cls._split_lines(cls._read_locked(semaphore, cls._process_chunks(*args))):
+            yield line
+
+    @staticmethod
+    async def list_devices() -> List[str]:
+        try:
+            serials = [serial for serial, state in await adb_client.devices() if state == "device"]
+        except OSError:
+            result = await AsyncADBService._adb_exec("devices")
+            lines = result.stdout.split("\n")[1:-1]
+            serials = [line.split("\t")[0] for line in lines if "device" in line]
+        # Снимки свойств и shell-сессии отключенных устройств больше не нужны
+        prop_cache.retain(serials)
+        shell_pool.retain(serials)
+        return serials
+
+    @staticmethod
+    async def get_properties(names, serial: Optional[str] = None) -> dict:
+        """Системные свойства из общего с ADBService снимка getprop"""
+        props = prop_cache.lookup(serial, names)
+        if props is None:
+            result = await AsyncADBService._shell("getprop", serial)
+            prop_cache.store(serial, parse_getprop(result.stdout))
+            props = prop_cache.lookup(serial, names)
+        return props
+
+    @staticmethod
+    async def for_each_device(func, serials: Optional[List[str]] = None) -> dict:
+        """
+        Параллельно выполняет корутину func(serial) для каждого устройства,
+        не более MAX_CONCURRENT_DEVICES одновременно. Время ответа
+        определяется самым медленным устройством, а не их суммой.
+        """
+        serials = serials or await AsyncADBService.list_devices()
+        limit = asyncio.Semaphore(MAX_CONCURRENT_DEVICES)
+
+        async def run(serial: str):
+            async with limit:
+                try:
+                    return await func(serial)
+                except Exception as e:
+                    # Ошибка одного устройства не должна ронять ответ по остальным
+                    return {"error": str(e)}
+
+        results = await asyncio.gather(*(run(serial) for serial in serials))
+        return dict(zip(serials, results))
+
+    @staticmethod
+    async def get_single_device_info(serial: str) -> dict:
+        props = await AsyncADBService.get_properties(ADBService.DEVICE_PROPERTIES.values(), serial)
+        info = {"serial_number": serial}
+        info.update({key: props[prop] for key, prop in ADBService.DEVICE_PROPERTIES.items()})
+        return info
+
+    @staticmethod
+    async def get_device_info(serial: Optional[str] = None):
+        """Получает информацию о подключенных ADB-устройствах"""
+        try:
+            serials = [serial] if serial else None
+            devices = await AsyncADBService.for_each_device(AsyncADBService.get_single_device_info, serials)
+            return {"device-info": list(devices.values())}
+        except Exception as e:
+            return {"error": str(e)}
+
+    @staticmethod
+    async def get_sms_count(serial: Optional[str] = None) -> int:
+        result = await AsyncADBService._shell("content query --uri content://sms --projection _id", serial)
+        return ADBService.count_content_rows(result.stdout)
+
+    @staticmethod
+    async def get_storage(serial: Optional[str] = None) -> dict:
+        return ADBService.parse_df((await AsyncADBService._shell("df /data", serial)).stdout)
+
+    @staticmethod
+    async def list_files(directory: str = "", serial: Optional[str] = None):
+        """Список файлов из локального индекса (обновление индекса - в пуле потоков)"""
+        return await AsyncADBService.run_on_device(serial, ADBService.list_files, directory, serial)
+
+    @staticmethod
+    async def iter_files(directory: str = "", serial: Optional[str] = None) -> AsyncIterator[dict]:
+        """Записи директории по мере поступления вывода find (см. ADBService.iter_files)"""
+        full_path = os.path.join(ADBService.base_path, directory.strip("/"))
+        command = ADBService.metadata_command(full_path, recursive=(directory == ""))
+        async for line in AsyncADBService._shell_lines(command, serial):
+            entry = ADBService.parse_metadata_line(line)
+            if entry is not None:
+                yield ADBService.file_record(entry, serial)
+
+    @staticmethod
+    async def list_files_page(directory: str = "", cursor: Optional[str] = None, limit: int = 100,
+                              serial: Optional[str] = None) -> dict:
+        return await AsyncADBService.run_on_device(serial, ADBService.list_files_page, directory, cursor, limit, serial)
+
+    @staticmethod
+    async def list_media(category: Optional[str] = None, limit: Optional[int] = None, serial: Optional[str] = None):
+        """Медиафайлы из MediaStore (см. ADBService.list_media)"""
+        return await AsyncADBService.run_on_device(serial, ADBService.list_media, category, limit, serial)
+
+    @staticmethod
+    async def file_stat(path: str, serial: Optional[str] = None) -> Tuple[int, int]:
+        """Размер и mtime файла на устройстве (404, если файла нет)"""
+        try:
+            async with AsyncADBService._semaphore(serial):
+                stat = await adb_client.stat(serial, path)
+        except (OSError, AdbError):
+            # Нет adb-сервера или устройство не знает STA2: 64-битный размер даст stat на устройстве
+            return await AsyncADBService.run_on_device(serial, ADBService.remote_stat, path, serial)
+        if not stat.exists:
+            raise HTTPException(status_code=404, detail=f"Файл не найден на устройстве: {path}")
+        return stat.size, stat.mtime
+
+    @staticmethod
+    async def download_file(path: str, serial: Optional[str] = None) -> str:
+        """Локальная копия файла из pull_cache; если её нет - скачивание через sync RECV"""
+        size, mtime = await AsyncADBService.file_stat(path, serial)
+        cached = pull_cache.lookup(serial, path, size, mtime)
+        if cached is not None:
+            return cached
+        local_path = pull_cache.entry_path(serial, path, size, mtime)
+        temp_path = pull_cache.temp_path(local_path)
+        try:
+            async with AsyncADBService._semaphore(serial):
+                await adb_client.pull(serial, path, temp_path)
+        except AdbError as e:
+            pull_cache.discard(temp_path)
+            raise HTTPException(status_code=500, detail=f"Ошибка при скачивании файла: {str(e)}")
+        except OSError:
+            pull_cache.discard(temp_path)
+            return await AsyncADBService.run_on_device(serial, ADBService.download_file, path, serial, size, mtime)
+        except BaseException:
+            pull_cache.discard(temp_path)
+            raise
+        return pull_cache.commit(temp_path, local_path)
+
+    @classmethod
+    async def stream_file(cls, path: str, serial: Optional[str] = None,
+                          start: int = 0, length: Optional[int] = None) -> AsyncIterator[bytes]:
+        """
+        Содержимое файла потоком с устройства, без копии на диске сервера.
+        Файл целиком читается через sync RECV, диапазон байт - командой,
+        которая читает файл со смещения на самом устройстве.
+        """
+        command = ADBService.range_command(path, start, length)
+        started = False
+        try:
+            chunks = adb_client.recv_stream(serial, path) if command is None else adb_client.exec_stream(serial, command)
+            async for chunk in chunks:
+                started = True
+                yield chunk
+            return
+        except OSError:
+            if started:
+                raise
+        # adb-сервер не запущен: CLI поднимет его сам
+        args = (["-s", serial] if serial else []) + ["exec-out", command or f"cat {shlex.quote(path)}"]
+        async for chunk in cls._process_chunks(*args):
+            yield chunk
+
+    @staticmethod
+    async def _read_file(path: str, serial: Optional[str] = None) -> bytes:
+        try:
+            return b"".join([chunk async for chunk in AsyncADBService.stream_file(path, serial)])
+        except AdbError:
+            return b""
+
+    @staticmethod
+    async def _mediastore_thumbnail(path: str, serial: Optional[str] = None) -> Optional[bytes]:
+        """Готовая миниатюра MediaStore для файла (None, если её нет)"""
+        category = ADBService.get_file_category(path)
+        if category not in MEDIA_THUMBNAILS:
+            return None
+        try:
+            result = await AsyncADBService._shell(media_id_command(category, path), serial)
+            ids = [row["_id"] for row in parse_content_output(result.stdout, ["_id"]) if (row.get("_id") or "").isdigit()]
+            if not ids:
+                return None
+            result = await AsyncADBService._shell(thumbnail_query_command(category, int(ids[0])), serial)
+        except AdbError:
+            return None
+        for row in parse_content_output(result.stdout, ["_data", "width"]):
+            if row.get("_data"):
+                data = await AsyncADBService._read_file(row["_data"], serial)
+                if data:
+                    return data
+        return None
+
+    @staticmethod
+    async def thumbnail_key(path: str, serial: Optional[str], size: int, fmt: str) -> str:
+        """Ключ превью (он же ETag): меняется вместе с размером и mtime файла"""
+        file_size, mtime = await AsyncADBService.file_stat(path, serial)
+        return thumbnail_cache.key(serial, path, file_size, mtime, size, fmt)
+
+    @staticmethod
+    async def get_thumbnail(path: str, serial: Optional[str], size: int, fmt: str, key: str) -> str:
+        """
+        Превью из кеша; если его нет - из миниатюры MediaStore, а если её нет,
+        уменьшением скачанного файла. Pillow работает в пуле процессов.
+        """
+        cached = thumbnail_cache.lookup(key, fmt)
+        if cached is not None:
+            return cached
+        target = thumbnail_cache.reserve(key, fmt)
+        loop = asyncio.get_running_loop()
+
+        source = await AsyncADBService._mediastore_thumbnail(path, serial)
+        if source is not None and await loop.run_in_executor(image_pool(), render_thumbnail, source, target, size, fmt):
+            return target
+        if not is_image(path):
+            raise HTTPException(status_code=415, detail="Для этого файла нет миниатюры MediaStore")
+        local_path = await AsyncADBService.download_file(path, serial)
+        if await loop.run_in_executor(image_pool(), render_thumbnail, local_path, target, size, fmt):
+            return target
+        raise HTTPException(status_code=415, detail="Не удалось построить превью")
+
+    @staticmethod
+    async def get_call_logs(serial: Optional[str] = None, number: Optional[str] = None, date_from: Optional[str] = None,
+                            date_to: Optional[str] = None, limit: Optional[int] = None):
+        """Звонки из локальной копии журнала (см. ADBService.stored_rows)"""
+        return await AsyncADBService.run_on_device(serial, ADBService.get_call_logs, serial, number, date_from, date_to, limit)
+
+    @staticmethod
+    async def get_sms_messages(serial: Optional[str] = None, contact: Optional[str] = None, date_from: Optional[str] = None,
+                               date_to: Optional[str] = None, limit: Optional[int] = None):
+        """SMS из локальной копии (см. ADBService.stored_rows)"""
+        return await AsyncADBService.run_on_device(serial, ADBService.get_sms_messages, serial, contact, date_from, date_to, limit)
+
+    @staticmethod
+    async def get_call_analytics(serial: Optional[str] = None, number: Optional[str] = None, date_from: Optional[str] = None,
+                                 date_to: Optional[str] = None, bins: Optional[List[int]] = None):
+        return await AsyncADBService.run_on_device(serial, ADBService.get_call_analytics, serial, number, date_from, date_to, bins)
+
+    @staticmethod
+    async def get_sms_records(serial: Optional[str] = None, contact: Optional[str] = None, date_from: Optional[str] = None,
+                              date_to: Optional[str] = None, limit: Optional[int] = None):
+        return await AsyncADBService.run_on_device(serial, ADBService.get_sms_records, serial, contact, date_from, date_to, limit)
+
+    @staticmethod
+    async def get_system_info(serial: Optional[str] = None, sections: Optional[List[str]] = None):
+        """Собирает выбранные разделы системной информации одним скриптом на устройстве"""
+        fields = ADBService.system_info_fields(sections)
+        try:
+            outputs = {}
+            batch = ADBService.system_info_batch(fields)
+            if batch:
+                script, token = batch
+                result = await AsyncADBService._shell(script, serial)
+                outputs = split_batch_output(result.stdout, token)
+
+            prop_names = [ADBService.SYSTEM_INFO_PROPERTIES[field] for field in fields if field in ADBService.SYSTEM_INFO_PROPERTIES]
+            props = await AsyncADBService.get_properties(prop_names, serial) if prop_names else {}
+            return ADBService.build_system_info(fields, outputs, props)
+        except Exception as e:
+            return {"error": str(e)}
@@ -0,0 +1,186 @@
+import threading
+from collections import OrderedDict
+from datetime import datetime
+from typing import Callable, Hashable, List, Optional, Sequence
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+import numpy as np
+
+from app.base.records import CallRecord, CallType
+
+# Границы интервалов длительности по умолчанию (секунды): 0-1, 1-5, 5-10 и 10+ минут
+DEFAULT_DURATION_BINS = (60, 300, 600)
+
+
+class CallColumns:
+    """Журнал звонков по колонкам: массивы NumPy вместо списка записей"""
+    __slots__ = ("date_ms", "duration", "type", "contact_index", "contacts", "names")
+
+    def __init__(self, records: Sequence[CallRecord]):
+        count = len(records)
+        self.date_ms = np.fromiter(
+            (record.date_ms if record.date_ms is not None else -1 for record in records), dtype=np.int64, count=count
+        )
+        self.duration = np.fromiter((record.duration for record in records), dtype=np.int64, count=count)
+        self.type = np.fromiter((record.type for record in records), dtype=np.int8, count=count)
+
+        numbers = np.array([record.number or "" for record in records], dtype=object)
+        if count:
+            self.contacts, self.contact_index = np.unique(numbers, return_inverse=True)
+        else:
+            self.contacts, self.contact_index = np.array([], dtype=object), np.array([], dtype=np.int64)
+        self.contact_index = self.contact_index.reshape(-1)
+
+        # Имя контакта - первое непустое из записей с этим номером
+        names = {}
+        for record in records:
+            number = record.number or ""
+            if record.name and number not in names:
+                names[number] = record.name
+        self.names = names
+
+
+# Переходы на летнее время и обратно приходятся на границы 15-минутных интервалов
+# UTC, поэтому внутри интервала смещение постоянно и считается один раз
+OFFSET_SLOT_SECONDS = 900
+
+
+def _zone(timezone: Optional[str]) -> Optional[ZoneInfo]:
+    try:
+        return ZoneInfo(timezone) if timezone else None
+    except (ZoneInfoNotFoundError, ValueError):
+        return None
+
+
+def _local_seconds(seconds: np.ndarray, timezone: Optional[str] = None) -> np.ndarray:
+    """
+    Секунды UTC в секунды местного времени часового пояса `timezone`
+    (по умолчанию - пояса сервера) со смещением на момент каждого звонка.
+    """
+    zone = _zone(timezone)
+    slots, inverse = np.unique(seconds // OFFSET_SLOT_SECONDS, return_inverse=True)
+    offsets = np.fromiter(
+        (
+            (datetime.fromtimestamp(int(slot) * OFFSET_SLOT_SECONDS, zone) if zone
+             else datetime.fromtimestamp(int(slot) * OFFSET_SLOT_SECONDS).astimezone()).utcoffset().total_seconds()
+            for slot in slots
+        ),
+        dtype=np.int64, count=len(slots),
+    )
+    return seconds + offsets[inverse.reshape(-1)]
+
+
+def compute_call_analytics(records: Sequence[CallRecord], bins: Sequence[int] = DEFAULT_DURATION_BINS,
+                           timezone: Optional[str] = None) -> dict:
+    """
+    Сводка по звонкам: итоги, статистика по контактам, гистограмма
+    длительностей с границами `bins` (секунды) и тепловая карта
+    день недели x час (0 - понедельник) в часовом поясе `timezone`
+    (имя IANA, например "Europe/Moscow"; по умолчанию - пояс сервера).
+    """
+    columns = CallColumns(records)
+    total = len(records)
+    missed = columns.duration == 0
+    incoming = columns.type == CallType.INCOMING
+    outgoing = columns.type == CallType.OUTGOING
+
+    # По контактам
+    contacts_count = len(columns.contacts)
+    index = columns.contact_index
+    calls = np.bincount(index, minlength=contacts_count)
+    missed_by = np.bincount(index, weights=missed, minlength=contacts_count).astype(np.int64)
+    incoming_by = np.bincount(index, weights=incoming, minlength=contacts_count).astype(np.int64)
+    outgoing_by = np.bincount(index, weights=outgoing, minlength=contacts_count).astype(np.int64)
+    duration_by = np.bincount(index, weights=columns.duration, minlength=contacts_count).astype(np.int64)
+    last_by = np.full(contacts_count, -1, dtype=np.int64)
+    np.maximum.at(last_by, index, columns.date_ms)
+
+    per_contact = []
+    for position in np.argsort(-calls, kind="stable"):
+        number = columns.contacts[position]
+        per_contact.append({
+            "number": number or None,
+            "name": columns.names.get(number),
+            "calls": int(calls[position]),
+            "incoming": int(incoming_by[position]),
+            "outgoing": int(outgoing_by[position]),
+            "missed": int(missed_by[position]),
+            "total_duration": int(duration_by[position]),
+            "average_duration": round(float(duration_by[position]) / int(calls[position]), 1),
+            "last_call_ms": int(last_by[position]) if last_by[position] >= 0 else None,
+        })
+
+    # Гистограмма длительностей: интервал i - (bins[i-1], bins[i]], последний - больше bins[-1]
+    edges = np.array(sorted(set(int(edge) for edge in bins)), dtype=np.int64)
+    buckets = np.bincount(np.searchsorted(edges, columns.duration, side="left"), minlength=len(edges) + 1)
+    lower = [0] + edges.tolist()
+    upper = edges.tolist() + [None]
+    histogram = [
+        {
+            "from": lower[position],
+            "to": upper[position],
+            "count": int(count),
+            "percent": round(100.0 * int(count) / total, 1) if total else 0.0,
+        }
+        for position, count in enumerate(buckets)
+    ]
+
+    # Тепловая карта по местному времени
+    dated = _local_seconds(columns.date_ms[columns.date_ms >= 0] // 1000, timezone)
+    hours = (dated % 86400) // 3600
+    # 1970-01-01 - четверг (3, если понедельник - 0)
+    weekdays = (dated // 86400 + 3) % 7
+    heatmap = np.bincount(weekdays * 24 + hours, minlength=7 * 24).reshape(7, 24)
+
+    return {
+        "totals": {
+            "calls": total,
+            "missed": int(missed.sum()),
+            "received": total - int(missed.sum()),
+            "incoming": int(incoming.sum()),
+            "outgoing": int(outgoing.sum()),
+            "total_duration": int(columns.duration.sum()),
+        },
+        "per_contact": per_contact,
+        "duration_histogram": histogram,
+        "heatmap": heatmap.tolist(),
+    }
+
+
+class CallAnalyticsCache:
+    """
+    Готовые сводки по ключу (устройство, фильтры, интервалы, часовой пояс,
+    версия данных).
+    Версия берётся из MessageStore и меняется при каждой синхронизации с
+    новыми строками, так что устаревшая сводка просто перестаёт находиться.
+    """
+
+    def __init__(self, size: int = 32):
+        self.size = size
+        self._lock = threading.Lock()
+        self._items: "OrderedDict[Hashable, dict]" = OrderedDict()
+
+    def get_or_compute(self, key: Hashable, compute: Callable[[], dict]) -> dict:
+        with self._lock:
+            if key in self._items:
+                self._items.move_to_end(key)
+                return self._items[key]
+        result = compute()
+        with self._lock:
+            self._items[key] = result
+            while len(self._items) > self.size:
+                self._items.popitem(last=False)
+        return result
+
+
+def parse_bins(value: Optional[str]) -> List[int]:
+    """Границы интервалов из строки "60,300,600" (ValueError при ошибке)"""
+    if not value:
+        return list(DEFAULT_DURATION_BINS)
+    bins = [int(item) for item in value.split(",") if item.strip()]
+    if not bins or any(edge <= 0 for edge in bins):
+        raise ValueError(value)
+    return bins
+
+
+call_analytics_cache = CallAnalyticsCache()
@@ -0,0 +1,143 @@
+import shlex
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence
+
+
+def content_query_command(uri: str, projection: Optional[Sequence[str]] = None,
+                          where: Optional[str] = None, sort: Optional[str] = None) -> str:
+    """
+    Команда `content query` с projection, where и sort: отбор колонок,
+    фильтрация и сортировка выполняются провайдером на устройстве.
+    """
+    parts = ["content query --uri", shlex.quote(uri)]
+    if projection:
+        parts += ["--projection", shlex.quote(":".join(projection))]
+    if where:
+        parts += ["--where", shlex.quote(where)]
+    if sort:
+        parts += ["--sort", shlex.quote(sort)]
+    return " ".join(parts)
+
+
+class ContentRowParser:
+    """
+    Разбор строк "Row: N a=1, b=x, y, c=NULL" для известного порядка
+    колонок: значение колонки заканчивается там, где начинается
+    ", <следующая>=", поэтому запятые и переводы строк внутри значений
+    (текст SMS, имена файлов) не ломают разбор. Если такой разделитель
+    встречается в строке ещё раз (текст SMS "..., date=..."), строка
+    разбирается с конца: настоящий разделитель - последний перед
+    следующей колонкой. Разделители строятся один раз на набор колонок,
+    а не на каждую строку.
+    """
+
+    def __init__(self, columns: Sequence[str]):
+        self.columns = list(columns)
+        self._prefixes = [f"{column}=" for column in self.columns]
+        self._separators = [f", {column}=" for column in self.columns]
+        # (колонка, разделитель перед следующей колонкой) для быстрого прохода
+        self._steps = list(zip(self.columns, self._separators[1:]))
+
+    def __call__(self, row: str) -> Dict[str, Optional[str]]:
+        if row.startswith("Row:"):
+            space = row.find(" ", 5)
+            row = row[space + 1:] if space != -1 else ""
+        if not self.columns or not row.startswith(self._prefixes[0]):
+            return self._parse_shifted(row)
+
+        # Обычный случай: все колонки на месте и в порядке projection
+        values: Dict[str, Optional[str]] = {}
+        position = len(self._prefixes[0])
+        for column, separator in self._steps:
+            end = row.find(separator, position)
+            if end == -1:
+                return self._parse_shifted(row)
+            if row.rfind(separator) != end:
+                # Разделитель есть и внутри какого-то значения
+                return self._parse_from_end(row)
+            value = row[position:end]
+            values[column] = None if value == "NULL" else value
+            position = end + len(separator)
+        value = row[position:]
+        values[self.columns[-1]] = None if value == "NULL" else value
+        return values
+
+    def _parse_from_end(self, row: str) -> Dict[str, Optional[str]]:
+        """
+        Все колонки на месте, но разделитель встречается и в значениях.
+        Значение может содержать разделители любых колонок, кроме своей.
+        """
+        values: Dict[str, Optional[str]] = {}
+        end = len(row)
+        for index in range(len(self.columns) - 1, 0, -1):
+            separator = self._separators[index]
+            start = row.rfind(separator, len(self._prefixes[0]), end)
+            if start == -1:
+                return self._parse_shifted(row)
+            value = row[start + len(separator):end]
+            values[self.columns[index]] = None if value == "NULL" else value
+            end = start
+        value = row[len(self._prefixes[0]):end]
+        values[self.columns[0]] = None if value == "NULL" else value
+        return {column: values[column] for column in self.columns}
+
+    def _parse_shifted(self, row: str) -> Dict[str, Optional[str]]:
+        """Медленный путь: часть колонок отсутствует в строке"""
+        values: Dict[str, Optional[str]] = {}
+        separators = self._separators
+        count = len(self.columns)
+        position = 0
+        for index in range(count):
+            column, prefix = self.columns[index], self._prefixes[index]
+            if not row.startswith(prefix, position):
+                # Колонки нет на ожидаемом месте: ищем её дальше по строке
+                start = row.find(separators[index], position)
+                if start == -1:
+                    values[column] = None
+                    continue
+                position = start + 2
+            position += len(prefix)
+
+            end = -1
+            for next_index in range(index + 1, count):
+                end = row.find(separators[next_index], position)
+                if end != -1:
+                    break
+            value = row[position:] if end == -1 else row[position:end]
+            values[column] = None if value == "NULL" else value
+            position = len(row) if end == -1 else end + 2
+        return values
+
+
+def parse_content_row(row: str, columns: Sequence[str]) -> Dict[str, Optional[str]]:
+    """Разбор одной строки `content query` (см. ContentRowParser)"""
+    return ContentRowParser(columns)(row)
+
+
+def iter_content_rows(lines: Iterable[str]) -> Iterator[str]:
+    """
+    Собирает строки вывода `content query` в записи: строки, которые не
+    начинаются с "Row:", - продолжение многострочного значения предыдущей записи.
+    """
+    current: Optional[List[str]] = None
+    for line in lines:
+        line = line.rstrip("\r")
+        if line.startswith("Row:"):
+            if current is not None:
+                yield "\n".join(current).rstrip("\n")
+            current = [line]
+        elif current is not None:
+            current.append(line)
+    if current is not None:
+        yield "\n".join(current).rstrip("\n")
+
+
+def iter_content_records(lines: Iterable[str], columns: Sequence[str]) -> Iterator[Dict[str, Optional[str]]]:
+    """Потоковый разбор вывода `content query`: записи отдаются по мере поступления строк"""
+    parser = ContentRowParser(columns)
+    for row in iter_content_rows(lines):
+        yield parser(row)
+
+
+def parse_content_output(output: str, columns: Sequence[str]) -> List[Dict[str, Optional[str]]]:
+    """Все записи вывода `content query` в виде словарей по колонкам projection"""
+    return list(iter_content_records(output.split("\n"), columns))
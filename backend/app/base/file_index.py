@@ -0,0 +1,305 @@
+import os
+import shlex
+import sqlite3
+import threading
+import time
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional
+
+from app.base.shell_pool import ADBShellError
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS directories (
+    serial TEXT NOT NULL,
+    path TEXT NOT NULL,
+    parent TEXT NOT NULL,
+    mtime INTEGER NOT NULL,
+    PRIMARY KEY (serial, path)
+);
+CREATE INDEX IF NOT EXISTS directories_parent ON directories (serial, parent);
+
+CREATE TABLE IF NOT EXISTS files (
+    serial TEXT NOT NULL,
+    path TEXT NOT NULL,
+    dir TEXT NOT NULL,
+    name TEXT NOT NULL,
+    ext TEXT NOT NULL,
+    category TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    mtime INTEGER NOT NULL,
+    modified TEXT NOT NULL,
+    mode TEXT NOT NULL,
+    PRIMARY KEY (serial, path)
+);
+CREATE INDEX IF NOT EXISTS files_dir ON files (serial, dir);
+CREATE INDEX IF NOT EXISTS files_category ON files (serial, category, modified);
+CREATE INDEX IF NOT EXISTS files_modified ON files (serial, modified);
+
+CREATE TABLE IF NOT EXISTS refreshes (
+    serial TEXT NOT NULL,
+    root TEXT NOT NULL,
+    refreshed_at REAL NOT NULL,
+    PRIMARY KEY (serial, root)
+);
+"""
+
+# Сколько директорий перечисляется одной командой find при обновлении
+DIRS_PER_COMMAND = 200
+
+
+class FileIndex:
+    """
+    Локальный индекс файлов устройства в SQLite.
+
+    Каждое обновление - один find по всему дереву, который печатает mtime
+    каждой директории (время растёт с числом директорий, файлы не
+    перечисляются). Заново перечисляются только директории, у которых
+    mtime изменился (файл добавлен, удалён или переименован). Перезапись
+    файла на месте mtime директории не меняет: такие изменения видны
+    после invalidate() (POST /devices/files-index/invalidate).
+    Запросы по категории, датам и директории выполняются по индексам SQLite
+    без обращения к устройству.
+    """
+
+    def __init__(self, db_path: str = os.path.join("output", "index", "files.sqlite3"), max_age: float = 30):
+        self.db_path = db_path
+        self.max_age = max_age
+        self._lock = threading.Lock()
+        self._refresh_locks: Dict[str, threading.Lock] = {}
+        self._conn: Optional[sqlite3.Connection] = None
+
+    def _connection(self) -> sqlite3.Connection:
+        if self._conn is None:
+            os.makedirs(os.path.dirname(self.db_path) or ".", exist_ok=True)
+            self._conn = sqlite3.connect(self.db_path, check_same_thread=False)
+            self._conn.row_factory = sqlite3.Row
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.executescript(SCHEMA)
+        return self._conn
+
+    @staticmethod
+    def _key(serial: Optional[str]) -> str:
+        return serial or ""
+
+    @staticmethod
+    def _normalize(path: str) -> str:
+        path = path.replace("//", "/")
+        return path.rstrip("/") or "/"
+
+    # --- обновление ---
+
+    def ensure_fresh(self, serial: Optional[str], root: str, shell):
+        """Обновляет индекс, если с прошлого обновления прошло больше max_age секунд"""
+        key, root = self._key(serial), self._normalize(root)
+        with self._lock:
+            refresh_lock = self._refresh_locks.setdefault(key, threading.Lock())
+        # Параллельные запросы к одному устройству ждут одно обновление, а не запускают свои
+        with refresh_lock:
+            with self._lock:
+                row = self._connection().execute(
+                    "SELECT refreshed_at FROM refreshes WHERE serial = ? AND root = ?", (key, root)
+                ).fetchone()
+            if row is None or time.time() - row["refreshed_at"] > self.max_age:
+                self.refresh(serial, root, shell)
+
+    def refresh(self, serial: Optional[str], root: str, shell) -> Dict[str, int]:
+        """
+        Инкрементально обновляет индекс под `root`. `shell(command)` выполняет
+        команду на устройстве и возвращает ShellResult. Если команда не
+        удалась (ненулевой код, устройство отвалилось, пустой вывод для
+        существующего корня), поднимается ADBShellError, а индекс и время
+        обновления остаются прежними.
+        """
+        from app.base.service import ADBService
+
+        key, root = self._key(serial), self._normalize(root)
+        device_dirs = self._list_directories(root, shell)
+
+        conn = self._connection()
+        with self._lock:
+            known = {
+                row["path"]: row["mtime"]
+                for row in conn.execute(
+                    "SELECT path, mtime FROM directories WHERE serial = ? AND (path = ? OR path LIKE ? ESCAPE '\\')",
+                    (key, root, self._like_prefix(root)),
+                )
+            }
+
+        changed = [path for path, mtime in device_dirs.items() if known.get(path) != mtime]
+        removed = [path for path in known if path not in device_dirs]
+
+        listings: List[dict] = []
+        for start in range(0, len(changed), DIRS_PER_COMMAND):
+            chunk = changed[start:start + DIRS_PER_COMMAND]
+            paths = " ".join(shlex.quote(path + "/") for path in chunk)
+            command = (f"find {paths} -mindepth 1 -maxdepth 1 -name '.*' -prune -o "
+                       f"-type f -exec stat -c '{ADBService.STAT_FORMAT}' {{}} +")
+            listings.extend(ADBService.parse_metadata_output(self._run(shell, command)))
+
+        with self._lock, conn:
+            for path in removed + changed:
+                conn.execute("DELETE FROM files WHERE serial = ? AND dir = ?", (key, path))
+            conn.executemany(
+                "DELETE FROM directories WHERE serial = ? AND path = ?", [(key, path) for path in removed]
+            )
+            conn.executemany(
+                "INSERT OR REPLACE INTO directories (serial, path, parent, mtime) VALUES (?, ?, ?, ?)",
+                [(key, path, self._parent(path), device_dirs[path]) for path in changed],
+            )
+            conn.executemany(
+                "INSERT OR REPLACE INTO files (serial, path, dir, name, ext, category, size, mtime, modified, mode) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                [self._file_row(key, entry) for entry in listings],
+            )
+            conn.execute(
+                "INSERT OR REPLACE INTO refreshes (serial, root, refreshed_at) VALUES (?, ?, ?)",
+                (key, root, time.time()),
+            )
+        return {"directories": len(device_dirs), "changed": len(changed), "removed": len(removed)}
+
+    def _list_directories(self, root: str, shell) -> Dict[str, int]:
+        """mtime всех директорий под root одной командой"""
+        command = f"find {shlex.quote(root + '/')} -name '.*' -prune -o -type d -exec stat -c '%Y|%n' {{}} +"
+        dirs = {}
+        for line in self._run(shell, command).split("\n"):
+            mtime, _, path = line.rstrip("\r").partition("|")
+            if mtime.isdigit() and path:
+                dirs[self._normalize(path)] = int(mtime)
+        if root not in dirs:
+            # find всегда печатает сам корень: без него вывод неполный, а не "всё удалено"
+            raise ADBShellError(f"find не вернул {root}")
+        return dirs
+
+    @staticmethod
+    def _run(shell, command: str) -> str:
+        """stdout команды; ненулевой код возврата - ADBShellError"""
+        result = shell(command)
+        if result.returncode != 0:
+            raise ADBShellError(f"Команда завершилась с кодом {result.returncode}: {result.stdout.strip()[:200]}")
+        return result.stdout
+
+    @staticmethod
+    def _parent(path: str) -> str:
+        return path.rsplit("/", 1)[0] or "/"
+
+    @staticmethod
+    def _like_prefix(path: str) -> str:
+        escaped = path.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+        return escaped.rstrip("/") + "/%"
+
+    @staticmethod
+    def _file_row(key: str, entry: dict) -> tuple:
+        from app.base.service import ADBService
+
+        path = FileIndex._normalize(entry["path"])
+        return (
+            key, path, FileIndex._parent(path), entry["name"],
+            os.path.splitext(entry["name"])[1].lower(), ADBService.get_file_category(path),
+            entry["size"], entry["mtime"], entry["modified"].strftime("%Y-%m-%d %H:%M:%S"), entry["mode"],
+        )
+
+    def invalidate(self, serial: Optional[str] = None):
+        """Удаляет индекс устройства (или всех устройств)"""
+        conn = self._connection()
+        with self._lock, conn:
+            for table in ("files", "directories", "refreshes"):
+                if serial is None:
+                    conn.execute(f"DELETE FROM {table}")
+                else:
+                    conn.execute(f"DELETE FROM {table} WHERE serial = ?", (self._key(serial),))
+
+    # --- запросы ---
+
+    @staticmethod
+    def _entry(row: sqlite3.Row) -> dict:
+        return {
+            "path": row["path"],
+            "name": row["name"],
+            "size": row["size"],
+            "mtime": row["mtime"],
+            "modified": datetime.strptime(row["modified"], "%Y-%m-%d %H:%M:%S"),
+            "mode": row["mode"],
+            "type": "file",
+            "category": row["category"],
+        }
+
+    def _query(self, sql: str, params: Iterable) -> List[sqlite3.Row]:
+        with self._lock:
+            return self._connection().execute(sql, tuple(params)).fetchall()
+
+    def list_directory(self, serial: Optional[str], directory: str, recursive: bool = False) -> Dict[str, List[dict]]:
+        """Файлы и поддиректории директории: {"files": [...], "directories": [...]}"""
+        key, directory = self._key(serial), self._normalize(directory)
+        if recursive:
+            files = self._query(
+                "SELECT * FROM files WHERE serial = ? AND (dir = ? OR dir LIKE ? ESCAPE '\\') ORDER BY dir, name",
+                (key, directory, self._like_prefix(directory)),
+            )
+            dirs = self._query(
+                "SELECT path FROM directories WHERE serial = ? AND path LIKE ? ESCAPE '\\' ORDER BY path",
+                (key, self._like_prefix(directory)),
+            )
+        else:
+            files = self._query("SELECT * FROM files WHERE serial = ? AND dir = ? ORDER BY name", (key, directory))
+            dirs = self._query(
+                "SELECT path FROM directories WHERE serial = ? AND parent = ? ORDER BY path", (key, directory)
+            )
+        return {"files": [self._entry(row) for row in files], "directories": [row["path"] for row in dirs]}
+
+    def page(self, serial: Optional[str], directory: str, recursive: bool = False,
+             after: Optional[str] = None, limit: int = 100) -> List[dict]:
+        """
+        Страница файлов директории по возрастанию пути, начиная после `after`
+        (keyset-пагинация по первичному ключу, без OFFSET).
+        """
+        key, directory = self._key(serial), self._normalize(directory)
+        if recursive:
+            where, params = ["serial = ?", "path LIKE ? ESCAPE '\\'"], [key, self._like_prefix(directory)]
+        else:
+            where, params = ["serial = ?", "dir = ?"], [key, directory]
+        if after is not None:
+            where.append("path > ?")
+            params.append(after)
+        params.append(limit)
+        rows = self._query(f"SELECT * FROM files WHERE {' AND '.join(where)} ORDER BY path LIMIT ?", params)
+        return [self._entry(row) for row in rows]
+
+    def query(self, serial: Optional[str], file_filter, directory: Optional[str] = None,
+              category: Optional[str] = None, limit: Optional[int] = None) -> List[dict]:
+        """Файлы по FileFilter (расширения, даты, размер, имя), новые первыми"""
+        where = ["serial = ?"]
+        params: list = [self._key(serial)]
+        if directory is not None:
+            where.append("dir = ?")
+            params.append(self._normalize(directory))
+        if category is not None:
+            where.append("category = ?")
+            params.append(category)
+        if file_filter.extensions is not None:
+            where.append(f"ext IN ({', '.join('?' * len(file_filter.extensions))})")
+            params.extend(file_filter.extensions)
+        if file_filter.after:
+            where.append("modified >= ?")
+            params.append(file_filter.after.strftime("%Y-%m-%d %H:%M:%S"))
+        if file_filter.before:
+            where.append("modified <= ?")
+            params.append(file_filter.before.strftime("%Y-%m-%d %H:%M:%S"))
+        if file_filter.min_size is not None:
+            where.append("size >= ?")
+            params.append(file_filter.min_size)
+        if file_filter.max_size is not None:
+            where.append("size <= ?")
+            params.append(file_filter.max_size)
+        if file_filter.name:
+            where.append("LOWER(name) LIKE ? ESCAPE '\\'")
+            escaped = file_filter.name.lower().replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+            params.append(f"%{escaped}%")
+
+        sql = f"SELECT * FROM files WHERE {' AND '.join(where)} ORDER BY modified DESC"
+        if limit is not None:
+            sql += " LIMIT ?"
+            params.append(limit)
+        return [self._entry(row) for row in self._query(sql, params)]
+
+
+file_index = FileIndex()
@@ -0,0 +1,131 @@
+import mimetypes
+from dataclasses import dataclass, asdict
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+from app.base.content_query import content_query_command, parse_content_output
+
+# MIME-типы, которые считаются документами (и в MediaStore, и в get_file_category)
+DOCUMENT_MIME_TYPES = [
+    "application/pdf",
+    "application/msword",
+    "application/vnd.openxmlformats-officedocument.wordprocessingml.document",
+    "application/vnd.ms-excel",
+    "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+    "text/plain",
+]
+
+
+@dataclass
+class MediaCollection:
+    """Коллекция MediaStore: URI, колонки и условие отбора"""
+    uri: str
+    projection: List[str]
+    where: Optional[str] = None
+
+
+MEDIA_COLUMNS = ["_id", "_data", "_display_name", "_size", "date_modified", "mime_type", "width", "height"]
+
+MEDIA_COLLECTIONS: Dict[str, MediaCollection] = {
+    "images": MediaCollection("content://media/external/images/media", MEDIA_COLUMNS),
+    "videos": MediaCollection("content://media/external/video/media", MEDIA_COLUMNS + ["duration"]),
+    "documents": MediaCollection(
+        "content://media/external/file",
+        MEDIA_COLUMNS,
+        where="mime_type IN ({})".format(", ".join(f"'{mime}'" for mime in DOCUMENT_MIME_TYPES)),
+    ),
+}
+
+MEDIA_SORT = "date_modified DESC"
+
+
+@dataclass
+class MediaRecord:
+    """Файл из MediaStore (или из индекса файлов, если провайдер недоступен)"""
+    id: Optional[int]
+    path: str
+    name: str
+    size: int
+    modified: datetime
+    mime_type: Optional[str]
+    category: str
+    width: Optional[int] = None
+    height: Optional[int] = None
+    duration_ms: Optional[int] = None
+
+    def to_dict(self) -> dict:
+        record = asdict(self)
+        record["modified"] = self.modified.strftime("%Y-%m-%d %H:%M:%S")
+        return record
+
+
+def _int(value: Optional[str]) -> Optional[int]:
+    return int(value) if value and value.lstrip("-").isdigit() else None
+
+
+def media_query_command(category: str) -> str:
+    collection = MEDIA_COLLECTIONS[category]
+    return content_query_command(collection.uri, collection.projection, collection.where, MEDIA_SORT)
+
+
+def parse_media_output(output: str, category: str) -> List[MediaRecord]:
+    """Записи MediaStore из вывода media_query_command"""
+    records = []
+    for row in parse_content_output(output, MEDIA_COLLECTIONS[category].projection):
+        path = row.get("_data")
+        if not path:
+            continue
+        records.append(MediaRecord(
+            id=_int(row.get("_id")),
+            path=path,
+            name=row.get("_display_name") or path.rsplit("/", 1)[-1],
+            size=_int(row.get("_size")) or 0,
+            modified=datetime.fromtimestamp(_int(row.get("date_modified")) or 0),
+            mime_type=row.get("mime_type"),
+            category=category,
+            width=_int(row.get("width")),
+            height=_int(row.get("height")),
+            duration_ms=_int(row.get("duration")),
+        ))
+    return records
+
+
+def record_from_index(entry: dict) -> MediaRecord:
+    """MediaRecord из записи FileIndex (без размеров и длительности)"""
+    mime_type, _ = mimetypes.guess_type(entry["path"])
+    return MediaRecord(
+        id=None,
+        path=entry["path"],
+        name=entry["name"],
+        size=entry["size"],
+        modified=entry["modified"],
+        mime_type=mime_type,
+        category=entry["category"],
+    )
+
+
+# Таблицы миниатюр MediaStore: URI и колонка со ссылкой на _id оригинала
+MEDIA_THUMBNAILS: Dict[str, Tuple[str, str]] = {
+    "images": ("content://media/external/images/thumbnails", "image_id"),
+    "videos": ("content://media/external/video/thumbnails", "video_id"),
+}
+
+# Под какими путями MediaStore может хранить файлы /sdcard/
+STORAGE_ROOTS = ["/sdcard/", "/storage/emulated/0/", "/storage/self/primary/"]
+
+
+def media_id_command(category: str, path: str) -> str:
+    """_id файла в коллекции MediaStore по его пути"""
+    relative = path
+    for root in STORAGE_ROOTS:
+        if path.startswith(root):
+            relative = path[len(root):]
+            break
+    candidates = [path] + [root + relative for root in STORAGE_ROOTS if root + relative != path]
+    where = "_data IN ({})".format(", ".join("'{}'".format(item.replace("'", "''")) for item in candidates))
+    return content_query_command(MEDIA_COLLECTIONS[category].uri, ["_id"], where)
+
+
+def thumbnail_query_command(category: str, media_id: int) -> str:
+    uri, id_column = MEDIA_THUMBNAILS[category]
+    return content_query_command(uri, ["_data", "width"], f"{id_column} = {int(media_id)}", "width DESC")
@@ -0,0 +1,280 @@
+import os
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, Optional
+
+from app.base.content_query import content_query_command, parse_content_output
+
+# Сколько _id перечисляется в одном --where _id IN (...) при сверке
+IDS_PER_QUERY = 500
+
+
+@dataclass
+class MessageSource:
+    """Таблица провайдера, которая зеркалируется в локальное хранилище"""
+    table: str
+    uri: str
+    columns: List[str]
+    # Колонки, по которым при сверке видно, что строка изменилась
+    reconcile_columns: List[str]
+    contact_column: str
+
+
+class MessageStore:
+    """
+    Локальная копия SMS и журнала звонков в SQLite.
+
+    Синхронизация инкрементальная: для каждого устройства хранится
+    наибольший `_id`, и с устройства запрашиваются только строки с
+    `_id > N`. Раз в `reconcile_interval` секунд сверяются `_id` и
+    изменяемые колонки всех строк: удалённые строки убираются, изменённые
+    перечитываются. Запросы эндпоинтов выполняются по локальной базе.
+    """
+
+    def __init__(self, db_path: str = os.path.join("output", "index", "messages.sqlite3"),
+                 max_age: float = 5, reconcile_interval: float = 600):
+        self.db_path = db_path
+        self.max_age = max_age
+        self.reconcile_interval = reconcile_interval
+        self.sources: Dict[str, MessageSource] = {}
+        self._lock = threading.Lock()
+        self._sync_locks: Dict[tuple, threading.Lock] = {}
+        # Версия данных устройства растёт при каждом изменении копии (ключ для кеша аналитики)
+        self._versions: Dict[tuple, int] = {}
+        self._conn: Optional[sqlite3.Connection] = None
+
+    def register(self, kind: str, source: MessageSource):
+        self.sources[kind] = source
+
+    def _connection(self) -> sqlite3.Connection:
+        if self._conn is None:
+            os.makedirs(os.path.dirname(self.db_path) or ".", exist_ok=True)
+            self._conn = sqlite3.connect(self.db_path, check_same_thread=False)
+            self._conn.row_factory = sqlite3.Row
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS sync_state (serial TEXT NOT NULL, kind TEXT NOT NULL, "
+                "max_id INTEGER NOT NULL, synced_at REAL NOT NULL, reconciled_at REAL NOT NULL, "
+                "version INTEGER NOT NULL DEFAULT 0, PRIMARY KEY (serial, kind))"
+            )
+            columns = {row["name"] for row in self._conn.execute("PRAGMA table_info(sync_state)")}
+            if "version" not in columns:
+                # База создана до появления колонки version
+                self._conn.execute("ALTER TABLE sync_state ADD COLUMN version INTEGER NOT NULL DEFAULT 0")
+        return self._conn
+
+    def _ensure_table(self, conn: sqlite3.Connection, source: MessageSource):
+        columns = ", ".join(f"{column} TEXT" for column in source.columns if column not in ("_id", "date"))
+        conn.execute(
+            f"CREATE TABLE IF NOT EXISTS {source.table} (serial TEXT NOT NULL, _id INTEGER NOT NULL, "
+            f"date INTEGER, {columns}, PRIMARY KEY (serial, _id))"
+        )
+        conn.execute(f"CREATE INDEX IF NOT EXISTS {source.table}_date ON {source.table} (serial, date)")
+
+    @staticmethod
+    def _key(serial: Optional[str]) -> str:
+        return serial or ""
+
+    @staticmethod
+    def _int(value: Optional[str]) -> Optional[int]:
+        return int(value) if value and value.lstrip("-").isdigit() else None
+
+    @staticmethod
+    def _text(value) -> Optional[str]:
+        return None if value is None else str(value)
+
+    # --- синхронизация ---
+
+    def ensure_synced(self, serial: Optional[str], kind: str, shell: Callable[[str], str]):
+        """Дочитывает новые строки, если с прошлой синхронизации прошло больше max_age секунд"""
+        key = self._key(serial)
+        with self._lock:
+            sync_lock = self._sync_locks.setdefault((key, kind), threading.Lock())
+        with sync_lock:
+            state = self._state(key, kind)
+            now = time.time()
+            if state is None or now - state["synced_at"] > self.max_age:
+                self.sync(serial, kind, shell)
+                if state is not None and now - state["reconciled_at"] > self.reconcile_interval:
+                    self.reconcile(serial, kind, shell)
+
+    def _state(self, key: str, kind: str) -> Optional[sqlite3.Row]:
+        with self._lock:
+            return self._connection().execute(
+                "SELECT * FROM sync_state WHERE serial = ? AND kind = ?", (key, kind)
+            ).fetchone()
+
+    def version(self, serial: Optional[str], kind: str) -> int:
+        with self._lock:
+            return self._versions.get((self._key(serial), kind), 0)
+
+    def _bump(self, key: str, kind: str):
+        self._versions[(key, kind)] = self._versions.get((key, kind), 0) + 1
+
+    def data_version(self, serial: Optional[str], kind: str) -> Optional[tuple]:
+        """
+        Версия копии, которая сохраняется между перезапусками: счётчик
+        изменений из sync_state, наибольший `_id` и число строк (они
+        различают данные до и после invalidate(), когда счётчик начинается
+        заново). None - устройство ещё не синхронизировалось.
+        """
+        key, source = self._key(serial), self.sources[kind]
+        conn = self._connection()
+        with self._lock:
+            self._ensure_table(conn, source)
+            state = conn.execute(
+                "SELECT version, max_id FROM sync_state WHERE serial = ? AND kind = ?", (key, kind)
+            ).fetchone()
+            if state is None:
+                return None
+            (rows,) = conn.execute(f"SELECT COUNT(*) FROM {source.table} WHERE serial = ?", (key,)).fetchone()
+        return state["version"], state["max_id"], rows
+
+    def has_data(self, serial: Optional[str], kind: str) -> bool:
+        return self._state(self._key(serial), kind) is not None
+
+    def sync(self, serial: Optional[str], kind: str, shell: Callable[[str], str]) -> int:
+        """
+        Забирает строки с `_id` больше сохранённого. `shell(command)`
+        выполняет команду на устройстве и возвращает её stdout.
+        """
+        source, key = self.sources[kind], self._key(serial)
+        state = self._state(key, kind)
+        max_id = state["max_id"] if state else 0
+        command = content_query_command(source.uri, source.columns, f"_id > {max_id}", "_id")
+        rows = parse_content_output(shell(command), source.columns)
+
+        conn = self._connection()
+        with self._lock, conn:
+            self._ensure_table(conn, source)
+            self._insert(conn, source, key, rows)
+            new_max = max([max_id] + [self._int(row.get("_id")) or 0 for row in rows])
+            conn.execute(
+                # Первая синхронизация читает таблицу целиком, так что сверка сразу после неё не нужна
+                "INSERT INTO sync_state (serial, kind, max_id, synced_at, reconciled_at, version) VALUES (?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT (serial, kind) DO UPDATE SET max_id = excluded.max_id, synced_at = excluded.synced_at, "
+                "version = sync_state.version + excluded.version",
+                (key, kind, new_max, time.time(), time.time(), 1 if rows else 0),
+            )
+            if rows:
+                self._bump(key, kind)
+        return len(rows)
+
+    def _insert(self, conn: sqlite3.Connection, source: MessageSource, key: str, rows: List[dict]):
+        columns = ["serial"] + source.columns
+        conn.executemany(
+            f"INSERT OR REPLACE INTO {source.table} ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})",
+            [
+                [key] + [
+                    self._int(row.get(column)) if column in ("_id", "date") else row.get(column)
+                    for column in source.columns
+                ]
+                for row in rows if self._int(row.get("_id")) is not None
+            ],
+        )
+
+    def reconcile(self, serial: Optional[str], kind: str, shell: Callable[[str], str]) -> Dict[str, int]:
+        """
+        Сверяет локальную копию с устройством по `_id` и изменяемым
+        колонкам: удалённые строки убираются, изменённые перечитываются.
+        """
+        source, key = self.sources[kind], self._key(serial)
+        command = content_query_command(source.uri, source.reconcile_columns, sort="_id")
+        device = {
+            self._int(row.get("_id")): row
+            for row in parse_content_output(shell(command), source.reconcile_columns)
+        }
+        device.pop(None, None)
+
+        conn = self._connection()
+        with self._lock:
+            self._ensure_table(conn, source)
+            local = {
+                row["_id"]: row
+                for row in conn.execute(
+                    f"SELECT {', '.join(source.reconcile_columns)} FROM {source.table} WHERE serial = ?", (key,)
+                )
+            }
+
+        removed = [row_id for row_id in local if row_id not in device]
+        changed = [
+            row_id for row_id, row in device.items()
+            if row_id in local and any(
+                self._text(local[row_id][column]) != self._text(row.get(column))
+                for column in source.reconcile_columns if column != "_id"
+            )
+        ]
+        refreshed = []
+        for start in range(0, len(changed), IDS_PER_QUERY):
+            ids = ", ".join(str(row_id) for row_id in changed[start:start + IDS_PER_QUERY])
+            command = content_query_command(source.uri, source.columns, f"_id IN ({ids})")
+            refreshed.extend(parse_content_output(shell(command), source.columns))
+
+        with self._lock, conn:
+            conn.executemany(
+                f"DELETE FROM {source.table} WHERE serial = ? AND _id = ?", [(key, row_id) for row_id in removed]
+            )
+            self._insert(conn, source, key, refreshed)
+            conn.execute(
+                "UPDATE sync_state SET reconciled_at = ?, version = version + ? WHERE serial = ? AND kind = ?",
+                (time.time(), 1 if removed or changed else 0, key, kind),
+            )
+            if removed or changed:
+                self._bump(key, kind)
+        return {"removed": len(removed), "changed": len(changed)}
+
+    def invalidate(self, serial: Optional[str] = None):
+        """Удаляет локальную копию устройства (или всех устройств)"""
+        conn = self._connection()
+        with self._lock, conn:
+            for source in self.sources.values():
+                self._ensure_table(conn, source)
+                if serial is None:
+                    conn.execute(f"DELETE FROM {source.table}")
+                else:
+                    conn.execute(f"DELETE FROM {source.table} WHERE serial = ?", (self._key(serial),))
+            for version_key in list(self._versions):
+                if serial is None or version_key[0] == self._key(serial):
+                    self._bump(*version_key)
+            if serial is None:
+                conn.execute("DELETE FROM sync_state")
+            else:
+                conn.execute("DELETE FROM sync_state WHERE serial = ?", (self._key(serial),))
+
+    # --- запросы ---
+
+    def query(self, serial: Optional[str], kind: str, contact: Optional[str] = None,
+              date_from: Optional[str] = None, date_to: Optional[str] = None,
+              limit: Optional[int] = None) -> List[Dict[str, Optional[str]]]:
+        """
+        Строки из локальной копии, новые первыми. Значения - строки, как в
+        выводе `content query`, чтобы разбор был общим с запросом к устройству.
+        """
+        source = self.sources[kind]
+        where, params = ["serial = ?"], [self._key(serial)]
+        if contact:
+            escaped = contact.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+            where.append(f"{source.contact_column} LIKE ? ESCAPE '\\'")
+            params.append(f"%{escaped}%")
+        if date_from:
+            where.append("date >= ?")
+            params.append(int(datetime.strptime(date_from, "%Y-%m-%d").timestamp() * 1000))
+        if date_to:
+            where.append("date < ?")
+            params.append(int((datetime.strptime(date_to, "%Y-%m-%d") + timedelta(days=1)).timestamp() * 1000))
+        sql = f"SELECT {', '.join(source.columns)} FROM {source.table} WHERE {' AND '.join(where)} ORDER BY date DESC"
+        if limit is not None:
+            sql += " LIMIT ?"
+            params.append(limit)
+
+        conn = self._connection()
+        with self._lock:
+            self._ensure_table(conn, source)
+            rows = conn.execute(sql, params).fetchall()
+        return [{column: self._text(row[column]) for column in source.columns} for row in rows]
+
+
+message_store = MessageStore()
@@ -0,0 +1,92 @@
+import importlib
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+from fpdf import FPDF
+from fpdf.ttfonts import TTFontFile
+
+# Шрифты отчётов: семейство, начертание, файл (относительно папки backend)
+REPORT_FONTS: List[Tuple[str, str, str]] = [
+    ("DejaVu", "", "fonts/DejaVuSans.ttf"),
+    ("DejaVu", "B", "fonts/DejaVuSans-Bold.ttf"),
+    ("DejaVu", "I", "fonts/DejaVuSans-Oblique.ttf"),
+    ("DejaVu", "BI", "fonts/DejaVuSans-BoldOblique.ttf"),
+]
+
+
+class SubsetCachingTTFontFile(TTFontFile):
+    """
+    TTFontFile, который запоминает готовые подмножества шрифта.
+
+    При сохранении PDF fpdf заново разбирает TTF и строит подмножество
+    для каждого зарегистрированного начертания, даже если оно в документе
+    не использовалось. Подмножество зависит только от файла и набора
+    символов, поэтому одинаковые наборы (неиспользованные начертания,
+    типовые отчёты) берутся из памяти.
+    """
+
+    size = 64
+    _lock = threading.Lock()
+    _subsets: "OrderedDict[tuple, tuple]" = OrderedDict()
+
+    def makeSubset(self, file, subset):
+        key = (file, tuple(subset))
+        with self._lock:
+            cached = self._subsets.get(key)
+            if cached is not None:
+                self._subsets.move_to_end(key)
+        if cached is not None:
+            stream, self.codeToGlyph, self.maxUni = cached
+            return stream
+        stream = super().makeSubset(file, subset)
+        with self._lock:
+            self._subsets[key] = (stream, self.codeToGlyph, self.maxUni)
+            while len(self._subsets) > self.size:
+                self._subsets.popitem(last=False)
+        return stream
+
+
+# fpdf создаёт TTFontFile по имени из своего модуля
+importlib.import_module("fpdf.fpdf").TTFontFile = SubsetCachingTTFontFile
+
+
+class FontCache:
+    """
+    Метрики шрифтов отчётов, разобранные один раз на процесс.
+
+    add_font(..., uni=True) на каждый документ заново читает метрики всех
+    начертаний. Здесь они загружаются один раз на процесс (процессы пула
+    отчётов вызывают load() при старте в report_jobs._init_worker), а
+    install() копирует их в новый документ. Зависит от внутренних полей
+    fpdf 1.7.2 (fonts, font_files), поэтому версия fpdf закреплена. Список
+    'subset' у каждого документа свой: fpdf дописывает в него
+    использованные символы и изменяет его при сохранении.
+    """
+
+    def __init__(self, fonts: List[Tuple[str, str, str]] = REPORT_FONTS):
+        self.fonts = fonts
+        self._lock = threading.Lock()
+        self._loaded: Optional[Tuple[Dict[str, dict], Dict[str, dict]]] = None
+
+    def load(self) -> Tuple[Dict[str, dict], Dict[str, dict]]:
+        with self._lock:
+            if self._loaded is None:
+                template = FPDF()
+                for family, style, path in self.fonts:
+                    template.add_font(family, style, path, uni=True)
+                self._loaded = (template.fonts, template.font_files)
+            return self._loaded
+
+    def install(self, pdf: FPDF):
+        fonts, font_files = self.load()
+        # Те же начальные символы, что добавляет add_font
+        first = list(range(0, 57)) if hasattr(pdf, "str_alias_nb_pages") else list(range(0, 32))
+        for fontkey, font in fonts.items():
+            if fontkey not in pdf.fonts:
+                pdf.fonts[fontkey] = dict(font, i=len(pdf.fonts) + 1, subset=list(first))
+        for key, entry in font_files.items():
+            pdf.font_files.setdefault(key, dict(entry))
+
+
+font_cache = FontCache()
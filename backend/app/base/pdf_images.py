@@ -0,0 +1,150 @@
+import hashlib
+import multiprocessing
+import os
+import threading
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+from PIL import Image, ImageOps
+
+MM_PER_INCH = 25.4
+
+# Форматы, которые уменьшаются перед вставкой в PDF
+IMAGE_EXTENSIONS = {".jpg", ".jpeg", ".png", ".bmp", ".gif", ".webp"}
+
+# Процессов в пуле обработки изображений
+IMAGE_WORKERS = min(4, os.cpu_count() or 1)
+
+
+_pool_lock = threading.Lock()
+_executor: Optional[ProcessPoolExecutor] = None
+
+
+def is_image(path: str) -> bool:
+    return os.path.splitext(path)[1].lower() in IMAGE_EXTENSIONS
+
+
+def image_pool() -> ProcessPoolExecutor:
+    """
+    Общий пул процессов для обработки изображений (отчёты и превью).
+    Процессы запускаются через spawn: fork многопоточного сервера может
+    унаследовать чужую захваченную блокировку.
+    """
+    global _executor
+    with _pool_lock:
+        if _executor is None:
+            _executor = ProcessPoolExecutor(
+                max_workers=IMAGE_WORKERS, mp_context=multiprocessing.get_context("spawn")
+            )
+        return _executor
+
+
+def shutdown_image_pool():
+    global _executor
+    with _pool_lock:
+        if _executor is not None:
+            _executor.shutdown(wait=False, cancel_futures=True)
+            _executor = None
+
+
+def _render(source: str, target: str, width_px: int, quality: int) -> bool:
+    """
+    Уменьшает изображение до ширины `width_px` и сохраняет его JPEG-ом в
+    `target`. Выполняется в процессе пула; False - Pillow не смог открыть
+    файл или уменьшать нечего, тогда в PDF идёт оригинал.
+    """
+    temp = f"{target}.{uuid.uuid4().hex}.part"
+    try:
+        with Image.open(source) as image:
+            if image.width <= width_px and image.format == "JPEG":
+                return False
+            # Большие JPEG декодируются сразу в уменьшенном масштабе
+            image.draft("RGB", (width_px, width_px * image.height // max(image.width, 1)))
+            image = ImageOps.exif_transpose(image)
+            if image.mode in ("RGBA", "LA", "P"):
+                image = image.convert("RGBA")
+                background = Image.new("RGB", image.size, (255, 255, 255))
+                background.paste(image, mask=image.split()[-1])
+                image = background
+            elif image.mode != "RGB":
+                image = image.convert("RGB")
+            if image.width > width_px:
+                image.thumbnail((width_px, image.height * width_px // image.width), Image.LANCZOS)
+            image.save(temp, "JPEG", quality=quality, optimize=True)
+        os.replace(temp, target)
+        return True
+    except (OSError, ValueError, Image.DecompressionBombError):
+        if os.path.exists(temp):
+            os.remove(temp)
+        return False
+
+
+class PdfImageCache:
+    """
+    Изображения для PDF-отчётов, уменьшенные до размера на странице.
+
+    Вместо 12-50 МП оригинала fpdf получает JPEG шириной `width_mm` при
+    `dpi` точек на дюйм. Результаты хранятся на диске под хешем
+    содержимого исходного файла и параметров, поэтому пересборка отчёта и
+    одинаковые фото с разных устройств не пересчитываются. Уменьшение
+    выполняется в пуле процессов.
+    """
+
+    def __init__(self, root: str = os.path.join("output", "cache", "pdf_images"), dpi: int = 150, quality: int = 80):
+        self.root = root
+        self.dpi = dpi
+        self.quality = quality
+        self._lock = threading.Lock()
+        # (путь, размер, mtime) -> sha256 содержимого, чтобы не хешировать файл повторно
+        self._hashes: Dict[Tuple[str, int, int], str] = {}
+
+    def content_hash(self, path: str) -> str:
+        stat = os.stat(path)
+        key = (path, stat.st_size, stat.st_mtime_ns)
+        with self._lock:
+            cached = self._hashes.get(key)
+        if cached is not None:
+            return cached
+        digest = hashlib.sha256()
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(1024 * 1024), b""):
+                digest.update(block)
+        with self._lock:
+            self._hashes[key] = digest.hexdigest()
+        return digest.hexdigest()
+
+    def width_px(self, width_mm: float) -> int:
+        return max(1, round(width_mm / MM_PER_INCH * self.dpi))
+
+    def target_path(self, path: str, width_mm: float) -> str:
+        content_hash = self.content_hash(path)
+        return os.path.join(self.root, content_hash[:2], f"{content_hash}_{self.width_px(width_mm)}_{self.quality}.jpg")
+
+    def prepare(self, path: str, width_mm: float) -> str:
+        """Путь к уменьшенной копии (или к оригиналу, если уменьшать нечего)"""
+        return self.prepare_many([path], width_mm)[path]
+
+    def prepare_many(self, paths: List[str], width_mm: float) -> Dict[str, str]:
+        """Уменьшенные копии нескольких файлов, недостающие считаются параллельно"""
+        prepared, jobs = {}, {}
+        for path in dict.fromkeys(paths):
+            if not is_image(path):
+                prepared[path] = path
+                continue
+            try:
+                target = self.target_path(path, width_mm)
+            except OSError:
+                prepared[path] = path
+                continue
+            if os.path.exists(target):
+                prepared[path] = target
+                continue
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            jobs[path] = (target, image_pool().submit(_render, path, target, self.width_px(width_mm), self.quality))
+        for path, (target, future) in jobs.items():
+            prepared[path] = target if future.result() else path
+        return prepared
+
+
+pdf_image_cache = PdfImageCache()
@@ -0,0 +1,41 @@
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Deque, Iterable, Iterator, Optional, Tuple, TypeVar
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+
+def prefetch(items: Iterable[T], fetch: Callable[[T], R],
+             workers: int) -> Iterator[Tuple[T, Optional[R], Optional[Exception]]]:
+    """
+    Выполняет `fetch` для элементов с опережением: пока потребитель
+    обрабатывает один результат, следующие `workers` уже скачиваются.
+    Результаты отдаются в исходном порядке как (элемент, результат, ошибка);
+    ошибка одного элемента не прерывает остальные.
+    """
+    workers = max(1, workers)
+    items = iter(items)
+    pending: Deque[Tuple[T, Future]] = deque()
+    executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="prefetch")
+
+    def submit_next():
+        for item in items:
+            pending.append((item, executor.submit(fetch, item)))
+            return
+
+    try:
+        for _ in range(workers):
+            submit_next()
+        while pending:
+            item, future = pending.popleft()
+            submit_next()
+            try:
+                result = future.result()
+            except Exception as e:
+                yield item, None, e
+            else:
+                yield item, result, None
+    finally:
+        # Потребитель остановился раньше: то, что ещё не начато, отменяется
+        executor.shutdown(wait=False, cancel_futures=True)
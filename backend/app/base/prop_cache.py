@@ -0,0 +1,83 @@
+import re
+import threading
+import time
+from typing import Dict, Iterable, Optional
+
+GETPROP_LINE = re.compile(r"^\[(?P<key>[^\]]+)\]: \[(?P<value>.*)\]$")
+
+
+def parse_getprop(output: str) -> Dict[str, str]:
+    """Разбирает полный вывод `getprop` ("[key]: [value]") в словарь"""
+    props = {}
+    for line in output.splitlines():
+        match = GETPROP_LINE.match(line.strip())
+        if match:
+            props[match.group("key")] = match.group("value")
+    return props
+
+
+class PropertyCache:
+    """
+    Снимки `getprop` по устройствам.
+
+    Свойства сборки (ro.*) не меняются, пока устройство подключено, поэтому
+    берутся из снимка без ограничения по времени. Остальные (оператор,
+    состояние сети и т.п.) считаются свежими `ttl` секунд. Снимок устройства
+    сбрасывается явно через invalidate() или при его отключении (retain()).
+    """
+
+    IMMUTABLE_PREFIX = "ro."
+
+    def __init__(self, ttl: float = 60):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._snapshots: Dict[str, Dict[str, str]] = {}
+        self._fetched_at: Dict[str, float] = {}
+
+    @staticmethod
+    def _key(serial: Optional[str]) -> str:
+        return serial or ""
+
+    def lookup(self, serial: Optional[str], names: Iterable[str]) -> Optional[Dict[str, str]]:
+        """
+        Значения свойств из снимка или None, если снимка нет или хотя бы
+        одно изменяемое свойство устарело и нужен новый `getprop`.
+        """
+        key = self._key(serial)
+        with self._lock:
+            snapshot = self._snapshots.get(key)
+            if snapshot is None:
+                return None
+            fresh = time.monotonic() - self._fetched_at[key] < self.ttl
+            names = list(names)
+            if not fresh and not all(name.startswith(self.IMMUTABLE_PREFIX) for name in names):
+                return None
+            return {name: snapshot.get(name, "") for name in names}
+
+    def store(self, serial: Optional[str], props: Dict[str, str]):
+        key = self._key(serial)
+        with self._lock:
+            self._snapshots[key] = props
+            self._fetched_at[key] = time.monotonic()
+
+    def invalidate(self, serial: Optional[str] = None):
+        """Сбрасывает снимок устройства (или всех устройств, если serial не указан)"""
+        with self._lock:
+            if serial is None:
+                self._snapshots.clear()
+                self._fetched_at.clear()
+            else:
+                self._snapshots.pop(self._key(serial), None)
+                self._fetched_at.pop(self._key(serial), None)
+
+    def retain(self, serials: Iterable[str]):
+        """Оставляет снимки только подключенных устройств"""
+        connected = set(serials)
+        with self._lock:
+            for key in list(self._snapshots):
+                if key and key not in connected:
+                    del self._snapshots[key]
+                    del self._fetched_at[key]
+
+
+prop_cache = PropertyCache()
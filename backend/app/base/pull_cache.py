@@ -0,0 +1,183 @@
+import hashlib
+import os
+import shutil
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import BinaryIO, Callable, Dict, Optional
+
+# Суффикс недокачанных файлов: они не попадают в кеш при сканировании
+PARTIAL_SUFFIX = ".part"
+
+# Через сколько секунд недокачанный файл считается брошенным и удаляется при сканировании
+PARTIAL_MAX_AGE = 3600
+
+
+class PullCache:
+    """
+    Локальные копии файлов, скачанных с устройства.
+
+    Ключ записи - (серийный номер, путь, размер, mtime): пока файл на
+    устройстве не изменился, повторное скачивание и пересборка отчёта берут
+    локальную копию вместо передачи по USB. Копия лежит в
+    `<root>/<sha256 ключа>/<имя файла>`, поэтому одноимённые файлы из разных
+    папок не перезаписывают друг друга, а имя и расширение сохраняются.
+    Общий размер ограничен `max_bytes`: сверх него удаляются записи, к
+    которым дольше всего не обращались (время обращения - mtime копии).
+    Список записей и учёт размера живут в памяти процесса, поэтому кешем
+    пользуется только процесс сервера (процессы пула отчётов получают
+    готовые локальные пути).
+    """
+
+    def __init__(self, root: str = os.path.join("output", "cache", "files"), max_bytes: int = 2 * 1024 ** 3):
+        self.root = root
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._pull_locks: Dict[str, threading.Lock] = {}
+        # Путь копии -> размер, от давно не использованных к недавним
+        self._entries: Optional["OrderedDict[str, int]"] = None
+        self._total = 0
+
+    @staticmethod
+    def key(serial: Optional[str], path: str, size: int, mtime: int) -> str:
+        return hashlib.sha256(f"{serial or ''}\0{path}\0{size}\0{mtime}".encode("utf-8")).hexdigest()
+
+    def entry_path(self, serial: Optional[str], path: str, size: int, mtime: int) -> str:
+        """Где лежит (или будет лежать) копия этой версии файла"""
+        name = path.rstrip("/").rsplit("/", 1)[-1] or "file"
+        return os.path.join(self.root, self.key(serial, path, size, mtime), name)
+
+    def _load(self) -> "OrderedDict[str, int]":
+        """Восстанавливает список записей по содержимому папки (вызывается под _lock)"""
+        if self._entries is None:
+            found = []
+            if os.path.isdir(self.root):
+                for entry_dir in os.scandir(self.root):
+                    if not entry_dir.is_dir():
+                        continue
+                    for item in os.scandir(entry_dir.path):
+                        if not item.is_file():
+                            continue
+                        stat = item.stat()
+                        if item.name.endswith(PARTIAL_SUFFIX):
+                            # Свежий .part может ещё дописываться
+                            if time.time() - stat.st_mtime > PARTIAL_MAX_AGE:
+                                os.remove(item.path)
+                            continue
+                        found.append((stat.st_mtime, item.path, stat.st_size))
+            found.sort()
+            self._entries = OrderedDict((path, size) for _, path, size in found)
+            self._total = sum(self._entries.values())
+        return self._entries
+
+    def lookup(self, serial: Optional[str], path: str, size: int, mtime: int) -> Optional[str]:
+        """Путь копии или None, если этой версии файла в кеше нет"""
+        local_path = self.entry_path(serial, path, size, mtime)
+        with self._lock:
+            entries = self._load()
+            if local_path not in entries:
+                return None
+            if not os.path.exists(local_path):
+                self._total -= entries.pop(local_path)
+                return None
+            entries.move_to_end(local_path)
+        try:
+            os.utime(local_path)
+        except OSError:
+            pass
+        return local_path
+
+    def temp_path(self, local_path: str) -> str:
+        """Временный файл для скачивания рядом с будущей копией"""
+        os.makedirs(os.path.dirname(local_path), exist_ok=True)
+        return f"{local_path}.{uuid.uuid4().hex}{PARTIAL_SUFFIX}"
+
+    def commit(self, temp_path: str, local_path: str) -> str:
+        """Атомарно переносит скачанный файл на место копии и освобождает место"""
+        os.replace(temp_path, local_path)
+        size = os.path.getsize(local_path)
+        with self._lock:
+            entries = self._load()
+            self._total -= entries.pop(local_path, 0)
+            entries[local_path] = size
+            self._total += size
+            self._evict(keep=local_path)
+        return local_path
+
+    def discard(self, temp_path: str):
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+
+    def _evict(self, keep: str):
+        entries = self._entries
+        while self._total > self.max_bytes and len(entries) > 1:
+            local_path = next(iter(entries))
+            if local_path == keep:
+                entries.move_to_end(local_path)
+                continue
+            self._total -= entries.pop(local_path)
+            try:
+                os.remove(local_path)
+                os.rmdir(os.path.dirname(local_path))
+            except OSError:
+                pass
+
+    def get_or_pull(self, serial: Optional[str], path: str, size: int, mtime: int,
+                    pull: Callable[[str], None]) -> str:
+        """
+        Копия файла из кеша; если её нет, `pull(temp_path)` скачивает файл во
+        временный путь. Одновременные запросы одной версии файла ждут одно
+        скачивание.
+        """
+        local_path = self.lookup(serial, path, size, mtime)
+        if local_path is not None:
+            return local_path
+        local_path = self.entry_path(serial, path, size, mtime)
+        with self._lock:
+            pull_lock = self._pull_locks.setdefault(local_path, threading.Lock())
+        with pull_lock:
+            cached = self.lookup(serial, path, size, mtime)
+            if cached is not None:
+                return cached
+            temp_path = self.temp_path(local_path)
+            try:
+                pull(temp_path)
+                return self.commit(temp_path, local_path)
+            except BaseException:
+                self.discard(temp_path)
+                raise
+            finally:
+                with self._lock:
+                    self._pull_locks.pop(local_path, None)
+
+    def store(self, serial: Optional[str], path: str, size: int, mtime: int, source: BinaryIO) -> str:
+        """Кладёт в кеш файл, читаемый из потока (например, из члена tar-архива)"""
+        cached = self.lookup(serial, path, size, mtime)
+        if cached is not None:
+            return cached
+        local_path = self.entry_path(serial, path, size, mtime)
+        temp_path = self.temp_path(local_path)
+        try:
+            with open(temp_path, "wb") as f:
+                shutil.copyfileobj(source, f, 1024 * 1024)
+            return self.commit(temp_path, local_path)
+        except BaseException:
+            self.discard(temp_path)
+            raise
+
+    def clear(self):
+        """Удаляет все копии"""
+        with self._lock:
+            entries = self._load()
+            for local_path in list(entries):
+                try:
+                    os.remove(local_path)
+                    os.rmdir(os.path.dirname(local_path))
+                except OSError:
+                    pass
+            entries.clear()
+            self._total = 0
+
+
+pull_cache = PullCache()
@@ -0,0 +1,210 @@
+from dataclasses import dataclass
+from datetime import datetime
+from enum import IntEnum
+from typing import Dict, Optional
+
+UNKNOWN = "Неизвестно"
+
+
+class CallType(IntEnum):
+    """CallLog.Calls.TYPE"""
+    INCOMING = 1
+    OUTGOING = 2
+    MISSED = 3
+    VOICEMAIL = 4
+    REJECTED = 5
+    BLOCKED = 6
+    ANSWERED_EXTERNALLY = 7
+
+
+class BlockReason(IntEnum):
+    """CallLog.Calls.BLOCK_REASON"""
+    NOT_BLOCKED = 0
+    BLOCKED_BY_USER = 1
+    SPAM_FILTER = 2
+    SYSTEM = 3
+
+
+class SmsType(IntEnum):
+    """Telephony.TextBasedSmsColumns.TYPE"""
+    INBOX = 1
+    SENT = 2
+
+
+# Подписи для ответа API и отчётов: локализация только на выходе
+CALL_TYPE_LABELS: Dict[int, str] = {
+    CallType.INCOMING: "Входящий",
+    CallType.OUTGOING: "Исходящий",
+    CallType.MISSED: "Пропущенный",
+    CallType.VOICEMAIL: "Голосовая почта",
+    CallType.REJECTED: "Отклонённый",
+    CallType.BLOCKED: "Заблокированный",
+    CallType.ANSWERED_EXTERNALLY: "Внешне отвеченный",
+}
+
+BLOCK_REASON_LABELS: Dict[int, str] = {
+    BlockReason.NOT_BLOCKED: "Нет блокировки",
+    BlockReason.BLOCKED_BY_USER: "Заблокирован пользователем",
+    BlockReason.SPAM_FILTER: "Фильтрация спама",
+    BlockReason.SYSTEM: "Системная блокировка",
+}
+
+SMS_TYPE_LABELS: Dict[int, str] = {
+    SmsType.INBOX: "Входящее",
+    SmsType.SENT: "Исходящее",
+}
+
+DATE_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+
+def _int(value: Optional[str], default: Optional[int] = None) -> Optional[int]:
+    return int(value) if value and value.lstrip("-").isdigit() else default
+
+
+def _format_date(date_ms: Optional[int]) -> str:
+    return datetime.fromtimestamp(date_ms / 1000).strftime(DATE_FORMAT) if date_ms is not None else UNKNOWN
+
+
+def _parse_date(value: Optional[str]) -> Optional[int]:
+    try:
+        return int(datetime.strptime(value, DATE_FORMAT).timestamp() * 1000) if value else None
+    except ValueError:
+        return None
+
+
+def _known(value) -> Optional[str]:
+    return None if value in (None, UNKNOWN) else str(value)
+
+
+def _label_value(labels: Dict[int, str], label: Optional[str], default: int) -> int:
+    for value, text in labels.items():
+        if text == label:
+            return int(value)
+    return _int(label, default)
+
+
+@dataclass
+class CallRecord:
+    """Строка журнала звонков: числа и коды вместо строк для отображения"""
+    __slots__ = ("id", "number", "name", "duration", "location", "type", "date_ms", "new",
+                 "subscription_id", "block_reason", "account")
+
+    id: Optional[int]
+    number: Optional[str]
+    name: Optional[str]
+    duration: int
+    location: Optional[str]
+    type: int
+    date_ms: Optional[int]
+    new: bool
+    subscription_id: Optional[str]
+    block_reason: int
+    account: Optional[str]
+
+    @classmethod
+    def from_row(cls, row: Dict[str, Optional[str]]) -> "CallRecord":
+        """Из строки `content query` (колонки ADBService.CALL_LOG_COLUMNS)"""
+        return cls(
+            id=_int(row.get("_id")),
+            number=row.get("number"),
+            name=row.get("name"),
+            duration=_int(row.get("duration"), 0),
+            location=row.get("geocoded_location"),
+            type=_int(row.get("type"), 0),
+            date_ms=_int(row.get("date")),
+            new=row.get("new") == "1",
+            subscription_id=row.get("subscription_id"),
+            block_reason=_int(row.get("block_reason"), BlockReason.NOT_BLOCKED),
+            account=row.get("subscription_component_name"),
+        )
+
+    @classmethod
+    def from_display(cls, call: dict) -> "CallRecord":
+        """Обратно из словаря to_display() (например, JSON, присланный клиентом)"""
+        duration = str(call.get("Длительность", "0")).split()
+        return cls(
+            id=_int(str(call.get("ID звонка", ""))),
+            number=_known(call.get("Номер")),
+            name=_known(call.get("Контакт")),
+            duration=_int(duration[0] if duration else None, 0),
+            location=_known(call.get("Страна")),
+            type=_label_value(CALL_TYPE_LABELS, call.get("Тип вызова"), 0),
+            date_ms=_parse_date(call.get("Дата")),
+            new=call.get("Новый вызов") == "Да",
+            subscription_id=_known(call.get("SIM-карта (ID)")),
+            block_reason=_label_value(BLOCK_REASON_LABELS, call.get("Причина блокировки"), BlockReason.NOT_BLOCKED),
+            account=_known(call.get("Учётная запись телефона")),
+        )
+
+    @property
+    def missed(self) -> bool:
+        # Как и раньше, пропущенным считается звонок с нулевой длительностью
+        return self.duration == 0
+
+    @property
+    def type_label(self) -> str:
+        return CALL_TYPE_LABELS.get(self.type, str(self.type) if self.type else "Неизвестный")
+
+    @property
+    def date_text(self) -> str:
+        return _format_date(self.date_ms)
+
+    def to_display(self) -> dict:
+        return {
+            "ID звонка": str(self.id) if self.id is not None else UNKNOWN,
+            "Номер": self.number or UNKNOWN,
+            "Контакт": self.name or UNKNOWN,
+            "Длительность": f"{self.duration} сек",
+            "Страна": self.location or UNKNOWN,
+            "Тип вызова": self.type_label,
+            "Дата": self.date_text,
+            "Новый вызов": "Да" if self.new else "Нет",
+            "Пропущенный": "Да" if self.missed else "Нет",
+            "SIM-карта (ID)": self.subscription_id or UNKNOWN,
+            "Причина блокировки": BLOCK_REASON_LABELS.get(self.block_reason, UNKNOWN),
+            "Учётная запись телефона": self.account or UNKNOWN,
+        }
+
+
+@dataclass
+class SmsRecord:
+    """SMS-сообщение: дата в миллисекундах и код типа"""
+    __slots__ = ("id", "address", "body", "date_ms", "type")
+
+    id: Optional[int]
+    address: Optional[str]
+    body: Optional[str]
+    date_ms: Optional[int]
+    type: int
+
+    @classmethod
+    def from_row(cls, row: Dict[str, Optional[str]]) -> "SmsRecord":
+        """Из строки `content query` (колонки ADBService.SMS_COLUMNS)"""
+        return cls(
+            id=_int(row.get("_id")),
+            address=row.get("address"),
+            body=row.get("body"),
+            date_ms=_int(row.get("date")),
+            type=_int(row.get("type"), SmsType.INBOX),
+        )
+
+    @property
+    def incoming(self) -> bool:
+        return self.type == SmsType.INBOX
+
+    @property
+    def type_label(self) -> str:
+        return SMS_TYPE_LABELS.get(self.type, UNKNOWN)
+
+    @property
+    def date_text(self) -> str:
+        return _format_date(self.date_ms)
+
+    def to_display(self) -> dict:
+        return {
+            "ID": str(self.id) if self.id is not None else UNKNOWN,
+            "Номер": self.address or UNKNOWN,
+            "Текст": self.body if self.body is not None else UNKNOWN,
+            "Дата": self.date_text,
+            "Тип": self.type_label,
+        }
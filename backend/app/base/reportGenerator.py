@@ -1,11 +1,17 @@
 import os
 import re
-from urllib.parse import unquote
+import time
+import uuid
 from fpdf import FPDF
 from fastapi import HTTPException
 from datetime import datetime
 from app.base.service import ADBService
-from typing import List, Optional
+from app.base.records import CallRecord, SmsRecord
+from app.base.call_analytics import compute_call_analytics
+from app.base.pdf_fonts import font_cache
+from app.base.pdf_images import pdf_image_cache
+from app.base.prefetch import prefetch
+from typing import Dict, List, Optional, Tuple
 
 class ReportGenerator:
     BASE_OUTPUT_DIR = "output"
@@ -24,6 +30,14 @@ class ReportGenerator:
         'danger': (204, 0, 0)           # Red
     }
 
+    # Сколько секунд переиспользуются данные раздела "Device Information"
+    DEVICE_SECTION_TTL = 60
+    _device_sections: Dict[str, Tuple[float, Tuple[dict, Dict[str, dict]]]] = {}
+
+    # Ширина изображений на странице (мм): по ней считается размер уменьшенной копии
+    MEDIA_REPORT_IMAGE_WIDTH = 180
+    FILE_REPORT_IMAGE_WIDTH = 150
+
     @staticmethod
     def setup_pdf(title: str = "Device Report"):
         """Initialize PDF with professional settings"""
@@ -31,12 +45,8 @@ class ReportGenerator:
         pdf.add_page()
         pdf.set_auto_page_break(auto=True, margin=15)
 
-        # Add Unicode-compatible fonts (normal, bold, italic, bold-italic)
-        pdf.add_font("DejaVu", "", "fonts/DejaVuSans.ttf", uni=True)
-        pdf.add_font("DejaVu", "B", "fonts/DejaVuSans-Bold.ttf", uni=True)
-        pdf.add_font("DejaVu", "I", "fonts/DejaVuSans-Oblique.ttf", uni=True)  # если нужен italic
-        pdf.add_font("DejaVu", "BI", "fonts/DejaVuSans-BoldOblique.ttf", uni=True)  # если нужен bold italic
-
+        # Unicode-шрифты DejaVu (normal, bold, italic, bold-italic) из общего кеша метрик
+        font_cache.install(pdf)
 
         # Add title and metadata
         pdf.set_title(title)
@@ -60,9 +70,36 @@ class ReportGenerator:
         pdf.ln(10)
 
     @staticmethod
-    def add_device_info_section(pdf):
-        """Add comprehensive device information section"""
-        device_info = ADBService.get_device_info()
+    def device_section_data(serial: Optional[str] = None) -> Tuple[dict, Dict[str, dict]]:
+        """
+        Данные раздела "Device Information": сведения об устройствах и
+        системная информация по каждому. Сбор идёт несколькими командами
+        dumpsys, поэтому результат переиспользуется DEVICE_SECTION_TTL секунд.
+        """
+        key = serial or ""
+        cached = ReportGenerator._device_sections.get(key)
+        if cached is not None and time.monotonic() - cached[0] < ReportGenerator.DEVICE_SECTION_TTL:
+            return cached[1]
+
+        device_info = ADBService.get_device_info(serial)
+        system_infos = {}
+        if device_info and "error" not in device_info:
+            for device in device_info.get("device-info", []):
+                system_infos[device.get('serial_number')] = ADBService.get_system_info(
+                    device.get('serial_number'), sections=["device", "battery", "storage", "operator", "gps"]
+                )
+        ReportGenerator._device_sections[key] = (time.monotonic(), (device_info, system_infos))
+        return device_info, system_infos
+
+    @staticmethod
+    def add_device_info_section(pdf, serial: Optional[str] = None,
+                                device_section: Optional[Tuple[dict, Dict[str, dict]]] = None):
+        """
+        Add comprehensive device information section. `device_section` -
+        заранее собранный device_section_data() (в процессе пула отчётов
+        устройство не опрашивается).
+        """
+        device_info, system_infos = device_section or ReportGenerator.device_section_data(serial)
         
         if not device_info or "error" in device_info:
             return
@@ -101,7 +138,7 @@ class ReportGenerator:
             pdf.ln(10)
             
             # Add system info if available
-            system_info = ADBService.get_system_info()
+            system_info = system_infos.get(device.get('serial_number'))
             if system_info and "error" not in system_info:
                 pdf.set_font("DejaVu", "B", 12)
                 pdf.cell(0, 8, "System Information", 0, 1)
@@ -167,7 +204,8 @@ class ReportGenerator:
         pdf.ln(8)
 
     @staticmethod
-    def generate_messages_report(sms_messages: list) -> str:
+    def generate_messages_report(sms_messages: List[SmsRecord], serial: Optional[str] = None,
+                                 device_section: Optional[Tuple[dict, Dict[str, dict]]] = None) -> str:
         """Generate professional SMS messages report"""
         try:
             if not sms_messages:
@@ -175,11 +213,11 @@ class ReportGenerator:
 
             pdf = ReportGenerator.setup_pdf("SMS Messages Report")
             ReportGenerator.add_header(pdf, "SMS COMMUNICATION REPORT")
-            ReportGenerator.add_device_info_section(pdf)
+            ReportGenerator.add_device_info_section(pdf, serial, device_section)
             
             # Summary statistics
             total_messages = len(sms_messages)
-            incoming = sum(1 for msg in sms_messages if isinstance(msg, dict) and msg.get("Тип") == "Входящее")
+            incoming = sum(1 for msg in sms_messages if msg.incoming)
             outgoing = total_messages - incoming
             
             pdf.set_font("DejaVu", "B", 12)
@@ -221,18 +259,15 @@ class ReportGenerator:
             pdf.set_font("DejaVu", "", 9)
             row_height = 8
             for msg in sms_messages:
-                if not isinstance(msg, dict):
-                    continue
-                
                 # Format data
-                date = msg.get("Дата", "N/A")
-                number = msg.get("Номер", "N/A")
-                msg_type = msg.get("Тип", "N/A")
-                text = ReportGenerator.remove_emojis(msg.get("Текст", "N/A"))
+                date = msg.date_text
+                number = msg.address or "N/A"
+                msg_type = msg.type_label
+                text = ReportGenerator.remove_emojis(msg.body if msg.body is not None else "N/A")
                 preview = (text[:40] + "...") if len(text) > 40 else text
                 
                 # Color code by message type
-                if msg_type == "Входящее":
+                if msg.incoming:
                     pdf.set_text_color(*ReportGenerator.COLORS['success'])
                 else:
                     pdf.set_text_color(*ReportGenerator.COLORS['secondary'])
@@ -246,28 +281,34 @@ class ReportGenerator:
                 pdf.ln()
             
             # Save report
-            report_path = os.path.join(ReportGenerator.REPORTS_DIR, "sms_report.pdf")
-            pdf.output(report_path, "F")
+            report_path = ReportGenerator.save_pdf(pdf, "sms_report")
             return report_path
 
         except Exception as e:
             raise HTTPException(status_code=500, detail=f"Report generation error: {str(e)}")
 
     @staticmethod
-    def generate_calls_report_from_json(call_logs: list) -> str:
+    def generate_calls_report_from_json(call_logs: list, serial: Optional[str] = None,
+                                        device_section: Optional[Tuple[dict, Dict[str, dict]]] = None) -> str:
         """Generate professional call log report"""
         try:
+            # JSON от клиента разбирается в записи один раз, дальше работаем с числами
+            call_logs = [
+                call if isinstance(call, CallRecord) else CallRecord.from_display(call)
+                for call in call_logs if isinstance(call, (dict, CallRecord))
+            ]
             if not call_logs:
                 raise HTTPException(status_code=400, detail="No call data available for report generation.")
 
             pdf = ReportGenerator.setup_pdf("Call Logs Report")
             ReportGenerator.add_header(pdf, "CALL LOGS REPORT")
-            ReportGenerator.add_device_info_section(pdf)
+            ReportGenerator.add_device_info_section(pdf, serial, device_section)
             
-            # Summary statistics
-            total_calls = len(call_logs)
-            missed = sum(1 for call in call_logs if isinstance(call, dict) and call.get("Пропущенный") == "Да")
-            received = total_calls - missed
+            # Summary statistics (те же агрегаты, что отдаёт /call-analytics)
+            analytics = compute_call_analytics(call_logs)
+            total_calls = analytics["totals"]["calls"]
+            missed = analytics["totals"]["missed"]
+            received = analytics["totals"]["received"]
             
             pdf.set_font("DejaVu", "B", 12)
             pdf.set_text_color(*ReportGenerator.COLORS['primary'])
@@ -308,15 +349,12 @@ class ReportGenerator:
             pdf.set_font("DejaVu", "", 9)
             row_height = 8
             for call in call_logs:
-                if not isinstance(call, dict):
-                    continue
-                
                 # Format data
-                date = call.get("Дата", "N/A")
-                number = call.get("Номер", "N/A")
-                call_type = call.get("Тип вызова", "N/A")
-                duration = call.get("Длительность", "N/A")
-                status = "Missed" if call.get("Пропущенный") == "Да" else "Received"
+                date = call.date_text
+                number = call.number or "N/A"
+                call_type = call.type_label
+                duration = f"{call.duration} сек"
+                status = "Missed" if call.missed else "Received"
                 
                 # Color code by status
                 if status == "Missed":
@@ -350,31 +388,10 @@ class ReportGenerator:
             
             # Group calls by duration ranges
             duration_ranges = {
-                "0-1 min": 0,
-                "1-5 min": 0,
-                "5-10 min": 0,
-                "10+ min": 0
+                ReportGenerator.duration_range_label(bucket["from"], bucket["to"]): bucket["count"]
+                for bucket in analytics["duration_histogram"]
             }
             
-            for call in call_logs:
-                if not isinstance(call, dict):
-                    continue
-                
-                duration_str = call.get("Длительность", "0 сек")
-                try:
-                    duration = int(duration_str.split()[0])
-                except:
-                    duration = 0
-                
-                if duration <= 60:
-                    duration_ranges["0-1 min"] += 1
-                elif duration <= 300:
-                    duration_ranges["1-5 min"] += 1
-                elif duration <= 600:
-                    duration_ranges["5-10 min"] += 1
-                else:
-                    duration_ranges["10+ min"] += 1
-            
             # Create duration distribution table
             pdf.set_font("DejaVu", "B", 10)
             pdf.cell(80, 10, "Duration Range", 1, 0, 'C', True)
@@ -396,25 +413,31 @@ class ReportGenerator:
                 pdf.set_text_color(*ReportGenerator.COLORS['dark'])
             
             # Save report
-            report_path = os.path.join(ReportGenerator.REPORTS_DIR, "calls_report.pdf")
-            pdf.output(report_path, "F")
+            report_path = ReportGenerator.save_pdf(pdf, "calls_report")
             return report_path
 
         except Exception as e:
             raise HTTPException(status_code=500, detail=f"Report generation error: {str(e)}")
 
     @staticmethod
-    def generate_comprehensive_device_report() -> str:
+    def duration_range_label(start: int, end: Optional[int]) -> str:
+        """Подпись интервала гистограммы: минуты, если границы кратны минуте"""
+        if start % 60 == 0 and (end is None or end % 60 == 0):
+            return f"{start // 60}+ min" if end is None else f"{start // 60}-{end // 60} min"
+        return f"{start}+ sec" if end is None else f"{start}-{end} sec"
+
+    @staticmethod
+    def generate_comprehensive_device_report(serial: Optional[str] = None) -> str:
         """Generate a comprehensive device report with all available information"""
         try:
             pdf = ReportGenerator.setup_pdf("Comprehensive Device Report")
             ReportGenerator.add_header(pdf, "COMPREHENSIVE DEVICE REPORT")
             
             # Device Information
-            ReportGenerator.add_device_info_section(pdf)
+            ReportGenerator.add_device_info_section(pdf, serial)
             
             # System Information
-            system_info = ADBService.get_system_info()
+            system_info = ADBService.get_system_info(serial)
             if system_info and "error" not in system_info:
                 pdf.add_page()
                 ReportGenerator.add_chapter_title(pdf, "System Configuration")
@@ -512,13 +535,31 @@ class ReportGenerator:
                         pdf.cell(col_width, row_height, app.replace('package:', '').strip(), 0, 1, 'L')
             
             # Save report
-            report_path = os.path.join(ReportGenerator.REPORTS_DIR, "comprehensive_report.pdf")
-            pdf.output(report_path, "F")
+            report_path = ReportGenerator.save_pdf(pdf, "comprehensive_report")
             return report_path
 
         except Exception as e:
             raise HTTPException(status_code=500, detail=f"Comprehensive report generation error: {str(e)}")
 
+    @staticmethod
+    def save_pdf(pdf: FPDF, name: str) -> str:
+        """
+        Сохраняет отчёт под уникальным именем: параллельные запросы не
+        перезаписывают файл, который ещё отдаётся. PDF пишется во временный
+        файл и переименовывается, так что недописанный отчёт не виден.
+        """
+        report_path = os.path.join(
+            ReportGenerator.REPORTS_DIR, f"{name}_{datetime.now().strftime('%Y%m%d_%H%M%S')}_{uuid.uuid4().hex[:8]}.pdf"
+        )
+        temp_path = f"{report_path}.part"
+        try:
+            pdf.output(temp_path, "F")
+            os.replace(temp_path, report_path)
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+        return report_path
+
     @staticmethod
     def remove_emojis(text):
         """Remove emojis from text"""
@@ -526,29 +567,25 @@ class ReportGenerator:
         return emoji_pattern.sub("?", text)
 
     @staticmethod
-    def fetch_files_from_path(category: str, directory: str, limit: int) -> list:
-        """Download files of specified category from given directory"""
-        files = ADBService.list_files(directory).get(category, [])
+    def fetch_files_from_path(category: str, directory: str, limit: int, serial: Optional[str] = None,
+                              files: Optional[List[str]] = None,
+                              stats: Optional[Dict[str, Tuple[int, int]]] = None) -> list:
+        """
+        Download files of specified category from given directory. `files` и
+        `stats` - уже прочитанные пути и их размеры/mtime (тогда устройство
+        заново не опрашивается).
+        """
+        if files is None:
+            files = ADBService.indexed_file_paths(directory, category, limit, serial)
         
         if not files:
             raise HTTPException(status_code=404, detail=f"No files of category '{category}' found in '{directory}'.")
 
-        output_dir = os.path.join(ReportGenerator.BASE_OUTPUT_DIR, category)
-        os.makedirs(output_dir, exist_ok=True)
-
-        downloaded_files = []
-        for file in files[:limit]:
-            encoded_path = file.get("url", "").split("path=")[-1]
-            file_path = unquote(encoded_path)
-
-            if not file_path:
-                continue
-
-            try:
-                local_file = ADBService.download_file(file_path, output_dir)
-                downloaded_files.append(local_file)
-            except Exception as e:
-                raise HTTPException(status_code=500, detail=f"Error downloading '{file_path}': {str(e)}")
+        try:
+            local_files = ADBService.pull_files(files, serial, stats)
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Error downloading files: {str(e)}")
+        downloaded_files = [local_files[file_path] for file_path in files if file_path in local_files]
 
         if not downloaded_files:
             raise HTTPException(status_code=500, detail=f"Failed to download files of category '{category}' from '{directory}'.")
@@ -556,21 +593,28 @@ class ReportGenerator:
         return downloaded_files
 
     @staticmethod
-    def generate_pdf(file_paths: list) -> str:
-        """Generate PDF with images/documents (enhanced version)"""
+    def generate_pdf(file_paths: list, serial: Optional[str] = None, category: str = "media",
+                     device_section: Optional[Tuple[dict, Dict[str, dict]]] = None,
+                     image_paths: Optional[Dict[str, str]] = None) -> str:
+        """
+        Generate PDF with images/documents (enhanced version). `image_paths` -
+        уже уменьшенные копии из pdf_image_cache.prepare_many().
+        """
         if not file_paths:
             raise HTTPException(status_code=400, detail="No files provided for PDF generation.")
 
-        report_path = os.path.join(ReportGenerator.REPORTS_DIR, f"{file_paths[0].split(os.sep)[-2]}_report.pdf")
-
         pdf = ReportGenerator.setup_pdf("Media Files Report")
         ReportGenerator.add_header(pdf, "MEDIA FILES REPORT")
-        ReportGenerator.add_device_info_section(pdf)
+        ReportGenerator.add_device_info_section(pdf, serial, device_section)
         
         ReportGenerator.add_chapter_title(pdf, "Media Content")
         
         pdf.set_font("DejaVu", "", 10)
-        
+
+        if image_paths is None:
+            # Изображения уменьшаются до ширины на странице параллельно, до вёрстки
+            image_paths = pdf_image_cache.prepare_many(file_paths, ReportGenerator.MEDIA_REPORT_IMAGE_WIDTH)
+
         for file_path in file_paths:
             # Add new page for each file
             pdf.add_page()
@@ -582,7 +626,7 @@ class ReportGenerator:
             
             try:
                 # Try to add image (works for PDFs too)
-                pdf.image(file_path, x=10, y=40, w=180)
+                pdf.image(image_paths[file_path], x=10, y=40, w=ReportGenerator.MEDIA_REPORT_IMAGE_WIDTH)
                 
                 # Add file metadata
                 pdf.set_y(190)
@@ -605,116 +649,175 @@ class ReportGenerator:
                     except:
                         pass
 
-        pdf.output(report_path)
-        return report_path
+        return ReportGenerator.save_pdf(pdf, f"{category}_report")
     
     @staticmethod
-    def generate_filtered_file_report(category: str, date_after: str, date_before: Optional[str], limit: int):
+    def generate_filtered_file_report(category: str, date_after: str, date_before: Optional[str], limit: int,
+                                      serial: Optional[str] = None, extensions: Optional[List[str]] = None,
+                                      min_size: Optional[int] = None, max_size: Optional[int] = None,
+                                      name: Optional[str] = None):
         try:
-            files = ADBService.filter_files_by_category(category, date_after, date_before, limit)
+            files = ReportGenerator.collect_filtered_files(
+                category, date_after, date_before, limit, serial,
+                extensions=extensions, min_size=min_size, max_size=max_size, name=name
+            )
+            return ReportGenerator.render_filtered_file_report(category, files, serial)
+
+        except HTTPException:
+            raise
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Ошибка генерации отчета: {str(e)}")
 
-            if not files:
-                raise HTTPException(status_code=404, detail="Файлы не найдены по фильтру")
+    @staticmethod
+    def collect_filtered_files(category: str, date_after: str, date_before: Optional[str], limit: int,
+                               serial: Optional[str] = None, extensions: Optional[List[str]] = None,
+                               min_size: Optional[int] = None, max_size: Optional[int] = None,
+                               name: Optional[str] = None, files: Optional[List[dict]] = None) -> dict:
+        """
+        Данные отчёта по файлам категории: файлы по фильтру скачиваются
+        (изображения ещё и уменьшаются) в несколько потоков. Результат -
+        простые данные для render_filtered_file_report: число найденных
+        файлов и по записи на файл с локальным размером, путём к
+        изображению или текстом ошибки. `files` - уже выполненный
+        filter_files_by_category с теми же параметрами.
+        """
+        if files is None:
+            files = ADBService.filter_files_by_category(
+                category, date_after, date_before, limit, serial,
+                extensions=extensions, min_size=min_size, max_size=max_size, name=name
+            )
 
-            ALLOWED_EXTENSIONS = {
-                "images": ['.jpg', '.jpeg', '.png', '.bmp', '.gif'],
-                "documents": ['.txt', '.log', '.csv', '.json', '.xml',
-                              '.pdf', '.doc', '.docx', '.xls', '.xlsx', '.ppt', '.pptx'],
-                "videos": ['.mp4', '.mov', '.avi', '.mkv', '.3gp', '.webm']
-            }
+        if not files:
+            raise HTTPException(status_code=404, detail="Файлы не найдены по фильтру")
+
+        ALLOWED_EXTENSIONS = {
+            "images": ['.jpg', '.jpeg', '.png', '.bmp', '.gif'],
+            "documents": ['.txt', '.log', '.csv', '.json', '.xml',
+                          '.pdf', '.doc', '.docx', '.xls', '.xlsx', '.ppt', '.pptx'],
+            "videos": ['.mp4', '.mov', '.avi', '.mkv', '.3gp', '.webm']
+        }
+
+        allowed_exts = ALLOWED_EXTENSIONS.get(category.lower(), [])
+
+        def is_valid(file) -> bool:
+            return isinstance(file, dict) and all(key in file for key in ("path", "name", "modified"))
+
+        def fetch(file: dict) -> Tuple[str, str]:
+            local_path = ADBService.download_file(file["path"], serial, file.get("size"), file.get("mtime"))
+            if category.lower() != "images":
+                return local_path, local_path
+            return local_path, pdf_image_cache.prepare(local_path, ReportGenerator.FILE_REPORT_IMAGE_WIDTH)
+
+        # Файлы скачиваются (и изображения уменьшаются) с опережением в несколько потоков
+        prefetched = prefetch([
+            file for file in files
+            if is_valid(file) and os.path.splitext(file["path"])[1].lower() in allowed_exts
+        ], fetch, ADBService.get_pull_workers(serial))
+
+        entries = []
+        for idx, file in enumerate(files):
+            if not is_valid(file):
+                entries.append({"index": idx, "error": f"Неверная структура file[{idx}]: {file}"})
+                continue
 
-            allowed_exts = ALLOWED_EXTENSIONS.get(category.lower(), [])
+            if os.path.splitext(file["path"])[1].lower() not in allowed_exts:
+                continue
 
-            pdf = ReportGenerator.setup_pdf(title=f"{category.capitalize()} Report")
-            ReportGenerator.add_header(pdf, f"{category.upper()} FILES REPORT")
-            ReportGenerator.add_device_info_section(pdf)
+            _, prepared, error = next(prefetched)
+            try:
+                if error is not None:
+                    raise error
+                local_path, image_path = prepared
+                entries.append({
+                    "index": idx,
+                    "name": str(file["name"]).replace("\n", " ").strip(),
+                    "path": file["path"],
+                    "modified": (
+                        file["modified"].strftime('%Y-%m-%d %H:%M')
+                        if hasattr(file["modified"], 'strftime')
+                        else str(file["modified"])
+                    ),
+                    "size": os.path.getsize(local_path),
+                    "image_path": image_path,
+                })
+            except Exception as e:
+                entries.append({"index": idx, "error": str(e)})
 
-            pdf.set_font("DejaVu", "B", 12)
-            pdf.set_text_color(*ReportGenerator.COLORS['primary'])
-            pdf.cell(0, 8, "Файлы", 0, 1)
-            pdf.ln(2)
+        return {"count": len(files), "entries": entries}
 
-            pdf.set_fill_color(*ReportGenerator.COLORS['light'])
-            pdf.rect(10, pdf.get_y(), 190, 10, 'F')
-            pdf.set_font("DejaVu", "B", 10)
-            pdf.cell(95, 8, "Категория", 1, 0, 'C', True)
-            pdf.cell(95, 8, "Количество файлов", 1, 1, 'C', True)
+    @staticmethod
+    def render_filtered_file_report(category: str, files: dict, serial: Optional[str] = None,
+                                    device_section: Optional[Tuple[dict, Dict[str, dict]]] = None) -> str:
+        """PDF по данным collect_filtered_files (устройство не опрашивается, если передан device_section)"""
+        pdf = ReportGenerator.setup_pdf(title=f"{category.capitalize()} Report")
+        ReportGenerator.add_header(pdf, f"{category.upper()} FILES REPORT")
+        ReportGenerator.add_device_info_section(pdf, serial, device_section)
 
-            pdf.set_font("DejaVu", "", 10)
-            pdf.cell(95, 8, category.capitalize(), 1, 0, 'C')
-            pdf.cell(95, 8, str(len(files)), 1, 1, 'C')
-            pdf.ln(10)
+        pdf.set_font("DejaVu", "B", 12)
+        pdf.set_text_color(*ReportGenerator.COLORS['primary'])
+        pdf.cell(0, 8, "Файлы", 0, 1)
+        pdf.ln(2)
 
-            ReportGenerator.add_chapter_title(pdf, "Информация о файлах")
+        pdf.set_fill_color(*ReportGenerator.COLORS['light'])
+        pdf.rect(10, pdf.get_y(), 190, 10, 'F')
+        pdf.set_font("DejaVu", "B", 10)
+        pdf.cell(95, 8, "Категория", 1, 0, 'C', True)
+        pdf.cell(95, 8, "Количество файлов", 1, 1, 'C', True)
 
-            for idx, file in enumerate(files):
-                try:
-                    if not isinstance(file, dict) or "path" not in file or "name" not in file or "modified" not in file:
-                        raise ValueError(f"Неверная структура file[{idx}]: {file}")
+        pdf.set_font("DejaVu", "", 10)
+        pdf.cell(95, 8, category.capitalize(), 1, 0, 'C')
+        pdf.cell(95, 8, str(files["count"]), 1, 1, 'C')
+        pdf.ln(10)
 
-                    local_path = ADBService.download_file(
-                        file["path"],
-                        output_dir=os.path.join(ReportGenerator.BASE_OUTPUT_DIR, "files")
-                    )
+        ReportGenerator.add_chapter_title(pdf, "Информация о файлах")
 
-                    ext = os.path.splitext(local_path)[1].lower()
-                    if ext not in allowed_exts:
-                        continue
+        for entry in files["entries"]:
+            idx = entry["index"]
+            try:
+                if "error" in entry:
+                    raise RuntimeError(entry["error"])
 
-                    modified_str = (
-                        file["modified"].strftime('%Y-%m-%d %H:%M')
-                        if hasattr(file["modified"], 'strftime')
-                        else str(file["modified"])
-                    )
+                name = entry["name"]
 
-                    name = str(file["name"]).replace("\n", " ").strip()
+                if category.lower() in ["videos", "documents"]:
+                    pdf.set_font("DejaVu", "B", 11)
+                    pdf.set_text_color(*ReportGenerator.COLORS['primary'])
+                    pdf.cell(0, 8, f"{name}", 0, 1)
+                    pdf.set_font("DejaVu", "", 10)
+                    pdf.set_text_color(*ReportGenerator.COLORS['secondary'])
+                    pdf.multi_cell(0, 6, f"Размер: {entry['size'] / 1024:.1f} KB")
+                    pdf.multi_cell(0, 6, f"Дата изменения: {entry['modified']}")
+                    pdf.multi_cell(0, 6, f"Путь: {entry['path']}")
+                    pdf.ln(5)
+                else:
+                    pdf.add_page()
+                    pdf.set_font("DejaVu", "B", 12)
+                    pdf.set_text_color(*ReportGenerator.COLORS['primary'])
+                    pdf.cell(0, 10, f"{name}", 0, 1)
+                    pdf.ln(5)
+                    pdf.set_text_color(*ReportGenerator.COLORS['secondary'])
+                    pdf.set_font("DejaVu", "", 10)
+                    pdf.multi_cell(0, 8, f"Размер: {entry['size'] / 1024:.1f} KB")
+                    pdf.multi_cell(0, 8, f"Дата изменения: {entry['modified']}")
+                    pdf.multi_cell(0, 8, f"Путь: {entry['path']}")
+                    pdf.ln(5)
 
-                    if category.lower() in ["videos", "documents"]:
-                        pdf.set_font("DejaVu", "B", 11)
-                        pdf.set_text_color(*ReportGenerator.COLORS['primary'])
-                        pdf.cell(0, 8, f"{name}", 0, 1)
-                        pdf.set_font("DejaVu", "", 10)
-                        pdf.set_text_color(*ReportGenerator.COLORS['secondary'])
-                        pdf.multi_cell(0, 6, f"Размер: {os.path.getsize(local_path) / 1024:.1f} KB")
-                        pdf.multi_cell(0, 6, f"Дата изменения: {modified_str}")
-                        pdf.multi_cell(0, 6, f"Путь: {local_path}")
-                        pdf.ln(5)
-                    else:
-                        pdf.add_page()
-                        pdf.set_font("DejaVu", "B", 12)
-                        pdf.set_text_color(*ReportGenerator.COLORS['primary'])
-                        pdf.cell(0, 10, f"{name}", 0, 1)
-                        pdf.ln(5)
-                        pdf.set_text_color(*ReportGenerator.COLORS['secondary'])
+                if category.lower() == "images":
+                    try:
+                        pdf.image(entry["image_path"], x=30, w=ReportGenerator.FILE_REPORT_IMAGE_WIDTH)
+                        pdf.ln(10)
+                    except Exception as img_err:
+                        pdf.set_text_color(*ReportGenerator.COLORS['danger'])
                         pdf.set_font("DejaVu", "", 10)
-                        pdf.multi_cell(0, 8, f"Размер: {os.path.getsize(local_path) / 1024:.1f} KB")
-                        pdf.multi_cell(0, 8, f"Дата изменения: {modified_str}")
-                        pdf.multi_cell(0, 8, f"Путь: {local_path}")
-                        pdf.ln(5)
-
-                    if category.lower() == "images":
-                        try:
-                            pdf.image(local_path, x=30, w=150)
-                            pdf.ln(10)
-                        except Exception as img_err:
-                            pdf.set_text_color(*ReportGenerator.COLORS['danger'])
-                            pdf.set_font("DejaVu", "", 10)
-                            pdf.multi_cell(0, 8, f"Не удалось вставить изображение: {str(img_err)}")
-                            pdf.ln(2)
-
-                    # Удалён блок с чтением и вставкой содержимого документов
-
-                except Exception as e:
-                    pdf.set_text_color(*ReportGenerator.COLORS['danger'])
-                    pdf.set_font("DejaVu", "", 10)
-                    pdf.multi_cell(0, 8, f"[{idx}] Ошибка при обработке: {str(e)}")
-                    pdf.ln(2)
+                        pdf.multi_cell(0, 8, f"Не удалось вставить изображение: {str(img_err)}")
+                        pdf.ln(2)
 
-            filename = f"{category}_report_{datetime.now().strftime('%Y%m%d_%H%M%S')}.pdf"
-            output_path = os.path.join(ReportGenerator.REPORTS_DIR, filename)
-            pdf.output(output_path)
+                # Удалён блок с чтением и вставкой содержимого документов
 
-            return output_path
+            except Exception as e:
+                pdf.set_text_color(*ReportGenerator.COLORS['danger'])
+                pdf.set_font("DejaVu", "", 10)
+                pdf.multi_cell(0, 8, f"[{idx}] Ошибка при обработке: {str(e)}")
+                pdf.ln(2)
 
-        except Exception as e:
-            raise HTTPException(status_code=500, detail=f"Ошибка генерации отчета: {str(e)}")
+        return ReportGenerator.save_pdf(pdf, f"{category}_report")
@@ -0,0 +1,68 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from typing import Any, Optional
+
+
+class ReportCache:
+    """
+    Готовые PDF-отчёты под отпечатком (вид отчёта, фильтры, версия данных).
+
+    Версия данных - то, по чему видно изменение источника: версия локальной
+    копии SMS, размеры и mtime выбранных файлов и т.п. Пока она не
+    меняется, повторный запрос с теми же фильтрами получает уже
+    сформированный файл. Отчёты в `root` не перезаписываются, а только
+    удаляются при вытеснении: старше `min_age` секунд и сверх `max_files`
+    самых новых, так что файл, который сейчас отдаётся, не пропадёт.
+    """
+
+    def __init__(self, root: str = os.path.join("output", "reports"), max_files: int = 200, min_age: float = 600):
+        self.root = root
+        self.max_files = max_files
+        self.min_age = min_age
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def fingerprint(kind: str, filters: dict, version: Any) -> str:
+        raw = json.dumps([kind, filters, version], sort_keys=True, ensure_ascii=False, default=str)
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def path_for(self, kind: str, fingerprint: str) -> str:
+        return os.path.join(self.root, f"{kind}_report_{fingerprint[:16]}.pdf")
+
+    def lookup(self, kind: str, fingerprint: str) -> Optional[str]:
+        path = self.path_for(kind, fingerprint)
+        try:
+            # mtime - время последнего использования для вытеснения
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        return path
+
+    def store(self, kind: str, fingerprint: str, report_path: str) -> str:
+        """Переносит сформированный отчёт под его отпечаток"""
+        path = self.path_for(kind, fingerprint)
+        os.makedirs(self.root, exist_ok=True)
+        os.replace(report_path, path)
+        self._evict()
+        return path
+
+    def _evict(self):
+        with self._lock:
+            try:
+                entries = [entry for entry in os.scandir(self.root) if entry.is_file() and entry.name.endswith(".pdf")]
+            except FileNotFoundError:
+                return
+            entries.sort(key=lambda entry: entry.stat().st_mtime, reverse=True)
+            now = time.time()
+            for entry in entries[self.max_files:]:
+                try:
+                    if now - entry.stat().st_mtime > self.min_age:
+                        os.remove(entry.path)
+                except FileNotFoundError:
+                    pass
+
+
+report_cache = ReportCache()
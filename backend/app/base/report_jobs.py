@@ -0,0 +1,322 @@
+import asyncio
+import multiprocessing
+import sqlite3
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from fastapi import HTTPException
+
+from app.base.async_service import AsyncADBService
+from app.base.message_store import message_store
+from app.base.pdf_fonts import font_cache
+from app.base.pdf_images import pdf_image_cache
+from app.base.report_cache import report_cache
+from app.base.reportGenerator import ReportGenerator
+from app.base.service import ADBService
+from app.base.shell_pool import ADBShellError
+
+# Сколько отчётов формируется одновременно (процессов в пуле)
+REPORT_WORKERS = 2
+
+# Сколько секунд после завершения задание доступно по /report/jobs/{id}
+JOB_TTL = 3600
+
+
+class ReportJobError(Exception):
+    """HTTPException из процесса пула в виде, который переживает pickle"""
+
+    def __init__(self, status_code: int, detail: str):
+        super().__init__(status_code, detail)
+        self.status_code = status_code
+        self.detail = detail
+
+
+def _init_worker():
+    """
+    Запуск процесса пула: метрики шрифтов и подмножества для пустого
+    отчёта готовятся заранее, а не при первом задании процесса.
+    """
+    font_cache.load()
+    pdf = ReportGenerator.setup_pdf()
+    for style in ("", "B", "I", "BI"):
+        pdf.set_font("DejaVu", style, 10)
+        pdf.cell(0, 8, "", 0, 1)
+    pdf.output(dest="S")
+
+
+@dataclass
+class ReportKind:
+    """
+    Вид отчёта. `collect` выполняется в основном процессе: всё, что идёт
+    через устройство, file_index и pull_cache, собирается в простые данные
+    (локальные пути, записи). `render` выполняется в процессе пула и
+    только верстает PDF. `version` возвращает (версия исходных данных для
+    отпечатка, листинг): листинг - то, что ради версии уже прочитано с
+    устройства, и collect получает его вторым аргументом, чтобы не
+    повторять обход. Листинг None (версии нет или её не удалось узнать) -
+    collect собирает всё сам. Без `version` отчёт определяется одними
+    фильтрами.
+    """
+    collect: Callable[[dict, Any], dict]
+    render: Callable[[dict], str]
+    version: Optional[Callable[[dict], Tuple[Any, Any]]] = None
+
+
+def _collect_files(filters: dict, listing: Optional[dict]) -> dict:
+    file_paths = ReportGenerator.fetch_files_from_path(
+        filters["category"], filters["filter_path"], filters["limit"], filters["serial"], **(listing or {})
+    )
+    if not file_paths:
+        raise HTTPException(status_code=400, detail="No files provided for PDF generation.")
+    # Изображения уменьшаются здесь же: pdf_image_cache общий для всех заданий
+    image_paths = pdf_image_cache.prepare_many(file_paths, ReportGenerator.MEDIA_REPORT_IMAGE_WIDTH)
+    return dict(filters, file_paths=file_paths, image_paths=image_paths)
+
+
+def _render_files(params: dict) -> str:
+    return ReportGenerator.generate_pdf(
+        params["file_paths"], params["serial"], params["category"],
+        device_section=params["device_section"], image_paths=params["image_paths"]
+    )
+
+
+def _files_version(filters: dict) -> Tuple[Any, dict]:
+    paths = ADBService.indexed_file_paths(filters["filter_path"], filters["category"], filters["limit"], filters["serial"])
+    stats = ADBService.stat_files(paths, filters["serial"])
+    return sorted(stats.items()), {"files": paths, "stats": stats}
+
+
+def _collect_messages(filters: dict, listing: Optional[bool]) -> dict:
+    # Если _messages_version не смог дочитать копию, дочитываем здесь: ошибка устройства станет ошибкой задания
+    messages = ADBService.get_sms_records(
+        filters["serial"], filters["contact"], filters["date_from"], filters["date_to"], filters["limit"],
+        sync=listing is None
+    )
+    if not messages:
+        if filters["contact"] or filters["date_from"] or filters["date_to"]:
+            raise HTTPException(status_code=404, detail="Нет сообщений, соответствующих фильтру.")
+        raise HTTPException(status_code=404, detail="Данные о сообщениях не найдены.")
+    return {"messages": messages, "serial": filters["serial"]}
+
+
+def _render_messages(params: dict) -> str:
+    return ReportGenerator.generate_messages_report(params["messages"], params["serial"], params["device_section"])
+
+
+def _messages_version(filters: dict) -> Tuple[Any, bool]:
+    # Версия сохраняется в базе и переживает перезапуск; листинг True - копия уже дочитана
+    ADBService.sync_messages("sms", filters["serial"])
+    return message_store.data_version(filters["serial"], "sms"), True
+
+
+def _collect_calls(filters: dict, listing: Any) -> dict:
+    return dict(filters)
+
+
+def _render_calls(params: dict) -> str:
+    return ReportGenerator.generate_calls_report_from_json(params["call_logs"], params["serial"], params["device_section"])
+
+
+def _collect_category(filters: dict, listing: Optional[List[dict]]) -> dict:
+    return {
+        "category": filters["category"],
+        "serial": filters["serial"],
+        "files": ReportGenerator.collect_filtered_files(**filters, files=listing),
+    }
+
+
+def _render_category(params: dict) -> str:
+    return ReportGenerator.render_filtered_file_report(
+        params["category"], params["files"], params["serial"], params["device_section"]
+    )
+
+
+def _category_version(filters: dict) -> Tuple[Any, List[dict]]:
+    files = ADBService.filter_files_by_category(**filters)
+    return [(entry["path"], entry["size"], entry["mtime"]) for entry in files], files
+
+
+# Виды отчётов. У отчёта по звонкам данные приходят в запросе и целиком входят в фильтры.
+REPORT_KINDS: Dict[str, ReportKind] = {
+    "files": ReportKind(_collect_files, _render_files, _files_version),
+    "messages": ReportKind(_collect_messages, _render_messages, _messages_version),
+    "calls": ReportKind(_collect_calls, _render_calls),
+    "category": ReportKind(_collect_category, _render_category, _category_version),
+}
+
+
+def render_report(kind: str, params: dict) -> str:
+    """Выполняется в процессе пула и возвращает путь к готовому PDF"""
+    try:
+        return REPORT_KINDS[kind].render(params)
+    except HTTPException as e:
+        raise ReportJobError(e.status_code, str(e.detail))
+
+
+@dataclass
+class ReportJob:
+    id: str
+    kind: str
+    status: str = "queued"
+    stage: str = "В очереди"
+    progress: int = 0
+    created_at: float = field(default_factory=time.time)
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    result_path: Optional[str] = None
+    error: Optional[str] = None
+    cached: bool = False
+    status_code: Optional[int] = None
+    task: Optional[asyncio.Task] = field(default=None, repr=False)
+
+    def to_dict(self) -> dict:
+        return {
+            "job_id": self.id,
+            "kind": self.kind,
+            "status": self.status,
+            "stage": self.stage,
+            "progress": self.progress,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "error": self.error,
+            "cached": self.cached,
+        }
+
+
+class ReportJobQueue:
+    """
+    Фоновое формирование PDF-отчётов.
+
+    Задание ищет готовый отчёт с тем же отпечатком в report_cache. Если
+    его нет, данные собираются в основном процессе (ReportKind.collect и
+    раздел "Device Information"), а PDF верстается в пуле из `workers`
+    процессов. Потоки сервера при этом не заняты, так что долгие отчёты не
+    тормозят остальные эндпоинты. С устройством, file_index и pull_cache
+    работает только основной процесс: в пул уходят простые данные и
+    локальные пути. Процессы запускаются через spawn и при старте
+    прогревают шрифты (_init_worker).
+    """
+
+    def __init__(self, workers: int = REPORT_WORKERS, ttl: float = JOB_TTL):
+        self.workers = workers
+        self.ttl = ttl
+        self.jobs: Dict[str, ReportJob] = {}
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._slots: Optional[asyncio.Semaphore] = None
+        # Отпечаток -> рендеринг, который идёт сейчас: одинаковые задания ждут его, а не рендерят заново
+        self._rendering: Dict[str, asyncio.Future] = {}
+
+    def _pool(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers, mp_context=multiprocessing.get_context("spawn"), initializer=_init_worker
+            )
+        return self._executor
+
+    def submit(self, kind: str, filters: dict) -> ReportJob:
+        """Ставит отчёт в очередь; `filters` - параметры вида отчёта, они же входят в отпечаток"""
+        self._expire()
+        job = ReportJob(id=uuid.uuid4().hex, kind=kind)
+        self.jobs[job.id] = job
+        job.task = asyncio.create_task(self._run(job, filters))
+        return job
+
+    @staticmethod
+    async def _fingerprint(kind: str, filters: dict) -> Tuple[Optional[str], Any]:
+        """
+        Отпечаток отчёта и листинг для collect. Отпечаток None - версию
+        данных узнать не удалось (устройство или локальная база недоступны),
+        отчёт не кешируется, а collect собирает данные сам. Остальные ошибки
+        (неверный фильтр и т.п.) завершают задание.
+        """
+        version_of = REPORT_KINDS[kind].version
+        if version_of is None:
+            return report_cache.fingerprint(kind, filters, None), None
+        try:
+            version, listing = await AsyncADBService.run_on_device(filters.get("serial"), version_of, filters)
+        except (ADBShellError, sqlite3.Error):
+            return None, None
+        return report_cache.fingerprint(kind, filters, version), listing
+
+    async def _run(self, job: ReportJob, filters: dict):
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.workers)
+        try:
+            job.stage, job.progress = "Поиск готового отчёта", 10
+            fingerprint, listing = await self._fingerprint(job.kind, filters)
+            cached = report_cache.lookup(job.kind, fingerprint) if fingerprint else None
+            if cached:
+                job.result_path, job.cached = cached, True
+            elif fingerprint in self._rendering:
+                job.status, job.stage, job.progress = "running", "Ожидание такого же отчёта", 50
+                job.started_at = time.time()
+                job.result_path = await asyncio.shield(self._rendering[fingerprint])
+                job.cached = True
+            else:
+                rendering = asyncio.ensure_future(self._render(job, filters, listing, fingerprint))
+                if fingerprint:
+                    self._rendering[fingerprint] = rendering
+                    rendering.add_done_callback(lambda _: self._rendering.pop(fingerprint, None))
+                job.result_path = await rendering
+            job.status, job.stage, job.progress = "done", "Готово", 100
+        except (HTTPException, ReportJobError) as e:
+            job.status, job.stage, job.status_code, job.error = "failed", "Ошибка", e.status_code, str(e.detail)
+        except BrokenProcessPool as e:
+            # Процесс пула упал (например, по памяти): следующие задания получат новый пул
+            self.shutdown()
+            job.status, job.stage, job.status_code, job.error = "failed", "Ошибка", 500, str(e)
+        except Exception as e:
+            job.status, job.stage, job.status_code, job.error = "failed", "Ошибка", 500, str(e)
+        finally:
+            job.finished_at = time.time()
+
+    async def _render(self, job: ReportJob, filters: dict, listing: Any, fingerprint: Optional[str]) -> str:
+        job.stage, job.progress = "Сбор данных", 20
+        # Данные собираются в слоте устройства, как и запросы эндпоинтов
+        serial = filters.get("serial")
+        params = await AsyncADBService.run_on_device(serial, REPORT_KINDS[job.kind].collect, filters, listing)
+        params["device_section"] = await AsyncADBService.run_on_device(serial, ReportGenerator.device_section_data, serial)
+        job.stage, job.progress = "Ожидание свободного процесса", 40
+        async with self._slots:
+            job.status, job.stage, job.progress = "running", "Формирование PDF", 50
+            job.started_at = time.time()
+            loop = asyncio.get_running_loop()
+            report_path = await loop.run_in_executor(self._pool(), render_report, job.kind, params)
+        return report_cache.store(job.kind, fingerprint, report_path) if fingerprint else report_path
+
+    def _expire(self):
+        now = time.time()
+        for job_id, job in list(self.jobs.items()):
+            if job.finished_at is not None and now - job.finished_at > self.ttl:
+                del self.jobs[job_id]
+
+    def get(self, job_id: str) -> ReportJob:
+        job = self.jobs.get(job_id)
+        if job is None:
+            raise HTTPException(status_code=404, detail="Задание не найдено")
+        return job
+
+    async def wait(self, job: ReportJob) -> str:
+        """Путь к PDF после завершения задания (ошибка задания - HTTPException)"""
+        await asyncio.shield(job.task)
+        return self.result(job)
+
+    def result(self, job: ReportJob) -> str:
+        if job.status == "failed":
+            raise HTTPException(status_code=job.status_code or 500, detail=job.error)
+        if job.status != "done":
+            raise HTTPException(status_code=409, detail="Отчёт ещё не готов")
+        return job.result_path
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+report_jobs = ReportJobQueue()
@@ -1,38 +1,183 @@
 import subprocess
 import mimetypes
+from concurrent.futures import ThreadPoolExecutor
 import urllib.parse
 from fastapi import HTTPException
 import os
 import re
-from datetime import datetime
-from typing import List, Optional
-
+import shlex
+import heapq
+import base64
+import binascii
+import sqlite3
+import tarfile
+import uuid
+import zipfile
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Dict, Iterator, List, Optional, Tuple
+from app.base.shell_pool import shell_pool, ShellResult, ShellLineStream, ADBShellError, batch_command, split_batch_output
+from app.base.prop_cache import prop_cache, parse_getprop
+from app.base.file_index import file_index
+from app.base.pull_cache import pull_cache
+from app.base.content_query import ContentRowParser, content_query_command, iter_content_records
+from itertools import islice
+from app.base.message_store import MessageSource, message_store
+from app.base.records import CallRecord, SmsRecord
+from app.base.call_analytics import DEFAULT_DURATION_BINS, call_analytics_cache, compute_call_analytics
+from app.base.media_store import DOCUMENT_MIME_TYPES, MEDIA_COLLECTIONS, MediaRecord, media_query_command, parse_media_output, record_from_index
+
+# Сколько устройств опрашивается одновременно в запросах по всем устройствам
+MAX_DEVICE_WORKERS = 8
 
 
 class ADBService:
     base_path = "/sdcard/"
     download_url = "http://127.0.0.1:8000/download-file?path="
+    thumbnail_url = "http://127.0.0.1:8000/thumbnail?path="
+
+    # Сколько файлов скачивается одной командой tar (и проверяется одним stat)
+    BULK_PULL_BATCH = 200
+
+    # Сколько файлов одновременно скачивается при сборке отчёта; можно
+    # задать для отдельного устройства через set_pull_workers
+    DEFAULT_PULL_WORKERS = 4
+    MAX_PULL_WORKERS = 16
+    pull_workers: Dict[str, int] = {}
+
+    # Поля get_device_info и соответствующие им системные свойства
+    DEVICE_PROPERTIES = {
+        "brand": "ro.product.brand",
+        "device": "ro.product.device",
+        "model": "ro.product.model",
+    }
+
+    # Разделы get_system_info, которые читаются из снимка getprop
+    SYSTEM_INFO_PROPERTIES = {
+        "device_name": "ro.product.model",
+        "android_version": "ro.build.version.release",
+        "mobile_operator": "gsm.operator.alpha",
+    }
+
+    # Разделы get_system_info и команды, которыми они собираются
+    SYSTEM_INFO_COMMANDS = {
+        "battery": "dumpsys battery",
+        "storage": "df /data",
+        "gps_coordinates": "dumpsys location",
+        "wifi_connections": "dumpsys wifi",
+        "ip_address": "ip a",
+        "network_status": "dumpsys telephony.registry",
+        "installed_apps": "pm list packages",
+    }
+
+    # Разделы, которые можно запросить через /system-info?sections=...,
+    # и поля ответа, которые в них входят
+    SYSTEM_INFO_SECTIONS = {
+        "device": ["device_name", "android_version"],
+        "battery": ["battery"],
+        "storage": ["storage"],
+        "gps": ["gps_coordinates"],
+        "wifi": ["wifi_connections"],
+        "ip": ["ip_address"],
+        "operator": ["mobile_operator"],
+        "network": ["network_status"],
+        "apps": ["installed_apps"],
+    }
+
+    # Колонки, которые запрашиваются у content://sms и content://call_log/calls
+    SMS_COLUMNS = ["_id", "address", "body", "date", "type"]
+    CALL_LOG_COLUMNS = ["_id", "number", "name", "duration", "geocoded_location", "type", "date", "new",
+                        "subscription_id", "block_reason", "subscription_component_name"]
+
+    SMS_ROW_PARSER = ContentRowParser(SMS_COLUMNS)
+    CALL_LOG_ROW_PARSER = ContentRowParser(CALL_LOG_COLUMNS)
+
+    CATEGORY_PATHS = {
+        "images": "/sdcard/DCIM/Camera/",
+        "videos": "/sdcard/DCIM/Camera/",
+        "documents": "/sdcard/Download/"
+    }
+
+    ALLOWED_EXTENSIONS = {
+        "images": ['.jpg', '.jpeg', '.png', '.bmp', '.gif'],
+        "documents": ['.txt', '.log', '.csv', '.json', '.xml',
+                      '.pdf', '.doc', '.docx', '.xls', '.xlsx', '.ppt', '.pptx'],
+        "videos": ['.mp4', '.mov', '.avi', '.mkv', '.3gp', '.webm']
+    }
+
+    @staticmethod
+    def _shell(command: str, serial: Optional[str] = None) -> ShellResult:
+        """Выполняет shell-команду в долгоживущей adb shell сессии устройства"""
+        return shell_pool.run(command, serial=serial)
+
+    @staticmethod
+    def _shell_lines(command: str, serial: Optional[str] = None) -> ShellLineStream:
+        """Построчный вывод команды по мере поступления с устройства"""
+        return shell_pool.stream(command, serial=serial)
+
+    @staticmethod
+    def _adb_args(serial: Optional[str]) -> List[str]:
+        return ["adb", "-s", serial] if serial else ["adb"]
+
+    @staticmethod
+    def list_devices() -> List[str]:
+        """Серийные номера подключенных устройств в состоянии device"""
+        result = subprocess.run(["adb", "devices"], capture_output=True,encoding="utf-8", errors="replace", text=True)
+        lines = result.stdout.split("\n")[1:-1]
+        serials = [line.split("\t")[0] for line in lines if "device" in line]
+        # Снимки свойств и shell-сессии отключенных устройств больше не нужны
+        prop_cache.retain(serials)
+        shell_pool.retain(serials)
+        return serials
+
+    @staticmethod
+    def for_each_device(func, serials: Optional[List[str]] = None) -> dict:
+        """
+        Выполняет func(serial) для каждого устройства параллельно, не более
+        MAX_DEVICE_WORKERS одновременно. Результат - {serial: значение}.
+        """
+        serials = serials or ADBService.list_devices()
+        if not serials:
+            return {}
+
+        def run(serial: str):
+            try:
+                return func(serial)
+            except Exception as e:
+                # Ошибка одного устройства не должна ронять ответ по остальным
+                return {"error": str(e)}
+
+        with ThreadPoolExecutor(max_workers=min(MAX_DEVICE_WORKERS, len(serials))) as executor:
+            return dict(zip(serials, executor.map(run, serials)))
+
+    @staticmethod
+    def get_properties(names, serial: Optional[str] = None) -> dict:
+        """
+        Значения системных свойств устройства. Полный `getprop` выполняется
+        один раз и кешируется (см. PropertyCache), дальше это поиск в словаре.
+        """
+        props = prop_cache.lookup(serial, names)
+        if props is None:
+            prop_cache.store(serial, parse_getprop(ADBService._shell("getprop", serial).stdout))
+            props = prop_cache.lookup(serial, names)
+        return props
+
+    @staticmethod
+    def get_single_device_info(serial: str) -> dict:
+        props = ADBService.get_properties(ADBService.DEVICE_PROPERTIES.values(), serial)
+        info = {
+            # Серийный номер уже есть в выводе `adb devices`, отдельный get-serialno не нужен
+            "serial_number": serial,
+        }
+        info.update({key: props[prop] for key, prop in ADBService.DEVICE_PROPERTIES.items()})
+        return info
 
     @staticmethod
-    def get_device_info():
+    def get_device_info(serial: Optional[str] = None):
         """Получает информацию о подключенных ADB-устройствах"""
         try:
-            # Получаем список устройств
-            result = subprocess.run(["adb", "devices"], capture_output=True,encoding="utf-8", errors="replace", text=True)
-            lines = result.stdout.split("\n")[1:-1]
-            devices = [line.split("\t")[0] for line in lines if "device" in line]
-
-            device_info = []
-            for device in devices:
-                info = {
-                    "serial_number": subprocess.run(["adb", "-s", device, "get-serialno"], capture_output=True,encoding="utf-8", errors="replace", text=True).stdout.strip(),
-                    "brand": subprocess.run(["adb", "-s", device, "shell", "getprop", "ro.product.brand"], capture_output=True,encoding="utf-8", errors="replace", text=True).stdout.strip(),
-                    "device": subprocess.run(["adb", "-s", device, "shell", "getprop", "ro.product.device"], capture_output=True,encoding="utf-8", errors="replace", text=True).stdout.strip(),
-                    "model": subprocess.run(["adb", "-s", device, "shell", "getprop", "ro.product.model"], capture_output=True,encoding="utf-8", errors="replace", text=True).stdout.strip(),
-                    # "full_properties": subprocess.run(["adb", "-s", device, "shell", "getprop"], capture_output=True, text=True).stdout.strip(),
-                }
-                device_info.append(info)
-
+            serials = [serial] if serial else None
+            device_info = list(ADBService.for_each_device(ADBService.get_single_device_info, serials).values())
             return {"device-info": device_info}
         except Exception as e:
             return {"error": str(e)}
@@ -47,278 +192,831 @@ class ADBService:
                 return "images"
             elif mime_type.startswith("video/"):
                 return "videos"
-            elif mime_type in ["application/pdf", "application/msword", 
-                               "application/vnd.openxmlformats-officedocument.wordprocessingml.document",
-                               "application/vnd.ms-excel", 
-                               "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-                               "text/plain"]:
+            elif mime_type in DOCUMENT_MIME_TYPES:
                 return "documents"
         return "others"
 
     @classmethod
-    def list_files(cls, directory: str = ""):
+    def refresh_index(cls, serial: Optional[str] = None):
+        """Дообновляет локальный индекс /sdcard/ устройства, если он устарел"""
+        file_index.ensure_fresh(serial, cls.base_path, lambda command: cls._shell(command, serial))
+
+    @classmethod
+    def list_files(cls, directory: str = "", serial: Optional[str] = None):
         """Синхронно получает список файлов из указанной директории (по умолчанию /sdcard/)"""
         full_path = os.path.join(cls.base_path, directory.strip("/"))
-        return cls._list_files(full_path, recursive=(directory == ""))
+        recursive = directory == ""
+        try:
+            cls.refresh_index(serial)
+            listing = file_index.list_directory(serial, full_path, recursive)
+        except (ADBShellError, sqlite3.Error):
+            listing = None
+        if not listing or not (listing["files"] or listing["directories"]):
+            # Индекс недоступен или директории в нём нет (например, скрытой): читаем с устройства
+            return cls._list_files(full_path, recursive=recursive, serial=serial)
+        return cls._group_indexed_files(listing, serial)
 
     @classmethod
-    def _list_files(cls, path: str, recursive: bool):
-        """Вспомогательная функция для получения списка файлов"""
-        command = f"ls -R {path}" if recursive else f"ls {path}"
+    def file_record(cls, entry: dict, serial: Optional[str] = None) -> dict:
+        """Одна запись постраничного или потокового списка файлов"""
+        return {
+            "name": entry["name"],
+            "path": entry["path"],
+            "type": entry["type"],
+            "category": cls.get_file_category(entry["path"]) if entry["type"] == "file" else "others",
+            "size": entry["size"],
+            "modified": entry["modified"].strftime("%Y-%m-%d %H:%M:%S"),
+            "url": cls.file_url(entry["path"], serial),
+        }
+
+    @classmethod
+    def iter_files(cls, directory: str = "", serial: Optional[str] = None) -> Iterator[dict]:
+        """
+        Записи директории по мере поступления вывода find с устройства:
+        первая запись отдаётся до окончания обхода, весь список в памяти не копится.
+        """
+        full_path = os.path.join(cls.base_path, directory.strip("/"))
+        command = cls.metadata_command(full_path, recursive=(directory == ""))
+        for line in cls._shell_lines(command, serial):
+            entry = cls.parse_metadata_line(line)
+            if entry is not None:
+                yield cls.file_record(entry, serial)
+
+    @staticmethod
+    def encode_cursor(path: str) -> str:
+        return base64.urlsafe_b64encode(path.encode("utf-8")).decode("ascii")
+
+    @staticmethod
+    def decode_cursor(cursor: Optional[str]) -> Optional[str]:
+        if cursor is None:
+            return None
         try:
-            result = subprocess.run(
-                ["adb", "shell", command], capture_output=True, text=True, encoding="utf-8", errors="replace"
-            )
-            output = result.stdout.strip()
+            return base64.b64decode(cursor.encode("ascii"), altchars=b"-_", validate=True).decode("utf-8")
+        except (binascii.Error, UnicodeError, ValueError):
+            raise HTTPException(status_code=400, detail="Некорректный курсор")
 
-            if not output:
-                return {"error": f"Папка {path} пуста или ADB не смог получить файлы."}
+    @classmethod
+    def list_files_page(cls, directory: str = "", cursor: Optional[str] = None, limit: int = 100,
+                        serial: Optional[str] = None) -> dict:
+        """
+        Страница файлов из индекса, упорядоченная по пути. `next_cursor`
+        передаётся в следующий запрос; None - файлов больше нет.
+        """
+        full_path = os.path.join(cls.base_path, directory.strip("/"))
+        after = cls.decode_cursor(cursor)
+        try:
+            cls.refresh_index(serial)
+            entries = file_index.page(serial, full_path, recursive=(directory == ""), after=after, limit=limit + 1)
+        except (ADBShellError, sqlite3.Error) as e:
+            raise HTTPException(status_code=500, detail=f"Ошибка получения списка файлов: {str(e)}")
+        has_more = len(entries) > limit
+        entries = entries[:limit]
+        return {
+            "files": [cls.file_record(entry, serial) for entry in entries],
+            "next_cursor": cls.encode_cursor(entries[-1]["path"]) if has_more else None,
+        }
 
-            files_dict = {"images": [], "videos": [], "documents": [], "others": []}
-            current_dir = path.rstrip("/")
+    @classmethod
+    def _group_indexed_files(cls, listing: dict, serial: Optional[str] = None):
+        """Раскладывает записи индекса по категориям в формате _parse_ls_output"""
+        files_dict = {"images": [], "videos": [], "documents": [], "others": []}
+        for entry in listing["files"]:
+            files_dict[entry["category"]].append(cls.listing_entry(entry["name"], entry["path"], entry["category"], serial))
+        for path in listing["directories"]:
+            files_dict["others"].append({"name": path.rsplit("/", 1)[-1], "url": cls.file_url(path, serial)})
+        return files_dict
 
-            for line in output.split("\n"):
-                if recursive and line.endswith(":"):  
-                    current_dir = line[:-1]  
-                elif line.strip():  
-                    file_path = f"{current_dir}/{line.strip()}"
-                    category = cls.get_file_category(file_path)
-                    file_url = f"{cls.download_url}{urllib.parse.quote(file_path)}"
-                    files_dict[category].append({"name": line.strip(), "url": file_url})
+    @classmethod
+    def indexed_file_paths(cls, directory: str, category: str, limit: int, serial: Optional[str] = None) -> List[str]:
+        """Пути файлов категории в директории: из индекса, а если он недоступен - через list_files"""
+        full_path = os.path.join(cls.base_path, directory.strip("/"))
+        try:
+            cls.refresh_index(serial)
+            entries = file_index.query(serial, FileFilter(extensions=None), directory=full_path,
+                                       category=category, limit=limit)
+            if entries:
+                return [entry["path"] for entry in entries]
+        except (ADBShellError, sqlite3.Error):
+            pass
+        files = cls.list_files(directory, serial).get(category, [])
+        paths = [urllib.parse.parse_qs(urllib.parse.urlparse(file["url"]).query).get("path", [""])[0] for file in files]
+        return [path for path in paths if path][:limit]
 
-            return files_dict
+    @classmethod
+    def _list_files(cls, path: str, recursive: bool, serial: Optional[str] = None):
+        """Вспомогательная функция для получения списка файлов"""
+        command = f"ls -R {path}" if recursive else f"ls {path}"
+        try:
+            output = cls._shell(command, serial).stdout.strip()
+            return cls._parse_ls_output(output, path, recursive, serial)
         except Exception as e:
             return {"error": str(e)}
 
+    @classmethod
+    def list_media(cls, category: Optional[str] = None, limit: Optional[int] = None,
+                   serial: Optional[str] = None) -> dict:
+        """
+        Изображения, видео и документы из каталога MediaStore (`content query`
+        с projection и сортировкой на устройстве) вместо обхода `ls -R`.
+        Если провайдер недоступен, записи берутся из индекса файлов.
+        """
+        categories = [category] if category else list(MEDIA_COLLECTIONS)
+        unknown = [name for name in categories if name not in MEDIA_COLLECTIONS]
+        if unknown:
+            raise HTTPException(status_code=400, detail="Неизвестная категория")
+
+        media = {}
+        for name in categories:
+            records = cls.query_media(name, serial)
+            if records is None:
+                records = cls.indexed_media(name, serial)
+            media[name] = [
+                dict(record.to_dict(), url=cls.file_url(record.path, serial),
+                     thumbnail=cls.file_url(record.path, serial, cls.thumbnail_url))
+                for record in records[:limit]
+            ]
+        return media
+
+    @classmethod
+    def query_media(cls, category: str, serial: Optional[str] = None) -> Optional[List[MediaRecord]]:
+        """Записи MediaStore категории или None, если провайдер недоступен"""
+        try:
+            result = cls._shell(media_query_command(category), serial)
+        except ADBShellError:
+            return None
+        if result.returncode != 0:
+            return None
+        return parse_media_output(result.stdout, category)
+
+    @classmethod
+    def indexed_media(cls, category: str, serial: Optional[str] = None) -> List[MediaRecord]:
+        """Файлы категории из индекса файлов, новые первыми"""
+        try:
+            cls.refresh_index(serial)
+            entries = file_index.query(serial, FileFilter(extensions=None), category=category)
+        except (ADBShellError, sqlite3.Error) as e:
+            raise HTTPException(status_code=500, detail=f"Ошибка получения списка файлов: {str(e)}")
+        return [record_from_index(entry) for entry in entries]
+
+    @classmethod
+    def file_url(cls, file_path: str, serial: Optional[str] = None, base_url: Optional[str] = None) -> str:
+        url = f"{base_url or cls.download_url}{urllib.parse.quote(file_path)}"
+        if serial:
+            url += f"&serial={urllib.parse.quote(serial)}"
+        return url
+
+    @classmethod
+    def listing_entry(cls, name: str, file_path: str, category: str, serial: Optional[str] = None) -> dict:
+        """Запись списка файлов; у изображений и видео есть ссылка на превью"""
+        entry = {"name": name, "url": cls.file_url(file_path, serial)}
+        if category in ("images", "videos"):
+            entry["thumbnail"] = cls.file_url(file_path, serial, cls.thumbnail_url)
+        return entry
+
+    @classmethod
+    def _parse_ls_output(cls, output: str, path: str, recursive: bool, serial: Optional[str] = None):
+        """Раскладывает вывод `ls`/`ls -R` по категориям файлов"""
+        if not output:
+            return {"error": f"Папка {path} пуста или ADB не смог получить файлы."}
+
+        files_dict = {"images": [], "videos": [], "documents": [], "others": []}
+        current_dir = path.rstrip("/")
+
+        for line in output.split("\n"):
+            if recursive and line.endswith(":"):  
+                current_dir = line[:-1]  
+            elif line.strip():  
+                file_path = f"{current_dir}/{line.strip()}"
+                category = cls.get_file_category(file_path)
+                files_dict[category].append(cls.listing_entry(line.strip(), file_path, category, serial))
+
+        return files_dict
+
+    @staticmethod
+    def remote_stat(path: str, serial: Optional[str] = None) -> Tuple[int, int]:
+        """Размер и mtime файла на устройстве"""
+        result = ADBService._shell(f"stat -L -c '%s|%Y' {shlex.quote(path)}", serial)
+        size, _, mtime = result.stdout.strip().partition("|")
+        if result.returncode != 0 or not size.isdigit() or not mtime.isdigit():
+            raise HTTPException(status_code=404, detail=f"Файл не найден на устройстве: {path}")
+        return int(size), int(mtime)
+
     @staticmethod
-    def download_file(path: str, output_dir: str = "downloads/"):
-        """Скачивает файл с устройства и сохраняет его на сервере""" 
+    def parse_byte_range(header: Optional[str], size: int) -> Optional[Tuple[int, int]]:
+        """
+        Заголовок Range ("bytes=a-b", "bytes=a-", "bytes=-n") в пару
+        (начало, конец включительно). None - отдать файл целиком: заголовка
+        нет, он не в байтах или диапазонов несколько.
+        """
+        if not header or not header.startswith("bytes=") or "," in header:
+            return None
+        first, sep, last = header[len("bytes="):].strip().partition("-")
+        if not sep or not (first or last) or (first and not first.isdigit()) or (last and not last.isdigit()):
+            return None
+        if first:
+            start, end = int(first), min(int(last), size - 1) if last else size - 1
+        else:
+            # "-n": последние n байт ("-0" не выполним)
+            start, end = size - min(int(last), size) if int(last) else size, size - 1
+        if start > end:
+            raise HTTPException(status_code=416, detail="Запрошенный диапазон вне файла",
+                                headers={"Content-Range": f"bytes */{size}"})
+        return start, end
+
+    @staticmethod
+    def range_command(path: str, start: int = 0, length: Optional[int] = None) -> Optional[str]:
+        """
+        Команда, которая выводит `length` байт файла со смещения `start`
+        (None - нужен весь файл). tail -c +N на обычном файле делает lseek,
+        а не читает начало файла.
+        """
+        quoted = shlex.quote(path)
+        if start == 0:
+            return None if length is None else f"head -c {length} {quoted}"
+        command = f"tail -c +{start + 1} {quoted}"
+        return command if length is None else f"{command} | head -c {length}"
+
+    @staticmethod
+    def download_file(path: str, serial: Optional[str] = None,
+                      size: Optional[int] = None, mtime: Optional[int] = None) -> str:
+        """
+        Локальная копия файла с устройства из pull_cache; скачивается, только
+        если этой версии файла (размер и mtime) в кеше ещё нет. Размер и
+        mtime можно передать, если они уже известны из листинга.
+        """
+        if size is None or mtime is None:
+            size, mtime = ADBService.remote_stat(path, serial)
+
+        def pull(local_path: str):
+            subprocess.run(ADBService._adb_args(serial) + ["pull", path, local_path],
+                           encoding="utf-8", errors="replace", check=True, capture_output=True)
+
         try:
-            os.makedirs(output_dir, exist_ok=True)  # Создаем папку для скачивания, если ее нет
-            local_file_path = os.path.join(output_dir, os.path.basename(path))  # Имя файла на локальной машине
-            subprocess.run(["adb", "pull", path, local_file_path],encoding="utf-8", errors="replace", check=True)
-            
-            # Возвращаем путь к скачанному файлу
-            return local_file_path
+            return pull_cache.get_or_pull(serial, path, size, mtime, pull)
         except subprocess.CalledProcessError as e:
-            raise HTTPException(status_code=500, detail=f"Ошибка при скачивании файла: {str(e)}")
-            
+            raise HTTPException(status_code=500, detail=f"Ошибка при скачивании файла: {e.stderr or e.stdout or str(e)}")
+
+    @classmethod
+    def get_pull_workers(cls, serial: Optional[str] = None) -> int:
+        return cls.pull_workers.get(serial or "", cls.DEFAULT_PULL_WORKERS)
+
+    @classmethod
+    def set_pull_workers(cls, serial: Optional[str], workers: Optional[int]) -> int:
+        """Число параллельных скачиваний для устройства (None - значение по умолчанию)"""
+        if workers is None:
+            cls.pull_workers.pop(serial or "", None)
+        elif not 1 <= workers <= cls.MAX_PULL_WORKERS:
+            raise HTTPException(status_code=400, detail=f"Число потоков должно быть от 1 до {cls.MAX_PULL_WORKERS}")
+        else:
+            cls.pull_workers[serial or ""] = workers
+        return cls.get_pull_workers(serial)
+
+    @staticmethod
+    def stat_files(paths: List[str], serial: Optional[str] = None) -> Dict[str, Tuple[int, int]]:
+        """Размер и mtime нескольких файлов (отсутствующих в ответе нет)"""
+        stats = {}
+        for start in range(0, len(paths), ADBService.BULK_PULL_BATCH):
+            quoted = " ".join(shlex.quote(path) for path in paths[start:start + ADBService.BULK_PULL_BATCH])
+            # Код возврата не проверяется: stat печатает найденные файлы, даже если каких-то нет
+            for line in ADBService._shell(f"stat -L -c '%s|%Y|%n' {quoted}", serial).stdout.split("\n"):
+                size, _, rest = line.rstrip("\r").partition("|")
+                mtime, _, path = rest.partition("|")
+                if size.isdigit() and mtime.isdigit() and path:
+                    stats[path] = (int(size), int(mtime))
+        return stats
+
     @staticmethod
-    def get_call_logs():
+    def tar_command(paths: List[str], compress: bool = False) -> str:
+        return f"tar c{'z' if compress else ''}f - {' '.join(shlex.quote(path) for path in paths)} 2>/dev/null"
+
+    @staticmethod
+    def _pull_tar(paths: List[str], serial: Optional[str], compress: bool) -> Dict[str, str]:
+        """
+        Скачивает файлы одним `adb exec-out tar c` и по мере чтения архива
+        раскладывает их в pull_cache. Ключом служат размер и mtime из
+        заголовков архива.
+        """
+        wanted = set(paths)
+        pulled = {}
+        process = subprocess.Popen(
+            ADBService._adb_args(serial) + ["exec-out", ADBService.tar_command(paths, compress)],
+            stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+        )
         try:
-            # Выполняем команду ADB для получения данных звонков
-            result = subprocess.run(
-                ["adb", "shell", "content", "query", "--uri", "content://call_log/calls"],
-                capture_output=True,
-                text=True,
-                encoding="utf-8",
-                errors="replace"
-            )
+            with tarfile.open(fileobj=process.stdout, mode="r|gz" if compress else "r|") as archive:
+                for member in archive:
+                    # tar убирает ведущий "/" из имён
+                    path = "/" + member.name.lstrip("/")
+                    if not member.isfile() or path not in wanted:
+                        continue
+                    pulled[path] = pull_cache.store(serial, path, member.size, int(member.mtime),
+                                                    archive.extractfile(member))
+        except tarfile.TarError:
+            # Пустой или оборванный архив: недостающие файлы скачаются по одному
+            pass
+        finally:
+            if process.poll() is None:
+                process.kill()
+            process.wait()
+        return pulled
 
-            if result.returncode != 0:
-                return {"error": "Ошибка при выполнении ADB команды", "details": result.stderr}
+    @staticmethod
+    def pull_files(paths: List[str], serial: Optional[str] = None,
+                   stats: Optional[Dict[str, Tuple[int, int]]] = None,
+                   compress: bool = False) -> Dict[str, str]:
+        """
+        Локальные копии нескольких файлов: путь на устройстве -> путь в
+        pull_cache. Файлы, которых нет в кеше, скачиваются пачками по
+        BULK_PULL_BATCH одним потоком tar вместо отдельного `adb pull` на
+        каждый файл; то, что не пришло в архиве, скачивается по одному.
+        Файлов, которых нет на устройстве, в ответе нет. `stats` - уже
+        известные размеры и mtime (например, из листинга).
+        """
+        stats = dict(stats or {})
+        unknown = [path for path in paths if path not in stats]
+        if unknown:
+            stats.update(ADBService.stat_files(unknown, serial))
+
+        local_paths, missing = {}, []
+        for path in dict.fromkeys(paths):
+            if path not in stats:
+                continue
+            cached = pull_cache.lookup(serial, path, *stats[path])
+            if cached is not None:
+                local_paths[path] = cached
+            else:
+                missing.append(path)
+
+        for start in range(0, len(missing), ADBService.BULK_PULL_BATCH):
+            local_paths.update(ADBService._pull_tar(missing[start:start + ADBService.BULK_PULL_BATCH], serial, compress))
+
+        for path in missing:
+            if path not in local_paths:
+                try:
+                    local_paths[path] = ADBService.download_file(path, serial, *stats[path])
+                except HTTPException:
+                    pass
+        return local_paths
 
-            raw_data = result.stdout.strip().split("\n")
-            parsed_logs = [ADBService.parse_call_log(log) for log in raw_data if log.strip()]
-            return {"call_logs": parsed_logs}
+    @staticmethod
+    def export_archive(local_paths: Dict[str, str], output_dir: str = os.path.join("output", "exports")) -> str:
+        """ZIP с локальными копиями файлов; внутри архива - пути как на устройстве"""
+        os.makedirs(output_dir, exist_ok=True)
+        archive_path = os.path.join(output_dir, f"export_{uuid.uuid4().hex}.zip")
+        # Медиафайлы уже сжаты, поэтому файлы кладутся без сжатия
+        with zipfile.ZipFile(archive_path, "w", zipfile.ZIP_STORED, allowZip64=True) as archive:
+            for path, local_path in local_paths.items():
+                archive.write(local_path, path.lstrip("/"))
+        return archive_path
 
+    @staticmethod
+    def content_where(contact_column: str, contact: Optional[str] = None,
+                      date_from: Optional[str] = None, date_to: Optional[str] = None) -> Optional[str]:
+        """
+        Условие --where для content query: часть номера и диапазон дат
+        (YYYY-MM-DD, включительно) по колонке date в миллисекундах.
+        """
+        conditions = []
+        if contact:
+            escaped = contact.replace("'", "''").replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+            conditions.append(f"{contact_column} LIKE '%{escaped}%' ESCAPE '\\'")
+        if date_from:
+            conditions.append(f"date >= {int(ADBService.parse_day(date_from).timestamp() * 1000)}")
+        if date_to:
+            end = ADBService.parse_day(date_to) + timedelta(days=1)
+            conditions.append(f"date < {int(end.timestamp() * 1000)}")
+        return " AND ".join(conditions) or None
+
+    @staticmethod
+    def parse_day(value: str) -> datetime:
+        try:
+            return datetime.strptime(value, "%Y-%m-%d")
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Дата должна быть в формате YYYY-MM-DD")
+
+    @staticmethod
+    def _shell_stdout(command: str, serial: Optional[str] = None) -> str:
+        """stdout команды; ненулевой код возврата - ADBShellError"""
+        result = ADBService._shell(command, serial)
+        if result.returncode != 0:
+            raise ADBShellError(f"Команда завершилась с кодом {result.returncode}: {result.stdout.strip()}")
+        return result.stdout
+
+    @staticmethod
+    def stored_rows(kind: str, serial: Optional[str] = None, contact: Optional[str] = None,
+                    date_from: Optional[str] = None, date_to: Optional[str] = None,
+                    limit: Optional[int] = None, sync: bool = True) -> List[dict]:
+        """
+        Строки SMS или журнала звонков из локальной копии (см. MessageStore)
+        после дочитывания новых строк с устройства (sync=False - без него,
+        если вызывающий код уже синхронизировал копию).
+        """
+        for day in (date_from, date_to):
+            if day:
+                ADBService.parse_day(day)
+        if sync:
+            ADBService.sync_messages(kind, serial)
+        return message_store.query(serial, kind, contact, date_from, date_to, limit)
+
+    @staticmethod
+    def sync_messages(kind: str, serial: Optional[str] = None):
+        """Дочитывает в локальную копию новые строки SMS или журнала звонков"""
+        try:
+            message_store.ensure_synced(serial, kind, lambda command: ADBService._shell_stdout(command, serial))
+        except ADBShellError:
+            # Устройство недоступно: отдаём то, что уже синхронизировано
+            if not message_store.has_data(serial, kind):
+                raise
+
+    @staticmethod
+    def call_log_query_command(number: Optional[str] = None, date_from: Optional[str] = None,
+                               date_to: Optional[str] = None, limit: Optional[int] = None) -> str:
+        """content query по журналу звонков: нужные колонки, фильтр и сортировка на устройстве"""
+        # CallLogProvider понимает ограничение числа строк через параметр URI
+        uri = "content://call_log/calls" + (f"?limit={limit}" if limit else "")
+        where = ADBService.content_where("number", number, date_from, date_to)
+        return content_query_command(uri, ADBService.CALL_LOG_COLUMNS, where, "date DESC")
+
+    @staticmethod
+    def sms_query_command(contact: Optional[str] = None, date_from: Optional[str] = None,
+                          date_to: Optional[str] = None, limit: Optional[int] = None) -> str:
+        """content query по SMS: нужные колонки, фильтр и сортировка на устройстве"""
+        # SmsProvider передаёт sort order в SQLite как есть, так что LIMIT дописывается к нему
+        sort = "date DESC" + (f" LIMIT {limit}" if limit else "")
+        where = ADBService.content_where("address", contact, date_from, date_to)
+        return content_query_command("content://sms", ADBService.SMS_COLUMNS, where, sort)
+
+    @staticmethod
+    def get_call_records(serial: Optional[str] = None, number: Optional[str] = None, date_from: Optional[str] = None,
+                         date_to: Optional[str] = None, limit: Optional[int] = None,
+                         sync: bool = True) -> List[CallRecord]:
+        """Звонки из локальной копии журнала, а если она недоступна - напрямую с устройства"""
+        try:
+            rows = ADBService.stored_rows("calls", serial, number, date_from, date_to, limit, sync)
+        except sqlite3.Error:
+            command = ADBService.call_log_query_command(number, date_from, date_to, limit)
+            rows = ADBService.stream_content_rows(command, ADBService.CALL_LOG_COLUMNS, limit, serial)
+        return [CallRecord.from_row(row) for row in rows]
+
+    @staticmethod
+    def get_call_logs(serial: Optional[str] = None, number: Optional[str] = None, date_from: Optional[str] = None,
+                      date_to: Optional[str] = None, limit: Optional[int] = None):
+        try:
+            records = ADBService.get_call_records(serial, number, date_from, date_to, limit)
+            return {"call_logs": [record.to_display() for record in records]}
+        except HTTPException:
+            raise
         except Exception as e:
             return {"error": "Ошибка обработки", "details": str(e)}
 
     @staticmethod
-    def parse_call_log(log: str):
-        log_dict = dict(re.findall(r"(\w+)=([^,]+)", log))
-        
-        # Преобразуем timestamp в нормальную дату
-        timestamp = log_dict.get("date", "0")
-        formatted_date = (
-            datetime.fromtimestamp(int(timestamp) / 1000).strftime('%Y-%m-%d %H:%M:%S') 
-            if timestamp.isdigit() else "Неизвестно"
+    def get_call_analytics(serial: Optional[str] = None, number: Optional[str] = None, date_from: Optional[str] = None,
+                           date_to: Optional[str] = None, bins: Optional[List[int]] = None) -> dict:
+        """
+        Сводка по звонкам (см. compute_call_analytics). Пока в локальной
+        копии журнала ничего не меняется, повторный запрос берёт готовую сводку.
+        """
+        bins = tuple(bins or ())
+        timezone = ADBService.device_timezone(serial)
+        # Копия журнала синхронизируется один раз, ниже; сводка читает её без повторной синхронизации
+        compute = lambda: compute_call_analytics(
+            ADBService.get_call_records(serial, number, date_from, date_to, sync=False),
+            bins or DEFAULT_DURATION_BINS, timezone,
+        )
+        try:
+            ADBService.sync_messages("calls", serial)
+            version = message_store.version(serial, "calls")
+        except sqlite3.Error:
+            return compute()
+        return call_analytics_cache.get_or_compute(
+            (serial or "", number, date_from, date_to, bins, timezone, version), compute
         )
 
-        # Читаемые типы звонков
-        call_types = {
-            "1": "Входящий",
-            "2": "Исходящий",
-            "3": "Пропущенный",
-            "4": "Голосовая почта",
-            "5": "Отклонённый",
-            "6": "Заблокированный",
-            "7": "Внешне отвеченный"
-        }
+    @staticmethod
+    def device_timezone(serial: Optional[str] = None) -> Optional[str]:
+        """Часовой пояс устройства (persist.sys.timezone); None - устройство недоступно"""
+        try:
+            return ADBService.get_properties(["persist.sys.timezone"], serial).get("persist.sys.timezone") or None
+        except Exception:
+            return None
 
-        # Читаемые причины блокировки
-        block_reasons = {
-            "0": "Нет блокировки",
-            "1": "Заблокирован пользователем",
-            "2": "Фильтрация спама",
-            "3": "Системная блокировка"
-        }
+    @staticmethod
+    def stream_content_rows(command: str, columns: List[str], limit: Optional[int] = None,
+                            serial: Optional[str] = None) -> List[dict]:
+        """Строки `content query`, разобранные по мере поступления вывода с устройства"""
+        lines = ADBService._shell_lines(command, serial)
+        rows = list(islice(iter_content_records(lines, columns), limit))
+        if lines.returncode not in (0, None) and not rows:
+            raise ADBShellError(f"Ошибка при выполнении ADB команды, код возврата {lines.returncode}")
+        return rows
 
-        return {
-            "ID звонка": log_dict.get("_id", "Неизвестно"),
-            "Номер": log_dict.get("number", "Неизвестно"),
-            "Контакт": log_dict.get("name", "Неизвестно"),
-            "Длительность": log_dict.get("duration", "0") + " сек",
-            "Страна": log_dict.get("geocoded_location", "Неизвестно"),
-            "Тип вызова": call_types.get(log_dict.get("type"), log_dict.get("type", "Неизвестный")),
-            "Дата": formatted_date,
-            "Новый вызов": "Да" if log_dict.get("new", "0") == "1" else "Нет",
-            "Пропущенный": "Да" if log_dict.get("duration", "0") == "0" else "Нет",
-            "SIM-карта (ID)": log_dict.get("subscription_id", "Неизвестно"),
-            "Причина блокировки": block_reasons.get(log_dict.get("block_reason", "0"), "Неизвестно"),
-            "Учётная запись телефона": log_dict.get("subscription_component_name", "Неизвестно")
-        }
+    @staticmethod
+    def parse_call_log(log: str):
+        return CallRecord.from_row(ADBService.CALL_LOG_ROW_PARSER(log)).to_display()
 
     @staticmethod
-    def get_sms_messages():
+    def get_sms_records(serial: Optional[str] = None, contact: Optional[str] = None, date_from: Optional[str] = None,
+                        date_to: Optional[str] = None, limit: Optional[int] = None,
+                        sync: bool = True) -> List[SmsRecord]:
+        """SMS из локальной копии, а если она недоступна - напрямую с устройства"""
         try:
-            result = subprocess.run(
-                ["adb", "shell", "content", "query", "--uri", "content://sms"],
-                capture_output=True,
-                text=True,
-                encoding="utf-8",
-                errors="replace"
-            )
-
-            if result.returncode != 0:
-                return {"error": "Ошибка выполнения ADB команды", "details": result.stderr}
-
-            raw_data = result.stdout.strip().split("\n")
-            parsed_messages = [ADBService.parse_sms(log) for log in raw_data if log.strip()]
-            return {"sms_messages": parsed_messages}
+            rows = ADBService.stored_rows("sms", serial, contact, date_from, date_to, limit, sync)
+        except sqlite3.Error:
+            command = ADBService.sms_query_command(contact, date_from, date_to, limit)
+            rows = ADBService.stream_content_rows(command, ADBService.SMS_COLUMNS, limit, serial)
+        return [SmsRecord.from_row(row) for row in rows]
 
+    @staticmethod
+    def get_sms_messages(serial: Optional[str] = None, contact: Optional[str] = None, date_from: Optional[str] = None,
+                         date_to: Optional[str] = None, limit: Optional[int] = None):
+        try:
+            records = ADBService.get_sms_records(serial, contact, date_from, date_to, limit)
+            return {"sms_messages": [record.to_display() for record in records]}
+        except HTTPException:
+            raise
         except Exception as e:
             return {"error": "Ошибка обработки", "details": str(e)}
 
     @staticmethod
     def parse_sms(log: str):
-        log_dict = dict(re.findall(r"(\w+)=([^,]+)", log))
-
-        timestamp = log_dict.get("date", "0")
-        formatted_date = datetime.fromtimestamp(int(timestamp) / 1000).strftime('%Y-%m-%d %H:%M:%S') if timestamp.isdigit() else "Неизвестно"
+        return SmsRecord.from_row(ADBService.SMS_ROW_PARSER(log)).to_display()
+    
+    @staticmethod
+    def system_info_fields(sections: Optional[List[str]] = None) -> List[str]:
+        """Поля ответа для выбранных разделов (все поля, если разделы не указаны)"""
+        if not sections:
+            return list(ADBService.SYSTEM_INFO_PROPERTIES) + list(ADBService.SYSTEM_INFO_COMMANDS)
+        unknown = [section for section in sections if section not in ADBService.SYSTEM_INFO_SECTIONS]
+        if unknown:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Неизвестные разделы: {', '.join(unknown)}. "
+                       f"Доступны: {', '.join(ADBService.SYSTEM_INFO_SECTIONS)}"
+            )
+        return [field for section in sections for field in ADBService.SYSTEM_INFO_SECTIONS[section]]
 
-        sms_types = {
-            "1": "Входящее",
-            "2": "Исходящее"
-        }
+    @staticmethod
+    def system_info_batch(fields: List[str]):
+        """Один shell-скрипт для всех команд выбранных полей: (скрипт, token) или None"""
+        commands = {field: ADBService.SYSTEM_INFO_COMMANDS[field] for field in fields if field in ADBService.SYSTEM_INFO_COMMANDS}
+        return batch_command(commands) if commands else None
 
-        return {
-            "ID": log_dict.get("_id", "Неизвестно"),
-            "Номер": log_dict.get("address", "Неизвестно"),
-            "Текст": log_dict.get("body", "Неизвестно"),
-            "Дата": formatted_date,
-            "Тип": sms_types.get(log_dict.get("type", "1"), "Неизвестно")
-        }
-    
     @staticmethod 
-    def get_system_info():
+    def get_system_info(serial: Optional[str] = None, sections: Optional[List[str]] = None):
         """Получает системную информацию, сетевые данные, список приложений и GPS-координаты устройства"""
+        fields = ADBService.system_info_fields(sections)
         try:
-            # Получаем основную информацию
-            system_info = {
-                "device_name": subprocess.run(["adb", "shell", "getprop", "ro.product.model"], capture_output=True,encoding="utf-8", errors="replace", text=True).stdout.strip(),
-                "android_version": subprocess.run(["adb", "shell", "getprop", "ro.build.version.release"], capture_output=True,encoding="utf-8", errors="replace", text=True).stdout.strip(),
-                "battery": subprocess.run(["adb", "shell", "dumpsys", "battery"], capture_output=True,encoding="utf-8", errors="replace", text=True).stdout.strip(),
-                "storage": subprocess.run(["adb", "shell", "df", "/data"], capture_output=True,encoding="utf-8", errors="replace", text=True).stdout.strip()
-            }
-
-            # Получаем GPS-координаты
-            gps_output = subprocess.run(["adb", "shell", "dumpsys", "location"], capture_output=True, text=True).stdout.strip()
+            # Все выбранные команды выполняются одним скриптом за один проход по устройству
+            outputs = {}
+            batch = ADBService.system_info_batch(fields)
+            if batch:
+                script, token = batch
+                outputs = split_batch_output(ADBService._shell(script, serial).stdout, token)
+
+            prop_names = [ADBService.SYSTEM_INFO_PROPERTIES[field] for field in fields if field in ADBService.SYSTEM_INFO_PROPERTIES]
+            props = ADBService.get_properties(prop_names, serial) if prop_names else {}
+            return ADBService.build_system_info(fields, outputs, props)
+        
+        except Exception as e:
+            return {"error": str(e)}
+
+    @staticmethod
+    def build_system_info(fields: List[str], outputs: dict, props: dict) -> dict:
+        """Собирает ответ get_system_info из выводов SYSTEM_INFO_COMMANDS и свойств устройства"""
+        system_info = {}
+        for field in fields:
+            if field in ADBService.SYSTEM_INFO_PROPERTIES:
+                system_info[field] = props.get(ADBService.SYSTEM_INFO_PROPERTIES[field], "")
+            else:
+                system_info[field] = outputs.get(field, "").strip()
+
+        # Получаем GPS-координаты
+        if "gps_coordinates" in system_info:
+            gps_output = system_info["gps_coordinates"]
             gps_match = re.search(r"Latitude:\s+([-0-9.]+).*Longitude:\s+([-0-9.]+)", gps_output, re.DOTALL)
             system_info["gps_coordinates"] = {"latitude": gps_match.group(1), "longitude": gps_match.group(2)} if gps_match else "GPS данные не найдены или отключены."
 
-            # Получаем сетевую информацию
-            system_info["wifi_connections"] = subprocess.run(["adb", "shell", "dumpsys", "wifi"], capture_output=True,encoding="utf-8", errors="replace", text=True).stdout.strip()
-            system_info["ip_address"] = subprocess.run(["adb", "shell", "ip", "a"], capture_output=True,encoding="utf-8", errors="replace", text=True).stdout.strip()
-            system_info["mobile_operator"] = subprocess.run(["adb", "shell", "getprop", "gsm.operator.alpha"], capture_output=True,encoding="utf-8", errors="replace", text=True).stdout.strip()
-            system_info["network_status"] = subprocess.run(["adb", "shell", "dumpsys", "telephony.registry"], capture_output=True,encoding="utf-8", errors="replace", text=True).stdout.strip()
+        return system_info
 
-            # Получаем список установленных приложений
-            system_info["installed_apps"] = subprocess.run(["adb", "shell", "pm", "list", "packages"], capture_output=True,encoding="utf-8", errors="replace", text=True).stdout.strip()
+    @staticmethod
+    def get_sms_count(serial: Optional[str] = None) -> int:
+        """Количество SMS на устройстве (тянется только колонка _id)"""
+        result = ADBService._shell("content query --uri content://sms --projection _id", serial)
+        return ADBService.count_content_rows(result.stdout)
 
-            return system_info
-        
-        except Exception as e:
-            return {"error": str(e)}
+    @staticmethod
+    def count_content_rows(output: str) -> int:
+        return sum(1 for line in output.split("\n") if line.startswith("Row:"))
 
     @staticmethod
-    def list_files_with_metadata(adb_path: str) -> List[dict]:
-        try:
-            result = subprocess.check_output(
-                ["adb", "shell", f"ls -1 \"{adb_path}\""],
-                encoding="utf-8", errors="replace"
-            )
-            filenames = result.strip().split("\n")
-            files = []
+    def get_storage(serial: Optional[str] = None) -> dict:
+        return ADBService.parse_df(ADBService._shell("df /data", serial).stdout)
 
-            for filename in filenames:
-                filename = filename.strip()
-                if not filename:
-                    continue
+    @staticmethod
+    def parse_df(output: str) -> dict:
+        """Разбирает строку `df /data`: размер, занято, свободно (в КБ) и процент"""
+        lines = [line for line in output.strip().split("\n") if line.strip()]
+        if len(lines) < 2:
+            return {"error": "Не удалось получить данные о хранилище"}
+        fields = lines[-1].split()
+        if len(fields) < 6:
+            return {"error": "Не удалось получить данные о хранилище"}
+        return {
+            "filesystem": fields[0],
+            "size_kb": fields[1],
+            "used_kb": fields[2],
+            "available_kb": fields[3],
+            "use_percent": fields[4],
+            "mounted_on": fields[5],
+        }
 
-                full_path = os.path.join(adb_path.rstrip("/"), filename).replace("\\", "/")
+    # size | mtime (epoch) | mtime (локальное время устройства) | права | тип | путь
+    STAT_FORMAT = "%s|%Y|%y|%a|%F|%n"
 
-                try:
-                    stat_output = subprocess.check_output(
-                        ["adb", "shell", f"stat \"{full_path}\""],
-                        encoding="utf-8", errors="replace"
-                    )
+    FILE_TYPES = {
+        "regular file": "file",
+        "regular empty file": "file",
+        "directory": "directory",
+        "symbolic link": "symlink",
+    }
 
-                    match = re.search(r"Modify:\s+(\d{4}-\d{2}-\d{2})\s+(\d{2}:\d{2}:\d{2})", stat_output)
-                    if not match:
-                        continue
+    @staticmethod
+    def metadata_command(adb_path: str, recursive: bool = False, predicates: str = "") -> str:
+        """
+        find + stat -c по директории; скрытые файлы пропускаются, как в `ls`.
+        `predicates` - дополнительные условия find (см. FileFilter).
+        """
+        depth = "" if recursive else "-maxdepth 1 "
+        # Завершающий "/" обязателен: /sdcard - символическая ссылка, и без него find её не раскрывает
+        path = shlex.quote(adb_path.rstrip("/") + "/")
+        filters = f"{predicates} " if predicates else ""
+        return (f"find {path} -mindepth 1 {depth}-name '.*' -prune -o "
+                f"{filters}-exec stat -c '{ADBService.STAT_FORMAT}' {{}} +")
 
-                    date_str = f"{match.group(1)} {match.group(2)}"
-                    mod_time = datetime.strptime(date_str, "%Y-%m-%d %H:%M:%S")
+    @staticmethod
+    def parse_metadata_line(line: str) -> Optional[dict]:
+        fields = line.split("|", 5)
+        if len(fields) != 6 or not fields[0].isdigit():
+            return None
+        size, mtime, modified, mode, file_type, full_path = fields
+        try:
+            modified_dt = datetime.strptime(modified[:19], "%Y-%m-%d %H:%M:%S")
+        except ValueError:
+            return None
+        return {
+            "path": full_path,
+            "name": full_path.rsplit("/", 1)[-1],
+            "size": int(size),
+            "mtime": int(mtime) if mtime.isdigit() else 0,
+            "modified": modified_dt,
+            "mode": mode,
+            "type": ADBService.FILE_TYPES.get(file_type, "other"),
+        }
 
-                    files.append({
-                        "path": full_path,
-                        "name": filename,
-                        "modified": mod_time
-                    })
+    @staticmethod
+    def parse_metadata_output(output: str) -> List[dict]:
+        """Разбирает вывод metadata_command за один проход"""
+        files = []
+        for line in output.split("\n"):
+            entry = ADBService.parse_metadata_line(line.rstrip("\r"))
+            if entry is not None:
+                files.append(entry)
+        return files
 
-                except subprocess.CalledProcessError:
-                    continue  # Пропустить файл, если `stat` не сработал
+    @staticmethod
+    def filter_files_by_category(category: str, date_after: str, date_before: Optional[str], limit: int,
+                                 serial: Optional[str] = None, extensions: Optional[List[str]] = None,
+                                 min_size: Optional[int] = None, max_size: Optional[int] = None,
+                                 name: Optional[str] = None) -> List[dict]:
+        """
+        Файлы категории из локального индекса (см. FileIndex). Если индекс
+        недоступен, файлы фильтруются на устройстве: условия компилируются
+        в выражение find, так что по USB приходят только подходящие строки,
+        а из потока выбираются `limit` самых новых без сортировки всего списка.
+        """
+        adb_path = ADBService.category_path(category)
+        file_filter = FileFilter.for_category(category, date_after, date_before, extensions, min_size, max_size, name)
 
-            return files
+        try:
+            # Основной путь - запрос к локальному индексу без обхода устройства
+            ADBService.refresh_index(serial)
+            return file_index.query(serial, file_filter, directory=adb_path, limit=limit)
+        except (ADBShellError, sqlite3.Error):
+            pass
 
-        except subprocess.CalledProcessError as e:
+        try:
+            stream = ADBService._shell_lines(
+                ADBService.metadata_command(adb_path, predicates=file_filter.find_predicates()), serial
+            )
+            files = ADBService.top_files(stream, file_filter, limit)
+            if stream.returncode != 0 and not files:
+                # Старый toybox find может не знать -newermt: фильтруем даты на сервере
+                stream = ADBService._shell_lines(
+                    ADBService.metadata_command(adb_path, predicates=file_filter.find_predicates(with_dates=False)), serial
+                )
+                files = ADBService.top_files(stream, file_filter, limit)
+            return files
+        except ADBShellError as e:
             raise HTTPException(status_code=500, detail=f"Ошибка получения списка файлов: {str(e)}")
 
-    
-    
     @staticmethod
-    def filter_files_by_category(category: str, date_after: str, date_before: Optional[str], limit: int) -> List[dict]:
-        category = category.lower()
-    
-        path_map = {
-            "images": "/sdcard/DCIM/Camera/",
-            "videos": "/sdcard/DCIM/Camera/",
-            "documents": "/sdcard/Download/"
-        }
-    
-        ALLOWED_EXTENSIONS = {
-            "images": ['.jpg', '.jpeg', '.png', '.bmp', '.gif'],
-            "documents": ['.txt', '.log', '.csv', '.json', '.xml',
-                          '.pdf', '.doc', '.docx', '.xls', '.xlsx', '.ppt', '.pptx'],
-            "videos": ['.mp4', '.mov', '.avi', '.mkv', '.3gp', '.webm']
-        }
-    
-        adb_path = path_map.get(category)
+    def top_files(lines, file_filter: "FileFilter", limit: int) -> List[dict]:
+        """`limit` самых новых подходящих файлов из потока строк metadata_command"""
+        heap = []
+        for index, line in enumerate(lines):
+            entry = ADBService.parse_metadata_line(line)
+            if entry is None or not file_filter.matches(entry):
+                continue
+            item = (entry["modified"], index, entry)
+            if len(heap) < limit:
+                heapq.heappush(heap, item)
+            elif item > heap[0]:
+                heapq.heapreplace(heap, item)
+        return [entry for _, _, entry in sorted(heap, reverse=True)]
+
+    @staticmethod
+    def category_path(category: str) -> str:
+        adb_path = ADBService.CATEGORY_PATHS.get(category.lower())
         if not adb_path:
             raise HTTPException(status_code=400, detail="Неизвестная категория")
-    
-        allowed_exts = ALLOWED_EXTENSIONS.get(category, [])
-        files = ADBService.list_files_with_metadata(adb_path)
-    
-        after_date = datetime.strptime(date_after, "%Y-%m-%d")
-        before_date = datetime.strptime(date_before, "%Y-%m-%d") if date_before else datetime.max
-    
-        filtered = [
-            f for f in files
-            if after_date <= f["modified"] <= before_date and
-            os.path.splitext(f["name"])[1].lower() in allowed_exts
-        ]
-    
-        return sorted(filtered, key=lambda x: x["modified"], reverse=True)[:limit]
+        return adb_path
+
+
+message_store.register("sms", MessageSource(
+    table="sms", uri="content://sms", columns=ADBService.SMS_COLUMNS,
+    reconcile_columns=["_id", "date", "type"], contact_column="address",
+))
+message_store.register("calls", MessageSource(
+    table="calls", uri="content://call_log/calls", columns=ADBService.CALL_LOG_COLUMNS,
+    reconcile_columns=["_id", "date", "type", "duration", "name"], contact_column="number",
+))
+
+
+@dataclass
+class FileFilter:
+    """Условия отбора файлов: расширения, диапазон дат, размер и часть имени"""
+    extensions: Optional[List[str]]  # None - любые расширения
+    after: Optional[datetime] = None
+    before: Optional[datetime] = None
+    min_size: Optional[int] = None
+    max_size: Optional[int] = None
+    name: Optional[str] = None
+
+    @classmethod
+    def for_category(cls, category: str, date_after: Optional[str], date_before: Optional[str],
+                     extensions: Optional[List[str]] = None, min_size: Optional[int] = None,
+                     max_size: Optional[int] = None, name: Optional[str] = None) -> "FileFilter":
+        allowed_exts = ADBService.ALLOWED_EXTENSIONS.get(category.lower(), [])
+        if extensions:
+            requested = {ext.lower() if ext.startswith(".") else f".{ext.lower()}" for ext in extensions}
+            allowed_exts = [ext for ext in allowed_exts if ext in requested]
+        return cls(
+            extensions=allowed_exts,
+            after=ADBService.parse_day(date_after) if date_after else None,
+            before=ADBService.parse_day(date_before) if date_before else None,
+            min_size=min_size,
+            max_size=max_size,
+            name=name,
+        )
+
+    def find_predicates(self, with_dates: bool = True) -> str:
+        """Выражение find с теми же условиями, что и matches()"""
+        parts = ["-type f"]
+        if self.extensions:
+            names = " -o ".join(f"-iname '*{ext}'" for ext in self.extensions)
+            parts.append(f"\\( {names} \\)")
+        elif self.extensions is not None:
+            # Ни одно расширение не подходит: find не должен ничего вернуть
+            parts.append("-false")
+        # -newermt строго "новее" и сравнивает доли секунды, а matches() и индекс - время
+        # с точностью до секунды включительно. Границы расширены на секунду, а точный
+        # отбор делает matches() над выводом find (см. top_files)
+        if with_dates and self.after:
+            parts.append(f"-newermt '{self.after - timedelta(seconds=1):%Y-%m-%d %H:%M:%S}'")
+        if with_dates and self.before:
+            parts.append(f"! -newermt '{self.before + timedelta(seconds=1):%Y-%m-%d %H:%M:%S}'")
+        if self.min_size is not None:
+            parts.append(f"-size +{max(self.min_size - 1, 0)}c")
+        if self.max_size is not None:
+            parts.append(f"-size -{self.max_size + 1}c")
+        if self.name:
+            pattern = re.sub(r"([*?\[\]\\])", r"\\\1", self.name)
+            parts.append(f"-iname {shlex.quote(f'*{pattern}*')}")
+        return " ".join(parts)
+
+    def matches(self, entry: dict) -> bool:
+        if entry.get("type", "file") != "file":
+            return False
+        if self.extensions is not None and os.path.splitext(entry["name"])[1].lower() not in self.extensions:
+            return False
+        if self.after and entry["modified"] < self.after:
+            return False
+        if self.before and entry["modified"] > self.before:
+            return False
+        if self.min_size is not None and entry["size"] < self.min_size:
+            return False
+        if self.max_size is not None and entry["size"] > self.max_size:
+            return False
+        if self.name and self.name.lower() not in entry["name"].lower():
+            return False
+        return True
@@ -0,0 +1,285 @@
+import queue
+import subprocess
+import threading
+import uuid
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+
+@dataclass
+class ShellResult:
+    """Результат команды, выполненной в долгоживущей adb shell сессии"""
+    stdout: str
+    returncode: int
+
+
+class ADBShellError(Exception):
+    """Сессия adb shell умерла или не ответила вовремя"""
+
+
+def batch_command(commands: Dict[str, str]) -> Tuple[str, str]:
+    """
+    Склеивает несколько команд в один shell-скрипт. Вывод каждой команды
+    предваряется строкой "<token> <name>", чтобы его можно было разрезать
+    split_batch_output. Возвращает (скрипт, token).
+    """
+    token = f"__ADB_SECTION_{uuid.uuid4().hex}__"
+    parts = [
+        f"printf '\\n%s %s\\n' {token} {name}; ( {command} ) </dev/null 2>/dev/null"
+        for name, command in commands.items()
+    ]
+    return "; ".join(parts), token
+
+
+def split_batch_output(output: str, token: str) -> Dict[str, str]:
+    """Разрезает вывод batch_command на {имя команды: её вывод}"""
+    sections: Dict[str, str] = {}
+    for chunk in output.split(f"\n{token} ")[1:]:
+        name, _, body = chunk.partition("\n")
+        sections[name.strip()] = body
+    return sections
+
+
+class ADBShellSession:
+    """
+    Один долгоживущий процесс `adb [-s serial] shell`.
+
+    Команды пишутся в stdin, а конец вывода определяется по уникальному
+    маркеру, который печатается вместе с кодом возврата команды:
+
+        ( cmd ) </dev/null
+        printf '\\n%s %d\\n' <marker> $?
+
+    stdin команды закрыт, чтобы она не "съела" следующие команды сессии,
+    а subshell защищает сессию от `cd`/`exit` внутри команды.
+    stderr устройства отбрасывается, как и раньше при чтении только stdout.
+    """
+
+    def __init__(self, serial: Optional[str] = None):
+        self.serial = serial
+        args = ["adb"] + (["-s", serial] if serial else []) + ["shell"]
+        self._process = subprocess.Popen(
+            args,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            encoding="utf-8",
+            errors="replace",
+            bufsize=1,
+        )
+        # Чтение в отдельном потоке позволяет ждать вывод с таймаутом
+        self._lines: "queue.Queue[Optional[str]]" = queue.Queue()
+        self._reader = threading.Thread(target=self._read_stdout, daemon=True)
+        self._reader.start()
+
+    def _read_stdout(self):
+        for line in self._process.stdout:
+            self._lines.put(line)
+        self._lines.put(None)  # EOF: процесс adb завершился
+
+    @property
+    def alive(self) -> bool:
+        return self._process.poll() is None
+
+    def _send(self, command: str) -> str:
+        if not self.alive:
+            raise ADBShellError("adb shell сессия завершилась")
+
+        marker = f"__ADB_END_{uuid.uuid4().hex}__"
+        try:
+            self._process.stdin.write(f"( {command} ) </dev/null\nprintf '\\n%s %d\\n' {marker} $?\n")
+            self._process.stdin.flush()
+        except (BrokenPipeError, OSError) as e:
+            raise ADBShellError(f"Не удалось отправить команду в adb shell: {e}")
+        return marker
+
+    def _next_line(self, timeout: Optional[float]) -> str:
+        try:
+            line = self._lines.get(timeout=timeout)
+        except queue.Empty:
+            self.close()
+            raise ADBShellError(f"adb shell не ответил за {timeout} сек")
+        if line is None:
+            raise ADBShellError("adb shell сессия завершилась во время выполнения команды")
+        return line
+
+    def run(self, command: str, timeout: Optional[float] = None) -> ShellResult:
+        """Выполняет команду и возвращает её stdout и код возврата"""
+        marker = self._send(command)
+        chunks: List[str] = []
+        while True:
+            line = self._next_line(timeout)
+            if line.startswith(marker):
+                returncode = int(line[len(marker):].strip() or 0)
+                break
+            chunks.append(line)
+
+        stdout = "".join(chunks)
+        # Убираем перевод строки, добавленный printf перед маркером
+        if stdout.endswith("\n"):
+            stdout = stdout[:-1]
+        return ShellResult(stdout=stdout, returncode=returncode)
+
+    def stream(self, command: str, timeout: Optional[float] = None) -> Iterator[str]:
+        """
+        Построчно отдаёт вывод команды по мере поступления (без "\\n").
+        Возвращает (через StopIteration.value) код возврата команды.
+        """
+        marker = self._send(command)
+        previous: Optional[str] = None
+        while True:
+            line = self._next_line(timeout)
+            if line.startswith(marker):
+                break
+            if previous is not None:
+                yield previous.rstrip("\n")
+            previous = line
+        # Последняя строка перед маркером содержит перевод строки от printf
+        if previous is not None and previous != "\n":
+            yield previous[:-1] if previous.endswith("\n") else previous
+        return int(line[len(marker):].strip() or 0)
+
+    def close(self):
+        if self.alive:
+            try:
+                self._process.stdin.close()
+            except OSError:
+                pass
+            self._process.kill()
+        self._process.wait()
+
+
+class ADBShellPool:
+    """
+    Пул долгоживущих adb shell сессий, до `size` штук на каждое устройство.
+
+    Процесс adb запускается один раз на сессию, после чего все команды
+    сервиса выполняются внутри уже открытых сессий. Умершие сессии
+    пересоздаются при следующем запросе.
+    """
+
+    def __init__(self, size: int = 2, timeout: Optional[float] = 120):
+        self.size = size
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self._idle: Dict[str, "queue.LifoQueue[ADBShellSession]"] = {}
+        self._created: Dict[str, int] = {}
+
+    def _key(self, serial: Optional[str]) -> str:
+        return serial or ""
+
+    def _checkout(self, serial: Optional[str]) -> ADBShellSession:
+        key = self._key(serial)
+        while True:
+            with self._lock:
+                idle = self._idle.setdefault(key, queue.LifoQueue())
+                try:
+                    session = idle.get_nowait()
+                    break
+                except queue.Empty:
+                    if self._created.get(key, 0) < self.size:
+                        self._created[key] = self._created.get(key, 0) + 1
+                        session = None
+                        break
+            # Все сессии заняты: ждём освободившуюся, периодически проверяя,
+            # не освободилось ли место под новую (если занятая сессия умерла)
+            try:
+                session = idle.get(timeout=1)
+                break
+            except queue.Empty:
+                continue
+
+        if session is not None and session.alive:
+            return session
+        if session is not None:
+            session.close()
+        try:
+            return ADBShellSession(serial)
+        except Exception:
+            with self._lock:
+                self._created[key] = max(self._created.get(key, 1) - 1, 0)
+            raise
+
+    def _checkin(self, session: ADBShellSession, broken: bool = False):
+        key = self._key(session.serial)
+        if broken or not session.alive:
+            session.close()
+            with self._lock:
+                self._created[key] = max(self._created.get(key, 1) - 1, 0)
+            return
+        with self._lock:
+            self._idle.setdefault(key, queue.LifoQueue()).put(session)
+
+    @contextmanager
+    def session(self, serial: Optional[str] = None):
+        """Берёт сессию устройства из пула на время блока with"""
+        session = self._checkout(serial)
+        try:
+            yield session
+        except ADBShellError:
+            self._checkin(session, broken=True)
+            raise
+        except Exception:
+            self._checkin(session)
+            raise
+        except BaseException:
+            # Прерванная посреди вывода сессия не годится для следующих команд
+            self._checkin(session, broken=True)
+            raise
+        else:
+            self._checkin(session)
+
+    def run(self, command: str, serial: Optional[str] = None, timeout: Optional[float] = None) -> ShellResult:
+        """Выполняет shell-команду на устройстве через сессию из пула"""
+        with self.session(serial) as session:
+            return session.run(command, timeout=timeout if timeout is not None else self.timeout)
+
+    def stream(self, command: str, serial: Optional[str] = None, timeout: Optional[float] = None) -> "ShellLineStream":
+        """Построчный вывод команды, см. ShellLineStream"""
+        return ShellLineStream(self, command, serial, timeout if timeout is not None else self.timeout)
+
+    def discard(self, serial: Optional[str] = None):
+        """Закрывает все свободные сессии устройства (например, после отключения)"""
+        key = self._key(serial)
+        with self._lock:
+            idle = self._idle.pop(key, None)
+            self._created.pop(key, None)
+        while idle is not None and not idle.empty():
+            idle.get_nowait().close()
+
+    def retain(self, serials: Iterable[str]):
+        """Закрывает сессии устройств, которых больше нет среди подключенных"""
+        connected = set(serials)
+        with self._lock:
+            gone = [key for key in self._idle if key and key not in connected]
+        for key in gone:
+            self.discard(key)
+
+    def close_all(self):
+        with self._lock:
+            keys = list(self._idle)
+        for key in keys:
+            self.discard(key or None)
+
+
+class ShellLineStream:
+    """
+    Итератор по строкам вывода команды. Сессия занята, пока итерация не
+    закончится; после неё код возврата доступен в `returncode`. Если
+    прервать итерацию раньше, сессия закрывается, а не возвращается в пул.
+    """
+
+    def __init__(self, pool: ADBShellPool, command: str, serial: Optional[str], timeout: Optional[float]):
+        self.pool = pool
+        self.command = command
+        self.serial = serial
+        self.timeout = timeout
+        self.returncode: Optional[int] = None
+
+    def __iter__(self) -> Iterator[str]:
+        with self.pool.session(self.serial) as session:
+            self.returncode = yield from session.stream(self.command, timeout=self.timeout)
+
+
+shell_pool = ADBShellPool()
@@ -0,0 +1,70 @@
+import hashlib
+import io
+import os
+import uuid
+from typing import Optional, Union
+
+from PIL import Image, ImageOps
+
+# Форматы превью: параметр format -> (формат Pillow, расширение, MIME-тип)
+THUMBNAIL_FORMATS = {
+    "webp": ("WEBP", "webp", "image/webp"),
+    "jpeg": ("JPEG", "jpg", "image/jpeg"),
+}
+
+
+def render_thumbnail(source: Union[str, bytes], target: str, size: int, fmt: str, quality: int = 75) -> bool:
+    """
+    Превью не больше `size` x `size` из файла или байтов изображения.
+    Выполняется в пуле процессов; False - Pillow не смог открыть источник.
+    """
+    temp = f"{target}.{uuid.uuid4().hex}.part"
+    try:
+        with Image.open(io.BytesIO(source) if isinstance(source, bytes) else source) as image:
+            image.draft("RGB", (size, size))
+            image = ImageOps.exif_transpose(image)
+            image.thumbnail((size, size), Image.LANCZOS)
+            pil_format = THUMBNAIL_FORMATS[fmt][0]
+            if image.mode not in ("RGB", "RGBA") or (pil_format == "JPEG" and image.mode == "RGBA"):
+                image = image.convert("RGBA" if pil_format == "WEBP" else "RGB")
+            image.save(temp, pil_format, quality=quality)
+        os.replace(temp, target)
+        return True
+    except (OSError, ValueError, Image.DecompressionBombError):
+        if os.path.exists(temp):
+            os.remove(temp)
+        return False
+
+
+class ThumbnailCache:
+    """
+    Превью для галереи на диске сервера.
+
+    Ключ - (устройство, путь, размер и mtime файла, размер превью, формат):
+    пока файл на устройстве не меняется, превью строится один раз. Тот же
+    ключ служит ETag ответа /thumbnail.
+    """
+
+    def __init__(self, root: str = os.path.join("output", "cache", "thumbnails")):
+        self.root = root
+
+    @staticmethod
+    def key(serial: Optional[str], path: str, file_size: int, mtime: int, size: int, fmt: str) -> str:
+        raw = f"{serial or ''}\0{path}\0{file_size}\0{mtime}\0{size}\0{fmt}"
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def path_for(self, key: str, fmt: str) -> str:
+        return os.path.join(self.root, key[:2], f"{key}.{THUMBNAIL_FORMATS[fmt][1]}")
+
+    def lookup(self, key: str, fmt: str) -> Optional[str]:
+        path = self.path_for(key, fmt)
+        return path if os.path.exists(path) else None
+
+    def reserve(self, key: str, fmt: str) -> str:
+        """Путь, по которому будет записано превью (папка создаётся)"""
+        path = self.path_for(key, fmt)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        return path
+
+
+thumbnail_cache = ThumbnailCache()
@@ -1,51 +1,229 @@
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Query, Request
+from app.base.async_service import AsyncADBService, run_blocking
+from app.base.file_index import file_index
+from app.base.prop_cache import prop_cache
+from app.base.pull_cache import pull_cache
 from app.base.service import ADBService
-from app.base.reportGenerator import ReportGenerator
-from fastapi.responses import FileResponse
+from app.base.call_analytics import parse_bins
+from app.base.thumbnails import THUMBNAIL_FORMATS
+from app.base.report_jobs import ReportJob, report_jobs
+from fastapi.responses import FileResponse, Response, StreamingResponse
+from starlette.background import BackgroundTask
+import json
+import mimetypes
 import os
+import urllib.parse
 from typing import List, Optional
 
 router = APIRouter()
 
-BASE_OUTPUT_DIR = "output"
-REPORTS_DIR = os.path.join(BASE_OUTPUT_DIR, "reports")
+
+def split_csv(value: Optional[str]) -> Optional[List[str]]:
+    """Разбирает список через запятую (None, если параметр не передан)"""
+    if not value:
+        return None
+    return [item.strip() for item in value.split(",") if item.strip()]
 
 @router.get("/")
-def get_device_info():
-    return ADBService.get_device_info()
+async def get_device_info(serial: Optional[str] = Query(None, description="Серийный номер устройства")):
+    return await AsyncADBService.get_device_info(serial)
+
+@router.get("/devices/sms-count")
+async def get_devices_sms_count(
+    serials: Optional[str] = Query(None, description="Серийные номера через запятую (по умолчанию все устройства)")
+):
+    """Количество SMS на каждом устройстве, устройства опрашиваются параллельно."""
+    return await AsyncADBService.for_each_device(AsyncADBService.get_sms_count, split_csv(serials))
+
+@router.get("/devices/storage")
+async def get_devices_storage(
+    serials: Optional[str] = Query(None, description="Серийные номера через запятую (по умолчанию все устройства)")
+):
+    """Занятость /data на каждом устройстве, устройства опрашиваются параллельно."""
+    return await AsyncADBService.for_each_device(AsyncADBService.get_storage, split_csv(serials))
+
+@router.post("/devices/properties/invalidate")
+async def invalidate_device_properties(
+    serial: Optional[str] = Query(None, description="Серийный номер устройства (по умолчанию все устройства)")
+):
+    """Сбрасывает кеш getprop, например после смены SIM-карты или прошивки."""
+    prop_cache.invalidate(serial)
+    return {"invalidated": serial or "all"}
+
+@router.post("/devices/files-index/invalidate")
+async def invalidate_files_index(
+    serial: Optional[str] = Query(None, description="Серийный номер устройства (по умолчанию все устройства)")
+):
+    """
+    Сбрасывает индекс файлов: следующий запрос перечитает хранилище целиком.
+    Нужен, если файлы перезаписаны на месте (mtime директории при этом не меняется).
+    """
+    await run_blocking(file_index.invalidate, serial)
+    return {"invalidated": serial or "all"}
+
+@router.get("/devices/pull-workers")
+async def get_pull_workers(serial: Optional[str] = Query(None, description="Серийный номер устройства")):
+    """Сколько файлов одновременно скачивается с устройства при сборке отчёта."""
+    return {"serial": serial, "workers": ADBService.get_pull_workers(serial)}
+
+@router.post("/devices/pull-workers")
+async def set_pull_workers(
+    serial: Optional[str] = Query(None, description="Серийный номер устройства"),
+    workers: Optional[int] = Query(None, description="Число параллельных скачиваний (без параметра - по умолчанию)"),
+):
+    """Задаёт число параллельных скачиваний для устройства."""
+    return {"serial": serial, "workers": ADBService.set_pull_workers(serial, workers)}
+
+async def ndjson_lines(records):
+    async for record in records:
+        yield json.dumps(record, ensure_ascii=False) + "\n"
 
 @router.get("/all-files")
-def get_adb_files():
-    return ADBService.list_files()
+async def get_adb_files(
+    serial: Optional[str] = Query(None, description="Серийный номер устройства"),
+    format: str = Query("json", pattern="^(json|ndjson)$", description="ndjson - потоковая выдача по одной записи в строке"),
+    cursor: Optional[str] = Query(None, description="next_cursor из предыдущей страницы"),
+    limit: Optional[int] = Query(None, ge=1, le=1000, description="Размер страницы"),
+):
+    """
+    Список файлов /sdcard/. По умолчанию - целиком по категориям; с
+    format=ndjson - потоком по мере обхода устройства; с cursor/limit - по страницам.
+    """
+    if format == "ndjson":
+        return StreamingResponse(ndjson_lines(AsyncADBService.iter_files(serial=serial)), media_type="application/x-ndjson")
+    if cursor is not None or limit is not None:
+        return await AsyncADBService.list_files_page(cursor=cursor, limit=limit or 100, serial=serial)
+    return await AsyncADBService.list_files(serial=serial)
+
+@router.get("/media")
+async def get_media(
+    category: Optional[str] = Query(None, description="images, videos или documents (по умолчанию все)"),
+    limit: Optional[int] = Query(None, ge=1, description="Не больше стольких файлов в каждой категории"),
+    serial: Optional[str] = Query(None, description="Серийный номер устройства"),
+):
+    """Медиафайлы из каталога MediaStore: размер, дата, MIME-тип и размеры изображения."""
+    return await AsyncADBService.list_media(category, limit, serial)
 
 @router.get("/download-file")
-def download_adb_file(path: str):
-    """Загружает файл с устройства и отправляет пользователю для скачивания."""
+async def download_adb_file(
+    request: Request,
+    path: str,
+    serial: Optional[str] = Query(None, description="Серийный номер устройства"),
+    stream: bool = Query(True, description="Передавать файл с устройства потоком, без копии на сервере"),
+):
+    """
+    Отдаёт файл с устройства для скачивания. Поддерживает Range: диапазон
+    читается на устройстве со смещения, так что перемотка видео и докачка
+    работают без полной передачи файла. Если файл уже есть в локальном
+    кеше, он отдаётся с диска.
+    """
     try:
-        local_file_path = ADBService.download_file(path)  # Скачиваем файл с устройства на сервер
+        filename = os.path.basename(path)
+        media_type = mimetypes.guess_type(filename)[0] or "application/octet-stream"
+        if not stream:
+            local_file_path = await AsyncADBService.download_file(path, serial=serial)  # Скачиваем файл с устройства на сервер
+            return FileResponse(local_file_path, media_type=media_type, filename=filename)
 
-        if not os.path.exists(local_file_path):
-            raise HTTPException(status_code=404, detail="Файл не найден на сервере после скачивания.")
+        size, mtime = await AsyncADBService.file_stat(path, serial)
+        cached = pull_cache.lookup(serial, path, size, mtime)
+        if cached is not None:
+            return FileResponse(cached, media_type=media_type, filename=filename)
 
-        return FileResponse(
-            local_file_path,
-            media_type="application/octet-stream",
-            headers={"Content-Disposition": f"attachment; filename={os.path.basename(local_file_path)}"}
+        etag = f'"{mtime:x}-{size:x}"'
+        byte_range = None
+        if request.headers.get("if-range", etag) == etag:
+            byte_range = ADBService.parse_byte_range(request.headers.get("range"), size)
+        headers = {
+            "Accept-Ranges": "bytes",
+            "ETag": etag,
+            "Content-Disposition": f"attachment; filename*=utf-8''{urllib.parse.quote(filename)}",
+        }
+        if byte_range is None:
+            headers["Content-Length"] = str(size)
+            return StreamingResponse(AsyncADBService.stream_file(path, serial), media_type=media_type, headers=headers)
+
+        start, end = byte_range
+        headers["Content-Length"] = str(end - start + 1)
+        headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+        return StreamingResponse(
+            AsyncADBService.stream_file(path, serial, start, end - start + 1),
+            status_code=206, media_type=media_type, headers=headers,
         )
     except HTTPException as e:
         raise e
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Ошибка при загрузке файла: {str(e)}")
 
+
+@router.get("/thumbnail")
+async def get_thumbnail(
+    request: Request,
+    path: str,
+    serial: Optional[str] = Query(None, description="Серийный номер устройства"),
+    size: int = Query(256, ge=16, le=1024, description="Наибольшая сторона превью в пикселях"),
+    format: str = Query("webp", pattern="^(webp|jpeg)$", description="Формат превью"),
+):
+    """
+    Превью изображения или видео для галереи: миниатюра MediaStore с
+    устройства или уменьшенный оригинал. Превью кешируются на сервере,
+    повторный запрос с If-None-Match получает 304 без передачи данных.
+    """
+    key = await AsyncADBService.thumbnail_key(path, serial, size, format)
+    headers = {"ETag": f'"{key}"', "Cache-Control": "private, max-age=3600"}
+    if request.headers.get("if-none-match") == headers["ETag"]:
+        return Response(status_code=304, headers=headers)
+    thumbnail_path = await AsyncADBService.get_thumbnail(path, serial, size, format, key)
+    return FileResponse(thumbnail_path, media_type=THUMBNAIL_FORMATS[format][2], headers=headers)
+
+@router.post("/export-files")
+async def export_files(
+    paths: list[str],
+    serial: Optional[str] = Query(None, description="Серийный номер устройства"),
+    compress: bool = Query(False, description="Сжимать поток tar на устройстве (gzip)"),
+):
+    """
+    Скачивает несколько файлов одним потоком tar с устройства (файлы
+    попадают в локальный кеш) и отдаёт их ZIP-архивом.
+    """
+    if not paths:
+        raise HTTPException(status_code=400, detail="Не переданы пути файлов")
+    local_paths = await AsyncADBService.run_on_device(serial, ADBService.pull_files, paths, serial, None, compress)
+    if not local_paths:
+        raise HTTPException(status_code=404, detail="Ни один из файлов не найден на устройстве")
+    archive_path = await run_blocking(ADBService.export_archive, local_paths)
+    return FileResponse(
+        archive_path,
+        media_type="application/zip",
+        filename="export.zip",
+        background=BackgroundTask(os.remove, archive_path),
+    )
+
     
+def submit_files_report(category: str, filter_path: str, limit: int, serial: Optional[str]) -> ReportJob:
+    return report_jobs.submit("files", {"category": category, "filter_path": filter_path, "limit": limit, "serial": serial})
+
+def submit_messages_report(contact: Optional[str], date_from: Optional[str], date_to: Optional[str],
+                           limit: Optional[int], serial: Optional[str]) -> ReportJob:
+    return report_jobs.submit("messages", {
+        "contact": contact, "date_from": date_from, "date_to": date_to, "limit": limit, "serial": serial,
+    })
+
+def submit_category_report(category: str, date_after: str, date_before: Optional[str], limit: int,
+                           serial: Optional[str], extensions: Optional[List[str]], min_size: Optional[int],
+                           max_size: Optional[int], name: Optional[str]) -> ReportJob:
+    return report_jobs.submit("category", {
+        "category": category, "date_after": date_after, "date_before": date_before, "limit": limit,
+        "serial": serial, "extensions": extensions, "min_size": min_size, "max_size": max_size, "name": name,
+    })
+
 @router.post("/report/generate/{category}")
-def generate_report(category: str, filter_path: str, limit: int = 10):
+async def generate_report(category: str, filter_path: str, limit: int = 10,
+                          serial: Optional[str] = Query(None, description="Серийный номер устройства")):
     """
     Генерирует отчет по категории с фильтрацией по пути и сразу отправляет клиенту.
     """
     try:
-        file_paths = ReportGenerator.fetch_files_from_path(category, filter_path, limit)
-        report_path = ReportGenerator.generate_pdf(file_paths)
+        report_path = await report_jobs.wait(submit_files_report(category, filter_path, limit, serial))
 
         return FileResponse(
             report_path,
@@ -58,22 +236,52 @@ def generate_report(category: str, filter_path: str, limit: int = 10):
         raise HTTPException(status_code=500, detail=f"Ошибка при генерации отчета: {str(e)}")
 
 @router.get("/call_logs")
-def get_call_logs():
-    return ADBService.get_call_logs()
+async def get_call_logs(
+    serial: Optional[str] = Query(None, description="Серийный номер устройства"),
+    number: Optional[str] = Query(None, description="Фильтр по части номера"),
+    date_from: Optional[str] = Query(None, description="С даты (формат YYYY-MM-DD)"),
+    date_to: Optional[str] = Query(None, description="По дату включительно (формат YYYY-MM-DD)"),
+    limit: Optional[int] = Query(None, ge=1, description="Не больше стольких последних звонков"),
+):
+    return await AsyncADBService.get_call_logs(serial, number, date_from, date_to, limit)
+
+@router.get("/call-analytics")
+async def get_call_analytics(
+    serial: Optional[str] = Query(None, description="Серийный номер устройства"),
+    number: Optional[str] = Query(None, description="Фильтр по части номера"),
+    date_from: Optional[str] = Query(None, description="С даты (формат YYYY-MM-DD)"),
+    date_to: Optional[str] = Query(None, description="По дату включительно (формат YYYY-MM-DD)"),
+    bins: Optional[str] = Query(None, description="Границы интервалов длительности в секундах через запятую, например 60,300,600"),
+):
+    """Итоги по контактам, гистограмма длительностей и тепловая карта звонков (день недели x час)."""
+    try:
+        duration_bins = parse_bins(bins)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="bins - положительные целые числа через запятую")
+    return await AsyncADBService.get_call_analytics(serial, number, date_from, date_to, duration_bins)
 
 @router.get("/sms")
-def get_sms():
-    return ADBService.get_sms_messages()
+async def get_sms(
+    serial: Optional[str] = Query(None, description="Серийный номер устройства"),
+    contact: Optional[str] = Query(None, description="Фильтр по части номера"),
+    date_from: Optional[str] = Query(None, description="С даты (формат YYYY-MM-DD)"),
+    date_to: Optional[str] = Query(None, description="По дату включительно (формат YYYY-MM-DD)"),
+    limit: Optional[int] = Query(None, ge=1, description="Не больше стольких последних сообщений"),
+):
+    return await AsyncADBService.get_sms_messages(serial, contact, date_from, date_to, limit)
 
 @router.get("/system-info")
-def get_system_info():
-    return ADBService.get_system_info()
+async def get_system_info(
+    serial: Optional[str] = Query(None, description="Серийный номер устройства"),
+    sections: Optional[str] = Query(None, description="Разделы через запятую: device, battery, storage, gps, wifi, ip, operator, network, apps (по умолчанию все)")
+):
+    return await AsyncADBService.get_system_info(serial, split_csv(sections))
 
 @router.post("/report/calls/from_json")
-def generate_calls_report_from_json(call_logs: list[dict]):
+async def generate_calls_report_from_json(call_logs: list[dict], serial: Optional[str] = Query(None, description="Серийный номер устройства")):
     """Генерирует PDF-отчет по звонкам из JSON-данных, переданных в запросе."""
     try:
-        report_path = ReportGenerator.generate_calls_report_from_json(call_logs)
+        report_path = await report_jobs.wait(report_jobs.submit("calls", {"call_logs": call_logs, "serial": serial}))
         return FileResponse(
             report_path,
             media_type="application/pdf",
@@ -82,30 +290,20 @@ def generate_calls_report_from_json(call_logs: list[dict]):
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Ошибка при генерации отчета: {str(e)}")
 
-from fastapi import Query
-
 @router.get("/report/messages")
-def generate_messages_report(
+async def generate_messages_report(
     contact: str = Query(None, description="Фильтр по номеру контакта"),
-    date: str = Query(None, description="Фильтр по дате (формат YYYY-MM-DD)")
+    date: str = Query(None, description="Фильтр по дате (формат YYYY-MM-DD)"),
+    date_from: Optional[str] = Query(None, description="С даты (формат YYYY-MM-DD)"),
+    date_to: Optional[str] = Query(None, description="По дату включительно (формат YYYY-MM-DD)"),
+    limit: Optional[int] = Query(None, ge=1, description="Не больше стольких последних сообщений"),
+    serial: Optional[str] = Query(None, description="Серийный номер устройства")
 ):
     """Генерирует и возвращает PDF-отчет по SMS-сообщениям с учетом фильтрации."""
     try:
-        sms_messages = ADBService.get_sms_messages().get("sms_messages", [])
-        if not sms_messages:
-            raise HTTPException(status_code=404, detail="Данные о сообщениях не найдены.")
-
-        # Фильтрация сообщений
-        filtered_messages = [
-            msg for msg in sms_messages
-            if (not contact or contact in msg.get("Номер", "")) and
-               (not date or msg.get("Дата", "").startswith(date))
-        ]
-
-        if not filtered_messages:
-            raise HTTPException(status_code=404, detail="Нет сообщений, соответствующих фильтру.")
-
-        report_path = ReportGenerator.generate_messages_report(filtered_messages)
+        report_path = await report_jobs.wait(
+            submit_messages_report(contact, date_from or date, date_to or date, limit, serial)
+        )
 
         return FileResponse(
             report_path,
@@ -117,14 +315,72 @@ def generate_messages_report(
 
 
 @router.get("/generate-category-report")
-def generate_category_report(
+async def generate_category_report(
     category: str = Query(..., description="Категория: images | videos | documents"),
     date_after: str = Query(..., description="Начальная дата, формат: YYYY-MM-DD"),
     date_before: Optional[str] = Query(None, description="Конечная дата, формат: YYYY-MM-DD (необязательно)"),
-    limit: int = Query(10, description="Макс. количество файлов")
+    limit: int = Query(10, description="Макс. количество файлов"),
+    serial: Optional[str] = Query(None, description="Серийный номер устройства"),
+    extensions: Optional[str] = Query(None, description="Расширения через запятую, например jpg,png (по умолчанию все для категории)"),
+    min_size: Optional[int] = Query(None, description="Мин. размер файла в байтах"),
+    max_size: Optional[int] = Query(None, description="Макс. размер файла в байтах"),
+    name: Optional[str] = Query(None, description="Часть имени файла")
 ):
     try:
-        report_path = ReportGenerator.generate_filtered_file_report(category, date_after, date_before, limit)
+        report_path = await report_jobs.wait(submit_category_report(
+            category, date_after, date_before, limit, serial, split_csv(extensions), min_size, max_size, name
+        ))
         return FileResponse(report_path, media_type="application/pdf", filename=os.path.basename(report_path))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.post("/report/jobs/files/{category}")
+async def create_files_report_job(category: str, filter_path: str, limit: int = 10,
+                                  serial: Optional[str] = Query(None, description="Серийный номер устройства")):
+    """Ставит в очередь отчёт по файлам категории из папки (как /report/generate/{category})."""
+    return submit_files_report(category, filter_path, limit, serial).to_dict()
+
+@router.post("/report/jobs/messages")
+async def create_messages_report_job(
+    contact: Optional[str] = Query(None, description="Фильтр по номеру контакта"),
+    date_from: Optional[str] = Query(None, description="С даты (формат YYYY-MM-DD)"),
+    date_to: Optional[str] = Query(None, description="По дату включительно (формат YYYY-MM-DD)"),
+    limit: Optional[int] = Query(None, ge=1, description="Не больше стольких последних сообщений"),
+    serial: Optional[str] = Query(None, description="Серийный номер устройства"),
+):
+    """Ставит в очередь отчёт по SMS (как /report/messages)."""
+    return submit_messages_report(contact, date_from, date_to, limit, serial).to_dict()
+
+@router.post("/report/jobs/calls")
+async def create_calls_report_job(call_logs: list[dict], serial: Optional[str] = Query(None, description="Серийный номер устройства")):
+    """Ставит в очередь отчёт по звонкам из JSON (как /report/calls/from_json)."""
+    return report_jobs.submit("calls", {"call_logs": call_logs, "serial": serial}).to_dict()
+
+@router.post("/report/jobs/category")
+async def create_category_report_job(
+    category: str = Query(..., description="Категория: images | videos | documents"),
+    date_after: str = Query(..., description="Начальная дата, формат: YYYY-MM-DD"),
+    date_before: Optional[str] = Query(None, description="Конечная дата, формат: YYYY-MM-DD (необязательно)"),
+    limit: int = Query(10, description="Макс. количество файлов"),
+    serial: Optional[str] = Query(None, description="Серийный номер устройства"),
+    extensions: Optional[str] = Query(None, description="Расширения через запятую, например jpg,png (по умолчанию все для категории)"),
+    min_size: Optional[int] = Query(None, description="Мин. размер файла в байтах"),
+    max_size: Optional[int] = Query(None, description="Макс. размер файла в байтах"),
+    name: Optional[str] = Query(None, description="Часть имени файла")
+):
+    """Ставит в очередь отчёт по файлам категории с фильтрами (как /generate-category-report)."""
+    return submit_category_report(
+        category, date_after, date_before, limit, serial, split_csv(extensions), min_size, max_size, name
+    ).to_dict()
+
+@router.get("/report/jobs/{job_id}")
+async def get_report_job(job_id: str):
+    """Состояние задания: queued, running, done или failed, этап и прогресс в процентах."""
+    return report_jobs.get(job_id).to_dict()
+
+@router.get("/report/jobs/{job_id}/result")
+async def get_report_job_result(job_id: str):
+    """Готовый PDF задания (409, пока отчёт формируется)."""
+    report_path = report_jobs.result(report_jobs.get(job_id))
+    return FileResponse(report_path, media_type="application/pdf", filename=os.path.basename(report_path))
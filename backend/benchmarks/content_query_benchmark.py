@@ -0,0 +1,90 @@
+"""
+Скорость разбора вывода `content query`: прежний разбор регуляркой
+против потокового ContentRowParser на синтетическом дампе SMS.
+
+Запуск из папки backend:
+
+    python -m benchmarks.content_query_benchmark --rows 100000
+"""
+import argparse
+import random
+import re
+import time
+from datetime import datetime
+
+from app.base.content_query import iter_content_records
+from app.base.records import SmsRecord
+from app.base.service import ADBService
+
+WORDS = ["привет", "как дела", "ок", "see you", "код: 1234", "да, конечно", "нет", "перезвоню"]
+
+
+def make_dump(rows: int, seed: int = 1) -> str:
+    """Дамп content://sms: в части тел есть запятые, знаки "=" и переводы строк"""
+    rnd = random.Random(seed)
+    lines = []
+    for index in range(rows):
+        body = ", ".join(rnd.choice(WORDS) for _ in range(rnd.randint(1, 6)))
+        if index % 10 == 0:
+            body += "\nвторая строка, x=1"
+        lines.append(
+            f"Row: {index} _id={index + 1}, address=+7701{index % 10000:04d}, body={body}, "
+            f"date={1700000000000 + index * 1000}, type={rnd.choice('12')}"
+        )
+    return "\n".join(lines) + "\n"
+
+
+def parse_regex(output: str) -> list:
+    """Прежний разбор: регулярка по каждой строке и словари типов на каждую запись"""
+    parsed = []
+    for log in output.strip().split("\n"):
+        if not log.strip():
+            continue
+        log_dict = dict(re.findall(r"(\w+)=([^,]+)", log))
+        timestamp = log_dict.get("date", "0")
+        formatted_date = datetime.fromtimestamp(int(timestamp) / 1000).strftime('%Y-%m-%d %H:%M:%S') if timestamp.isdigit() else "Неизвестно"
+        sms_types = {"1": "Входящее", "2": "Исходящее"}
+        parsed.append({
+            "ID": log_dict.get("_id", "Неизвестно"),
+            "Номер": log_dict.get("address", "Неизвестно"),
+            "Текст": log_dict.get("body", "Неизвестно"),
+            "Дата": formatted_date,
+            "Тип": sms_types.get(log_dict.get("type", "1"), "Неизвестно"),
+        })
+    return parsed
+
+
+def parse_streaming(output: str) -> list:
+    return [SmsRecord.from_row(row).to_display() for row in iter_content_records(output.split("\n"), ADBService.SMS_COLUMNS)]
+
+
+def parse_rows_only(output: str) -> list:
+    """Только разбор строк на колонки, без форматирования дат и типов"""
+    return list(iter_content_records(output.split("\n"), ADBService.SMS_COLUMNS))
+
+
+def measure(name: str, func, output: str, expected_rows: int):
+    start = time.perf_counter()
+    parsed = func(output)
+    elapsed = time.perf_counter() - start
+    print(f"{name:<12} {len(parsed):>8} записей  {elapsed:7.3f} c  {expected_rows / elapsed:>12,.0f} строк/с")
+    return parsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=100_000)
+    args = parser.parse_args()
+
+    output = make_dump(args.rows)
+    print(f"Дамп: {args.rows} записей, {len(output) / 1024 / 1024:.1f} МБ")
+    old = measure("regex", parse_regex, output, args.rows)
+    new = measure("streaming", parse_streaming, output, args.rows)
+    measure("rows only", parse_rows_only, output, args.rows)
+
+    broken = sum(1 for a, b in zip(old, new) if a["Текст"] != b["Текст"])
+    print(f"regex: {len(old) - args.rows} лишних записей, обрезанных тел среди первых {min(len(old), len(new))}: {broken}")
+
+
+if __name__ == "__main__":
+    main()
@@ -2,6 +2,9 @@ from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from app.routers.base_router import router as base_router
 from app.auth.auth_router import router as auth_router
+from app.base.shell_pool import shell_pool
+from app.base.pdf_images import shutdown_image_pool
+from app.base.report_jobs import report_jobs
 
 app = FastAPI(title="DataExtractorMachine3000")
 
@@ -14,4 +17,10 @@ app.add_middleware(
 )
 
 app.include_router(base_router)
-app.include_router(auth_router)
\ No newline at end of file
+app.include_router(auth_router)
+
+@app.on_event("shutdown")
+def close_adb_sessions():
+    shell_pool.close_all()
+    shutdown_image_pool()
+    report_jobs.shutdown()
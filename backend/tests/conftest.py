@@ -0,0 +1,5 @@
+import os
+import sys
+
+# Тесты импортируют пакет app так же, как main.py: из папки backend
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,238 @@
+import asyncio
+import errno
+import os
+import stat
+import struct
+from typing import Callable, Dict, List, Optional, Union
+
+from app.base.adb_client import STAT_V2_FORMAT, SYNC_DATA_MAX
+
+
+ShellHandler = Callable[[str], Union[str, bytes]]
+
+
+class FakeDevice:
+    """
+    Устройство-заглушка для FakeAdbServer.
+
+    Если `shell` не задан, команды выполняются локальным /bin/sh, а sync:
+    читает локальную файловую систему, так что /sdcard можно подменить
+    обычной директорией. `files` позволяет задать содержимое файлов явно.
+    Обработчик `shell` получает команду ровно в том виде, в каком её
+    прислал клиент (вместе с обвязкой маркера из AdbClient.shell_result).
+    """
+
+    def __init__(self, serial: str, state: str = "device",
+                 shell: Optional[ShellHandler] = None,
+                 files: Optional[Dict[str, bytes]] = None,
+                 mtime: int = 0, stat_v2: bool = True):
+        self.serial = serial
+        self.state = state
+        self.shell = shell
+        self.files = files
+        self.mtime = mtime
+        # False - устройство старше Android 8, которое отвечает FAIL на STA2
+        self.stat_v2 = stat_v2
+
+    async def run(self, command: str) -> bytes:
+        if self.shell is not None:
+            output = self.shell(command)
+            return output.encode("utf-8") if isinstance(output, str) else output
+        process = await asyncio.create_subprocess_shell(
+            command, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.STDOUT
+        )
+        stdout, _ = await process.communicate()
+        return stdout
+
+    def stat(self, path: str) -> tuple:
+        if self.files is not None:
+            if path in self.files:
+                return stat.S_IFREG | 0o644, len(self.files[path]), self.mtime
+            prefix = path.rstrip("/") + "/"
+            if any(name.startswith(prefix) for name in self.files):
+                return stat.S_IFDIR | 0o755, 0, self.mtime
+            return 0, 0, 0
+        try:
+            st = os.stat(path)
+        except OSError:
+            return 0, 0, 0
+        return st.st_mode, st.st_size, int(st.st_mtime)
+
+    def list_dir(self, path: str) -> List[str]:
+        if self.files is not None:
+            prefix = path.rstrip("/") + "/"
+            return sorted({name[len(prefix):].split("/")[0] for name in self.files if name.startswith(prefix)})
+        return sorted(os.listdir(path))
+
+    def read(self, path: str) -> bytes:
+        if self.files is not None:
+            if path not in self.files:
+                raise FileNotFoundError(path)
+            return self.files[path]
+        with open(path, "rb") as f:
+            return f.read()
+
+
+class FakeAdbServer:
+    """
+    Минимальная замена adb-сервера для разработки и проверки AdbClient без
+    телефона. Понимает host:version, host:devices, host:track-devices,
+    host:transport*, shell:, exec: и sync: (STAT/STA2/LIST/RECV/QUIT).
+
+        async with FakeAdbServer([FakeDevice("emulator-5554")]) as server:
+            client = AdbClient(port=server.port)
+            print(await client.devices())
+    """
+
+    def __init__(self, devices: Optional[List[FakeDevice]] = None, host: str = "127.0.0.1", port: int = 0):
+        self.devices: Dict[str, FakeDevice] = {device.serial: device for device in devices or []}
+        self.host = host
+        self.port = port
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._trackers: List[asyncio.Queue] = []
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._handle, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        return self
+
+    async def stop(self):
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+
+    async def __aenter__(self):
+        return await self.start()
+
+    async def __aexit__(self, *exc):
+        await self.stop()
+
+    # --- управление списком устройств ---
+
+    def _devices_listing(self) -> bytes:
+        return "".join(f"{d.serial}\t{d.state}\n" for d in self.devices.values()).encode("utf-8")
+
+    def _notify_trackers(self):
+        listing = self._devices_listing()
+        for tracker in self._trackers:
+            tracker.put_nowait(listing)
+
+    def add_device(self, device: FakeDevice):
+        self.devices[device.serial] = device
+        self._notify_trackers()
+
+    def remove_device(self, serial: str):
+        self.devices.pop(serial, None)
+        self._notify_trackers()
+
+    # --- протокол ---
+
+    @staticmethod
+    def _string(payload: bytes) -> bytes:
+        return f"{len(payload):04x}".encode("ascii") + payload
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        device: Optional[FakeDevice] = None
+        try:
+            while True:
+                length = int(await reader.readexactly(4), 16)
+                request = (await reader.readexactly(length)).decode("utf-8")
+
+                if request == "host:version":
+                    writer.write(b"OKAY" + self._string(b"0029"))
+                elif request == "host:devices":
+                    writer.write(b"OKAY" + self._string(self._devices_listing()))
+                elif request == "host:track-devices":
+                    await self._track(reader, writer)
+                    return
+                elif request.startswith("host:transport"):
+                    device = self._select_device(request)
+                    if device is None:
+                        writer.write(b"FAIL" + self._string(b"device not found"))
+                    else:
+                        writer.write(b"OKAY")
+                        await writer.drain()
+                        continue
+                elif device is not None and request.startswith(("shell:", "exec:")):
+                    writer.write(b"OKAY")
+                    writer.write(await device.run(request.split(":", 1)[1]))
+                elif device is not None and request == "sync:":
+                    writer.write(b"OKAY")
+                    await writer.drain()
+                    await self._sync(device, reader, writer)
+                else:
+                    writer.write(b"FAIL" + self._string(f"unknown service: {request}".encode("utf-8")))
+                await writer.drain()
+                return
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    def _select_device(self, request: str) -> Optional[FakeDevice]:
+        if request == "host:transport-any":
+            if len(self.devices) != 1:
+                return None
+            return next(iter(self.devices.values()))
+        return self.devices.get(request[len("host:transport:"):])
+
+    async def _track(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        tracker: asyncio.Queue = asyncio.Queue()
+        self._trackers.append(tracker)
+        # Клиент ничего не пишет в track-devices, поэтому чтение вернётся только при закрытии соединения
+        closed = asyncio.ensure_future(reader.read(1))
+        try:
+            writer.write(b"OKAY" + self._string(self._devices_listing()))
+            await writer.drain()
+            while True:
+                update = asyncio.ensure_future(tracker.get())
+                done, _ = await asyncio.wait({update, closed}, return_when=asyncio.FIRST_COMPLETED)
+                if closed in done:
+                    update.cancel()
+                    return
+                writer.write(self._string(update.result()))
+                await writer.drain()
+        finally:
+            closed.cancel()
+            self._trackers.remove(tracker)
+
+    async def _sync(self, device: FakeDevice, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        while True:
+            header = await reader.readexactly(8)
+            command, length = header[:4], struct.unpack("<I", header[4:])[0]
+            path = (await reader.readexactly(length)).decode("utf-8") if length else ""
+
+            if command == b"QUIT":
+                return
+            if command == b"STAT":
+                # Как и настоящий adbd, первая версия передаёт только младшие 32 бита размера
+                mode, size, mtime = device.stat(path)
+                writer.write(b"STAT" + struct.pack("<III", mode, size & 0xFFFFFFFF, mtime))
+            elif command == b"STA2" and device.stat_v2:
+                mode, size, mtime = device.stat(path)
+                error = 0 if mode else errno.ENOENT
+                writer.write(b"STA2" + struct.pack("<I", error) +
+                             struct.pack(STAT_V2_FORMAT, 0, 0, mode, 1, 0, 0, size, mtime, mtime, mtime))
+            elif command == b"LIST":
+                for name in device.list_dir(path):
+                    mode, size, mtime = device.stat(path.rstrip("/") + "/" + name)
+                    size &= 0xFFFFFFFF
+                    encoded = name.encode("utf-8")
+                    writer.write(b"DENT" + struct.pack("<IIII", mode, size, mtime, len(encoded)) + encoded)
+                writer.write(b"DONE" + b"\0" * 16)
+            elif command == b"RECV":
+                try:
+                    data = device.read(path)
+                except OSError as e:
+                    message = str(e).encode("utf-8")
+                    writer.write(b"FAIL" + struct.pack("<I", len(message)) + message)
+                else:
+                    for offset in range(0, len(data), SYNC_DATA_MAX):
+                        chunk = data[offset:offset + SYNC_DATA_MAX]
+                        writer.write(b"DATA" + struct.pack("<I", len(chunk)) + chunk)
+                    writer.write(b"DONE" + struct.pack("<I", 0))
+            else:
+                message = b"unknown sync command"
+                writer.write(b"FAIL" + struct.pack("<I", len(message)) + message)
+            await writer.drain()
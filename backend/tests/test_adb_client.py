@@ -0,0 +1,183 @@
+import asyncio
+import socket
+
+import pytest
+
+from app.base.adb_client import SYNC_DATA_MAX, AdbClient, AdbError
+from fake_adb_server import FakeAdbServer, FakeDevice
+
+FILES = {
+    "/sdcard/DCIM/a.jpg": b"jpeg",
+    "/sdcard/DCIM/b.mp4": bytes(range(256)) * (SYNC_DATA_MAX // 64),
+    "/sdcard/DCIM/nested/c.txt": b"text",
+}
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+async def with_server(devices, test):
+    async with FakeAdbServer(devices) as server:
+        return await test(AdbClient(port=server.port), server)
+
+
+def unused_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def test_devices():
+    devices = [FakeDevice("emulator-5554"), FakeDevice("R58M", state="unauthorized")]
+
+    async def test(client, server):
+        return await client.devices()
+
+    assert run(with_server(devices, test)) == [("emulator-5554", "device"), ("R58M", "unauthorized")]
+
+
+def test_track_devices_reports_changes():
+    async def test(client, server):
+        stream = client.track_devices()
+        first = await stream.__anext__()
+        server.add_device(FakeDevice("emu2"))
+        second = await stream.__anext__()
+        await stream.aclose()
+        return first, second
+
+    first, second = run(with_server([FakeDevice("emu1")], test))
+    assert first == [("emu1", "device")]
+    assert second == [("emu1", "device"), ("emu2", "device")]
+
+
+def test_shell_result_returns_exit_code():
+    async def test(client, server):
+        return await client.shell_result("emu1", "echo hello; echo oops >&2; exit 3")
+
+    result = run(with_server([FakeDevice("emu1")], test))
+    assert result.stdout == "hello\n"
+    assert result.returncode == 3
+
+
+def test_shell_result_success():
+    async def test(client, server):
+        return await client.shell_result(None, "printf 'a\\nb\\n'")
+
+    result = run(with_server([FakeDevice("emu1")], test))
+    assert result.stdout == "a\nb\n"
+    assert result.returncode == 0
+
+
+def test_exec_out_is_binary():
+    payload = bytes(range(256))
+    device = FakeDevice("emu1", shell=lambda command: payload)
+
+    async def test(client, server):
+        return await client.exec_out("emu1", "cat /sdcard/file.bin")
+
+    assert run(with_server([device], test)) == payload
+
+
+def test_unknown_serial_fails():
+    async def test(client, server):
+        with pytest.raises(AdbError, match="device not found"):
+            await client.shell("missing", "true")
+
+    run(with_server([FakeDevice("emu1")], test))
+
+
+def test_transport_any_requires_single_device():
+    async def test(client, server):
+        with pytest.raises(AdbError):
+            await client.shell(None, "true")
+
+    run(with_server([FakeDevice("emu1"), FakeDevice("emu2")], test))
+
+
+def test_stat():
+    device = FakeDevice("emu1", files=FILES, mtime=1700000000)
+
+    async def test(client, server):
+        return (
+            await client.stat("emu1", "/sdcard/DCIM/b.mp4"),
+            await client.stat("emu1", "/sdcard/DCIM/nested"),
+            await client.stat("emu1", "/sdcard/DCIM/missing.jpg"),
+        )
+
+    found, directory, missing = run(with_server([device], test))
+    assert found.exists and found.size == len(FILES["/sdcard/DCIM/b.mp4"]) and found.mtime == 1700000000
+    assert directory.exists
+    assert not missing.exists
+
+
+def test_list_dir():
+    device = FakeDevice("emu1", files=FILES)
+
+    async def test(client, server):
+        return await client.list_dir("emu1", "/sdcard/DCIM")
+
+    entries = {entry.name: entry for entry in run(with_server([device], test))}
+    assert sorted(entries) == ["a.jpg", "b.mp4", "nested"]
+    assert entries["a.jpg"].size == 4
+
+
+def test_recv_stream_splits_into_sync_packets():
+    device = FakeDevice("emu1", files=FILES)
+
+    async def test(client, server):
+        return [chunk async for chunk in client.recv_stream("emu1", "/sdcard/DCIM/b.mp4")]
+
+    chunks = run(with_server([device], test))
+    assert len(chunks) == 4
+    assert b"".join(chunks) == FILES["/sdcard/DCIM/b.mp4"]
+
+
+def test_pull(tmp_path):
+    device = FakeDevice("emu1", files=FILES)
+    target = tmp_path / "b.mp4"
+
+    async def test(client, server):
+        return await client.pull("emu1", "/sdcard/DCIM/b.mp4", str(target))
+
+    assert run(with_server([device], test)) == str(target)
+    assert target.read_bytes() == FILES["/sdcard/DCIM/b.mp4"]
+
+
+def test_pull_missing_file_leaves_nothing(tmp_path):
+    device = FakeDevice("emu1", files=FILES)
+    target = tmp_path / "missing.jpg"
+
+    async def test(client, server):
+        with pytest.raises(AdbError):
+            await client.pull("emu1", "/sdcard/DCIM/missing.jpg", str(target))
+
+    run(with_server([device], test))
+    assert not target.exists()
+
+
+def test_connection_refused():
+    client = AdbClient(port=unused_port())
+    with pytest.raises(ConnectionRefusedError):
+        run(client.devices())
+
+
+def test_stat_reports_sizes_over_4_gib(tmp_path):
+    video = tmp_path / "video.mp4"
+    with open(video, "wb") as f:
+        f.truncate(5 * 2 ** 30)
+
+    async def test(client, server):
+        return await client.stat("emu1", str(video))
+
+    assert run(with_server([FakeDevice("emu1")], test)).size == 5 * 2 ** 30
+
+
+def test_stat_without_v2_support_fails():
+    device = FakeDevice("emu1", files=FILES, stat_v2=False)
+
+    async def test(client, server):
+        with pytest.raises(AdbError):
+            await client.stat("emu1", "/sdcard/DCIM/a.jpg")
+
+    run(with_server([device], test))
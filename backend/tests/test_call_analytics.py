@@ -0,0 +1,33 @@
+from datetime import datetime
+from zoneinfo import ZoneInfo
+
+from app.base.call_analytics import compute_call_analytics
+from app.base.records import CallRecord, CallType
+
+
+def call(moment: datetime) -> CallRecord:
+    return CallRecord(id=None, number="+100", name=None, duration=60, location=None, type=CallType.INCOMING,
+                      date_ms=int(moment.timestamp() * 1000), new=False, subscription_id=None, block_reason=0,
+                      account=None)
+
+
+def test_heatmap_uses_offset_of_each_call():
+    zone = ZoneInfo("Europe/Berlin")
+    records = [
+        call(datetime(2024, 1, 15, 10, 30, tzinfo=zone)),   # понедельник, зимнее время (+1)
+        call(datetime(2024, 7, 15, 10, 30, tzinfo=zone)),   # понедельник, летнее время (+2)
+        call(datetime(2024, 3, 31, 3, 15, tzinfo=zone)),    # воскресенье, сразу после перехода
+        call(datetime(2024, 3, 31, 1, 45, tzinfo=zone)),    # воскресенье, до перехода
+    ]
+    heatmap = compute_call_analytics(records, timezone="Europe/Berlin")["heatmap"]
+
+    assert heatmap[0][10] == 2
+    assert heatmap[6][3] == 1
+    assert heatmap[6][1] == 1
+    assert sum(map(sum, heatmap)) == 4
+
+
+def test_unknown_timezone_falls_back_to_server_zone():
+    moment = datetime(2024, 7, 15, 10, 30).astimezone()
+    heatmap = compute_call_analytics([call(moment)], timezone="Not/AZone")["heatmap"]
+    assert heatmap[moment.weekday()][moment.hour] == 1
@@ -0,0 +1,32 @@
+import pytest
+
+from app.base.content_query import ContentRowParser, parse_content_output
+
+SMS_COLUMNS = ["_id", "address", "body", "date", "type"]
+
+
+@pytest.mark.parametrize("body", [
+    "Встреча перенесена, date=пятница",
+    "see you, address=Main st. 5",
+    "a, type=2, date=1, b",
+    "fwd, _id=3, address=+200",
+])
+def test_body_with_separators(body):
+    row = f"Row: 0 _id=7, address=+100, body={body}, date=1700000000000, type=1"
+    assert ContentRowParser(SMS_COLUMNS)(row) == {
+        "_id": "7", "address": "+100", "body": body, "date": "1700000000000", "type": "1",
+    }
+
+
+def test_multiline_body_with_separator():
+    output = "Row: 0 _id=1, address=+100, body=line one, date=\nline two, date=1700000000000, type=NULL\n"
+    assert parse_content_output(output, SMS_COLUMNS) == [{
+        "_id": "1", "address": "+100", "body": "line one, date=\nline two", "date": "1700000000000", "type": None,
+    }]
+
+
+def test_missing_column_still_parses():
+    row = "Row: 0 _id=7, address=+100, date=1700000000000, type=1"
+    assert ContentRowParser(SMS_COLUMNS)(row) == {
+        "_id": "7", "address": "+100", "body": None, "date": "1700000000000", "type": "1",
+    }
@@ -0,0 +1,28 @@
+import asyncio
+import threading
+import time
+
+from app.base.async_service import MAX_CONCURRENT_PER_DEVICE, AsyncADBService
+
+
+def test_blocking_endpoints_share_device_slot(monkeypatch):
+    running, peak = [0], [0]
+    lock = threading.Lock()
+
+    def list_files(directory, serial):
+        with lock:
+            running[0] += 1
+            peak[0] = max(peak[0], running[0])
+        time.sleep(0.05)
+        with lock:
+            running[0] -= 1
+        return {"files": []}
+
+    monkeypatch.setattr(AsyncADBService, "_semaphores", {})
+    monkeypatch.setattr("app.base.async_service.ADBService.list_files", list_files)
+
+    async def test():
+        await asyncio.gather(*(AsyncADBService.list_files("", "emu1") for _ in range(MAX_CONCURRENT_PER_DEVICE * 2)))
+
+    asyncio.run(test())
+    assert peak[0] == MAX_CONCURRENT_PER_DEVICE
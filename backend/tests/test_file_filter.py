@@ -0,0 +1,45 @@
+import os
+import subprocess
+from datetime import datetime
+
+import pytest
+from fastapi import HTTPException
+
+from app.base.service import ADBService, FileFilter
+
+AFTER = datetime(2024, 3, 1)
+BEFORE = datetime(2024, 3, 10)
+
+
+def touch(directory, name: str, moment: datetime, fraction: float = 0.0):
+    path = os.path.join(directory, name)
+    open(path, "wb").close()
+    timestamp = moment.timestamp() + fraction
+    os.utime(path, (timestamp, timestamp))
+
+
+def test_find_and_python_filter_agree_on_boundaries(tmp_path):
+    touch(tmp_path, "before_after.jpg", AFTER, -0.5)
+    touch(tmp_path, "at_after.jpg", AFTER)
+    touch(tmp_path, "inside_after.jpg", AFTER, 0.5)
+    touch(tmp_path, "at_before.jpg", BEFORE)
+    touch(tmp_path, "inside_before.jpg", BEFORE, 0.5)
+    touch(tmp_path, "past_before.jpg", BEFORE, 1.0)
+
+    file_filter = FileFilter.for_category("images", "2024-03-01", "2024-03-10")
+    command = ADBService.metadata_command(str(tmp_path), predicates=file_filter.find_predicates())
+    lines = subprocess.run(command, shell=True, capture_output=True, text=True).stdout.splitlines()
+    pushed_down = {entry["name"] for entry in ADBService.top_files(lines, file_filter, 100)}
+
+    every_line = subprocess.run(ADBService.metadata_command(str(tmp_path)), shell=True,
+                                capture_output=True, text=True).stdout.splitlines()
+    in_python = {entry["name"] for entry in ADBService.top_files(every_line, file_filter, 100)}
+
+    assert pushed_down == in_python == {"at_after.jpg", "inside_after.jpg", "at_before.jpg", "inside_before.jpg"}
+
+
+@pytest.mark.parametrize("date_after, date_before", [("2024-13-01", None), ("2024-03-01", "10.03.2024")])
+def test_malformed_date_is_bad_request(date_after, date_before):
+    with pytest.raises(HTTPException) as error:
+        FileFilter.for_category("images", date_after, date_before)
+    assert error.value.status_code == 400
@@ -0,0 +1,44 @@
+import pytest
+
+from app.base.file_index import FileIndex
+from app.base.shell_pool import ADBShellError, ShellResult
+
+DIRS = "1700000000|/sdcard/\n1700000000|/sdcard/DCIM\n"
+FILES = "4|1700000000|2023-11-14 22:13:20.000000000 +0000|644|regular file|/sdcard/DCIM/a.jpg\n"
+
+
+def device(dirs=ShellResult(DIRS, 0), files=ShellResult(FILES, 0)):
+    def shell(command: str) -> ShellResult:
+        return dirs if "-type d" in command else files
+    return shell
+
+
+def indexed(index: FileIndex):
+    return [entry["path"] for entry in index.list_directory("emu1", "/sdcard", recursive=True)["files"]]
+
+
+@pytest.mark.parametrize("failure", [ShellResult("", 0), ShellResult("", 1), ShellResult("find: Permission denied", 1)])
+def test_failed_refresh_keeps_index(tmp_path, failure):
+    index = FileIndex(str(tmp_path / "files.sqlite3"), max_age=0)
+    index.refresh("emu1", "/sdcard/", device())
+    assert indexed(index) == ["/sdcard/DCIM/a.jpg"]
+
+    with pytest.raises(ADBShellError):
+        index.refresh("emu1", "/sdcard/", device(dirs=failure))
+    assert indexed(index) == ["/sdcard/DCIM/a.jpg"]
+
+
+def refreshed_at(index: FileIndex) -> float:
+    return index._connection().execute("SELECT refreshed_at FROM refreshes WHERE serial = 'emu1'").fetchone()[0]
+
+
+def test_failed_listing_keeps_index(tmp_path):
+    index = FileIndex(str(tmp_path / "files.sqlite3"))
+    index.refresh("emu1", "/sdcard/", device())
+    before = refreshed_at(index)
+    changed = ShellResult(DIRS.replace("1700000000|/sdcard/DCIM", "1700000100|/sdcard/DCIM"), 0)
+
+    with pytest.raises(ADBShellError):
+        index.refresh("emu1", "/sdcard/", device(dirs=changed, files=ShellResult("", 1)))
+    assert indexed(index) == ["/sdcard/DCIM/a.jpg"]
+    assert refreshed_at(index) == before
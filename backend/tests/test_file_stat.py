@@ -0,0 +1,45 @@
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+
+from app.base import async_service
+from app.base.adb_client import AdbClient
+from app.base.async_service import AsyncADBService
+from app.base.service import ADBService
+from fake_adb_server import FakeAdbServer, FakeDevice
+
+
+async def file_stat(monkeypatch, device, path):
+    async with FakeAdbServer([device]) as server:
+        monkeypatch.setattr(async_service, "adb_client", AdbClient(port=server.port))
+        return await AsyncADBService.file_stat(path, device.serial)
+
+
+def test_file_stat_over_4_gib(monkeypatch, tmp_path):
+    video = tmp_path / "video.mp4"
+    with open(video, "wb") as f:
+        f.truncate(5 * 2 ** 30 + 7)
+
+    size, _ = asyncio.run(file_stat(monkeypatch, FakeDevice("emu1"), str(video)))
+    assert size == 5 * 2 ** 30 + 7
+
+
+def test_file_stat_missing_file(monkeypatch):
+    device = FakeDevice("emu1", files={"/sdcard/a.jpg": b"a"})
+    with pytest.raises(HTTPException) as error:
+        asyncio.run(file_stat(monkeypatch, device, "/sdcard/missing.jpg"))
+    assert error.value.status_code == 404
+
+
+def test_file_stat_falls_back_to_shell_stat(monkeypatch):
+    device = FakeDevice("emu1", files={"/sdcard/a.jpg": b"a"}, stat_v2=False)
+    calls = []
+
+    def remote_stat(path, serial=None):
+        calls.append((path, serial))
+        return 6 * 2 ** 30, 1700000000
+
+    monkeypatch.setattr(ADBService, "remote_stat", staticmethod(remote_stat))
+    assert asyncio.run(file_stat(monkeypatch, device, "/sdcard/a.jpg")) == (6 * 2 ** 30, 1700000000)
+    assert calls == [("/sdcard/a.jpg", "emu1")]
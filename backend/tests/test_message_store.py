@@ -0,0 +1,49 @@
+from app.base.message_store import MessageSource, MessageStore
+
+SOURCE = MessageSource(table="sms", uri="content://sms", columns=["_id", "address", "body", "date", "type"],
+                       reconcile_columns=["_id", "date", "type"], contact_column="address")
+
+
+def device(rows):
+    """shell() устройства с SMS `rows`: (id, адрес, текст, дата, тип)"""
+    def shell(command: str) -> str:
+        return "\n".join(
+            f"Row: {index} _id={row_id}, address={address}, body={body}, date={date}, type={kind}"
+            for index, (row_id, address, body, date, kind) in enumerate(rows)
+            if "_id > " not in command or row_id > int(command.split("_id > ")[1].split("'")[0])
+        )
+    return shell
+
+
+def store(path) -> MessageStore:
+    message_store = MessageStore(str(path), max_age=0)
+    message_store.register("sms", SOURCE)
+    return message_store
+
+
+def test_data_version_survives_restart_and_tracks_changes(tmp_path):
+    rows = [(1, "+100", "привет", 1700000000000, 1), (2, "+200", "ок", 1700000100000, 2)]
+    first = store(tmp_path / "messages.sqlite3")
+    assert first.data_version("emu1", "sms") is None
+
+    first.sync("emu1", "sms", device(rows))
+    version = first.data_version("emu1", "sms")
+    first.sync("emu1", "sms", device(rows))
+    assert first.data_version("emu1", "sms") == version
+
+    restarted = store(tmp_path / "messages.sqlite3")
+    assert restarted.data_version("emu1", "sms") == version
+
+    rows.append((3, "+100", "новое", 1700000200000, 1))
+    restarted.sync("emu1", "sms", device(rows))
+    assert restarted.data_version("emu1", "sms") != version
+
+
+def test_data_version_changes_after_reconcile_removes_rows(tmp_path):
+    rows = [(1, "+100", "a", 1700000000000, 1), (2, "+200", "b", 1700000100000, 2)]
+    message_store = store(tmp_path / "messages.sqlite3")
+    message_store.sync("emu1", "sms", device(rows))
+    version = message_store.data_version("emu1", "sms")
+
+    message_store.reconcile("emu1", "sms", device(rows[:1]))
+    assert message_store.data_version("emu1", "sms") != version
@@ -0,0 +1,159 @@
+import asyncio
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from fastapi import HTTPException
+
+from app.base import report_jobs as jobs_module
+from app.base.report_cache import ReportCache
+from app.base.report_jobs import ReportJobQueue, ReportKind
+from app.base.shell_pool import ADBShellError
+
+BACKEND = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def test_identical_jobs_render_once(monkeypatch, tmp_path):
+    rendered = []
+    lock = threading.Lock()
+
+    def calls_report(params: dict) -> str:
+        time.sleep(0.2)
+        with lock:
+            rendered.append(params)
+            path = tmp_path / f"calls_{len(rendered)}.pdf"
+        path.write_bytes(b"%PDF")
+        return str(path)
+
+    monkeypatch.setitem(jobs_module.REPORT_KINDS, "calls", ReportKind(jobs_module._collect_calls, calls_report))
+    monkeypatch.setattr(jobs_module.ReportGenerator, "device_section_data", lambda serial: ({}, {}))
+    monkeypatch.setattr(jobs_module, "report_cache", ReportCache(str(tmp_path / "reports")))
+    queue = ReportJobQueue()
+    executor = ThreadPoolExecutor(max_workers=2)
+    monkeypatch.setattr(queue, "_pool", lambda: executor)
+
+    async def run():
+        filters = {"call_logs": [{"number": "+100"}], "serial": "emu1"}
+        first, second = queue.submit("calls", filters), queue.submit("calls", filters)
+        paths = [await queue.wait(first), await queue.wait(second)]
+        third = queue.submit("calls", filters)
+        paths.append(await queue.wait(third))
+        return paths, [first.cached, second.cached, third.cached]
+
+    paths, cached = asyncio.run(run())
+    executor.shutdown()
+    assert len(rendered) == 1
+    assert len(set(paths)) == 1
+    assert cached == [False, True, True]
+
+
+def test_worker_renders_from_plain_data(monkeypatch, tmp_path):
+    # Процесс пула стартует в tmp_path: отчёт пишется туда, шрифты берутся из backend
+    os.symlink(os.path.join(BACKEND, "fonts"), tmp_path / "fonts")
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(jobs_module, "report_cache", ReportCache(str(tmp_path / "reports")))
+    device_section = ({"device-info": [{"serial_number": "emu1", "model": "Pixel"}]}, {"emu1": {}})
+    monkeypatch.setattr(jobs_module.ReportGenerator, "device_section_data", lambda serial: device_section)
+    queue = ReportJobQueue(workers=1)
+
+    async def run():
+        filters = {"call_logs": [{"ID звонка": "1", "Номер": "+100", "Длительность": "5 сек"}], "serial": "emu1"}
+        job = queue.submit("calls", filters)
+        return await asyncio.wait_for(queue.wait(job), 120)
+
+    try:
+        path = asyncio.run(run())
+    finally:
+        queue.shutdown()
+    with open(path, "rb") as f:
+        assert f.read(4) == b"%PDF"
+
+
+def test_render_does_not_query_device(monkeypatch, tmp_path):
+    def no_device(*args, **kwargs):
+        raise AssertionError("render_report обратился к устройству")
+
+    monkeypatch.chdir(tmp_path)
+    os.symlink(os.path.join(BACKEND, "fonts"), tmp_path / "fonts")
+    os.makedirs(jobs_module.ReportGenerator.REPORTS_DIR)
+    monkeypatch.setattr(jobs_module.ADBService, "get_device_info", no_device)
+    monkeypatch.setattr(jobs_module.ADBService, "get_system_info", no_device)
+    params = {
+        "call_logs": [{"ID звонка": "1", "Номер": "+100", "Длительность": "5 сек"}],
+        "serial": "emu1",
+        "device_section": ({"device-info": []}, {}),
+    }
+    path = jobs_module.render_report("calls", params)
+    with open(path, "rb") as f:
+        assert f.read(4) == b"%PDF"
+
+
+def test_category_listing_is_read_once(monkeypatch, tmp_path):
+    monkeypatch.chdir(tmp_path)
+    os.symlink(os.path.join(BACKEND, "fonts"), tmp_path / "fonts")
+    os.makedirs(jobs_module.ReportGenerator.REPORTS_DIR)
+    local = tmp_path / "notes.txt"
+    local.write_text("notes")
+    listings = []
+
+    def filter_files_by_category(category, *args, **kwargs):
+        listings.append(category)
+        return [{"path": "/sdcard/Documents/notes.txt", "name": "notes.txt", "size": 5, "mtime": 1700000000,
+                 "modified": "2023-11-14 22:13"}]
+
+    monkeypatch.setattr(jobs_module.ADBService, "filter_files_by_category", filter_files_by_category)
+    monkeypatch.setattr(jobs_module.ADBService, "download_file", lambda *args: str(local))
+    monkeypatch.setattr(jobs_module.ReportGenerator, "device_section_data", lambda serial: ({}, {}))
+    monkeypatch.setattr(jobs_module, "report_cache", ReportCache(str(tmp_path / "reports")))
+    queue = ReportJobQueue()
+    executor = ThreadPoolExecutor(max_workers=1)
+    monkeypatch.setattr(queue, "_pool", lambda: executor)
+
+    async def run():
+        job = queue.submit("category", {
+            "category": "documents", "date_after": "2023-01-01", "date_before": None, "limit": 10, "serial": "emu1",
+            "extensions": None, "min_size": None, "max_size": None, "name": None,
+        })
+        return await queue.wait(job)
+
+    path = asyncio.run(run())
+    executor.shutdown()
+    assert listings == ["documents"]
+    with open(path, "rb") as f:
+        assert f.read(4) == b"%PDF"
+
+
+def test_failed_sync_fails_messages_job(monkeypatch):
+    def sync_messages(kind, serial):
+        raise ADBShellError("device offline")
+
+    monkeypatch.setattr(jobs_module.ADBService, "sync_messages", sync_messages)
+    queue = ReportJobQueue()
+
+    async def run():
+        job = queue.submit("messages", {"contact": None, "date_from": None, "date_to": None, "limit": 10, "serial": "emu1"})
+        with pytest.raises(HTTPException) as error:
+            await queue.wait(job)
+        return error.value
+
+    error = asyncio.run(run())
+    assert error.status_code == 500 and "device offline" in error.detail
+
+
+def test_bad_filter_fails_job(monkeypatch):
+    def filter_files_by_category(*args, **kwargs):
+        raise HTTPException(status_code=400, detail="Неверная дата")
+
+    monkeypatch.setattr(jobs_module.ADBService, "filter_files_by_category", filter_files_by_category)
+    queue = ReportJobQueue()
+
+    async def run():
+        job = queue.submit("category", {"category": "images", "date_after": "2023-13-01", "date_before": None,
+                                        "limit": 10, "serial": "emu1"})
+        with pytest.raises(HTTPException) as error:
+            await queue.wait(job)
+        return error.value
+
+    assert asyncio.run(run()).status_code == 400
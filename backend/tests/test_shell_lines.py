@@ -0,0 +1,34 @@
+import asyncio
+
+from app.base import async_service
+from app.base.adb_client import AdbClient
+from app.base.async_service import MAX_CONCURRENT_PER_DEVICE, AsyncADBService
+from fake_adb_server import FakeAdbServer, FakeDevice
+
+
+def test_abandoned_stream_does_not_hold_device_slot(monkeypatch):
+    async def test():
+        async with FakeAdbServer([FakeDevice("emu1")]) as server:
+            monkeypatch.setattr(async_service, "adb_client", AdbClient(port=server.port))
+            abandoned = []
+            try:
+                for _ in range(MAX_CONCURRENT_PER_DEVICE + 2):
+                    # Как клиент NDJSON, который отключился после первой строки
+                    lines = AsyncADBService._shell_lines("printf 'a\\nb\\n'", "emu1")
+                    abandoned.append(lines)
+                    assert await asyncio.wait_for(lines.__anext__(), timeout=5) == "a"
+                return await asyncio.wait_for(AsyncADBService._shell("echo ok", "emu1"), timeout=5)
+            finally:
+                for lines in abandoned:
+                    await lines.aclose()
+
+    assert asyncio.run(test()).stdout == "ok\n"
+
+
+def test_shell_lines_reads_whole_output(monkeypatch):
+    async def test():
+        async with FakeAdbServer([FakeDevice("emu1")]) as server:
+            monkeypatch.setattr(async_service, "adb_client", AdbClient(port=server.port))
+            return [line async for line in AsyncADBService._shell_lines("seq 1 5000", "emu1")]
+
+    assert asyncio.run(test()) == [str(number) for number in range(1, 5001)]
@@ -0,0 +1,26 @@
+import queue
+
+from app.base.shell_pool import ADBShellPool
+
+
+class FakeSession:
+    def __init__(self, serial):
+        self.serial = serial
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+
+def test_retain_closes_sessions_of_disconnected_devices():
+    pool = ADBShellPool()
+    sessions = {key: FakeSession(key or None) for key in ("emu1", "emu2", "")}
+    for key, session in sessions.items():
+        pool._idle[key] = queue.LifoQueue()
+        pool._idle[key].put(session)
+        pool._created[key] = 1
+
+    pool.retain(["emu1"])
+
+    assert sessions["emu2"].closed and "emu2" not in pool._created
+    assert not sessions["emu1"].closed and not sessions[""].closed